@@ -0,0 +1,71 @@
+# This file defines the adaptive frequency sampling used by the 'Adaptive'
+# sample point mode. The scan starts from a coarse log grid. After each pass
+# the measured gain (dB) is examined interval by interval and new frequencies
+# are inserted (at the geometric centre of the interval) only where straight-
+# line interpolation between the measured points is expected to be off by more
+# than the tolerance, until the point budget is used up. The expected error of
+# an interval is estimated from the local curvature of the gain vs. log
+# frequency (h^2/8 times the second derivative for an interval of width h), and
+# intervals across which the gain changes steeply (ie. band edges) are split
+# regardless, so a feature between two coarse points isn't missed.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from adaptive import *'.
+#
+# Example Usage:
+#	freqs = np.logspace(1, 4.3, 9).tolist();
+#	(measure gainsDB at freqs)
+#	newFreqs = adaptiveInsertions(freqs, gainsDB, .25, 100-len(freqs));
+#
+
+import numpy as np
+
+#
+# Returns the expected interpolation error (same units as 'ys') of each interval
+# between consecutive points ('xs' sorted ascending, > 0). The curvature of 'ys'
+# vs. log10('xs') is estimated at every inner point from its neighbours and an
+# interval uses the larger curvature of its two ends. Intervals over which 'ys'
+# changes by more than 'maxStep' get an error of at least the change itself.
+# With fewer than 3 points every interval is given an infinite error.
+#
+def intervalErrors(xs, ys, maxStep=3):
+    lx = np.log10(np.asarray(xs, dtype=float));
+    y = np.asarray(ys, dtype=float);
+    n = len(lx);
+    if (n < 3):
+        return [np.inf]*max(0, n-1);
+
+    h = np.diff(lx);
+    slope = np.diff(y)/h;
+    curv = np.zeros(n);
+    curv[1:-1] = np.abs(2*np.diff(slope)/(lx[2:] - lx[:-2])); #Second divided differences
+    curv[0] = curv[1];
+    curv[-1] = curv[-2];
+
+    err = np.maximum(curv[:-1], curv[1:])*h*h/8;
+    steep = np.abs(np.diff(y)) > maxStep;
+    err[steep] = np.maximum(err[steep], np.abs(np.diff(y))[steep]);
+    return err.tolist();
+
+#
+# Returns up to 'budget' new frequencies to measure (ascending) given the gains
+# 'ys' (dB) measured at the frequencies 'xs'. An interval is split at its
+# geometric centre if its expected error (see intervalErrors()) exceeds 'tol'
+# and its end frequencies differ by more than the ratio 'minRatio'; the worst
+# intervals are split first. Points with a NaN gain (ie. missing) are ignored.
+#
+def adaptiveInsertions(xs, ys, tol, budget, maxStep=3, minRatio=1.01):
+    pts = sorted((a, b) for a, b in zip(xs, ys) if a > 0 and np.isfinite(b));
+    if (budget <= 0 or len(pts) < 2):
+        return [];
+    x = [p[0] for p in pts];
+    err = intervalErrors(x, [p[1] for p in pts], maxStep);
+
+    worst = sorted(range(len(err)), key=lambda i: -err[i]);
+    new = [];
+    for i in worst:
+        if (len(new) >= budget or err[i] <= tol):
+            break;
+        if (x[i+1]/x[i] > minRatio):
+            new.append(float(np.sqrt(x[i]*x[i+1])));
+    return sorted(new);
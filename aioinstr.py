@@ -0,0 +1,105 @@
+# This file defines an asyncio driver layer over the scope and generator
+# sessions. Each blocking pyvisa call is run in a thread pool executor so the
+# event loop (and any GUI driven from it) stays responsive, and all I/O with an
+# instrument is serialized - both between coroutines and with the synchronous
+# code in scpi.py, which shares the same per-instrument lock.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from aioinstr import *'.
+#
+# Example Usage:
+#	async def readPoint():
+#		ascope = AsyncInstrument(scope);
+#		fr, vpp = await ascope.batchQuery(["MEAS:STAT:ITEM? CURR,FREQ,CHAN1", "MEAS:STAT:ITEM? CURR,VPP,CHAN1"]);
+#	asyncio.run(readPoint());
+#
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import weakref
+
+from scpi import batchQuery, instLock, instName, timedConfig
+
+#Executor which runs the blocking VISA calls (one thread per instrument is plenty)
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="aioinstr");
+
+#
+# Awaitable wrapper around a pyvisa resource (or ShadowInstrument). Coroutines
+# using the same AsyncInstrument are served in the order they asked.
+#
+class AsyncInstrument:
+
+    def __init__(self, inst):
+        self.inst = inst; #Wrapped (synchronous) instrument
+        self.name = instName(inst);
+        self._locks = weakref.WeakKeyDictionary(); #Event loop -> asyncio.Lock (a lock only works in the loop it was first used in)
+
+    #
+    # Runs 'func(*args)' in the executor while holding both the asyncio lock
+    # and the instrument's thread lock. Returns the function's result.
+    #
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop();
+        if (loop not in self._locks): #ie. first use, or a later asyncio.run()
+            self._locks[loop] = asyncio.Lock();
+
+        def locked():
+            with instLock(self.inst):
+                return func(*args);
+
+        async with self._locks[loop]:
+            return await loop.run_in_executor(_executor, locked);
+
+    async def query(self, cmd):
+        return await self._call(self.inst.query, cmd);
+
+    async def write(self, cmd):
+        return await self._call(self.inst.write, cmd);
+
+    async def read_raw(self):
+        return await self._call(self.inst.read_raw);
+
+    #
+    # Sends 'cmd' and reads the raw (binary) reply in one locked operation, so no
+    # other coroutine's traffic can land between the two.
+    #
+    async def queryRaw(self, cmd):
+        def writeRead():
+            self.inst.write(cmd);
+            return self.inst.read_raw();
+        return await self._call(writeRead);
+
+    #
+    # Awaitable version of scpi.batchQuery()
+    #
+    async def batchQuery(self, queries):
+        return await self._call(batchQuery, self.inst, queries);
+
+    #
+    # Awaitable version of ShadowInstrument.setting(). For plain pyvisa
+    # resources the command is always written.
+    #
+    async def setting(self, header, value):
+        if (hasattr(self.inst, "setting")):
+            return await self._call(self.inst.setting, header, value);
+        await self.write(header + str(value));
+        return True;
+
+#
+# Awaitable version of CommandQueue.flush(): configures every instrument with
+# queued commands concurrently and returns once all '*OPC?' replies are in.
+# Returns the number of transactions issued. The time each instrument took is
+# left in the queue's 'durations'.
+#
+async def flushAsync(queue, timeout=5000):
+    items = list(queue.pending.items());
+    queue.pending = {};
+
+    loop = asyncio.get_running_loop();
+    replies = await asyncio.gather(*[loop.run_in_executor(_executor, timedConfig, inst, cmds, timeout) for inst, cmds in items]);
+
+    for i in range(len(items)):
+        print("SCPI<" + instName(items[i][0]) + "> " + replies[i][0]);
+        queue.durations[instName(items[i][0])] = replies[i][1];
+
+    return len(items);
@@ -0,0 +1,114 @@
+# This file defines the single-pass predictive autoscaler. Instead of measuring
+# the whole transfer function twice (a crude sweep to find each point's
+# amplitude, then a fine sweep at scales fitted to it), each point's output
+# amplitude is predicted from the points already measured by extrapolating the
+# gain along the TF in log-log space. After the point is read, the reading is
+# checked against the scale it was taken at and only points which clipped
+# (overrange) or used too little of the screen (underrange) are measured again.
+#
+# When the dual sweep is used, decimatedIndices() and interpolateAmplitudes()
+# let the crude sweep measure only a few points of the grid and interpolate the
+# amplitude of the others.
+#
+# checkScreen() judges a channel from its screen trace (see waveform.py), so a
+# clipped or tiny signal is rescaled before it costs the point any retries.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from autoscale import *'.
+#
+# Example Usage:
+#	vpp = predictAmplitude([100, 200], [1.1, 1.3], 400);
+#	state = checkRange(measuredVpp, scale, 8, 1.2, courseCeil);
+#
+
+import numpy as np
+
+#
+# Predicts the value at 'x' of the curve through the points ('xs', 'ys') by
+# extrapolating the last two points linearly in log-log space (ie. along the
+# slope of a Bode plot). The slope is limited to +/- 'maxSlope' (3 = 60 dB per
+# decade for a gain). With one point the value is held. Returns None if there
+# are no usable (positive) points.
+#
+def predictAmplitude(xs, ys, x, maxSlope=3):
+    pts = [(a, b) for a, b in zip(xs, ys) if a > 0 and b > 0 and np.isfinite(b)];
+    if (len(pts) == 0 or x <= 0):
+        return None;
+    if (len(pts) == 1 or pts[-1][0] == pts[-2][0]):
+        return pts[-1][1];
+    (x0, y0), (x1, y1) = pts[-2], pts[-1];
+    slope = np.log10(y1/y0)/np.log10(x1/x0);
+    slope = max(-maxSlope, min(maxSlope, slope));
+    return float(y1*(x/x1)**slope);
+
+#
+# Returns the scale (V/div) which fits 'vpp' on 'numDiv' divisions with the
+# margin 'factor', rounded up with 'ceil' (ie. courseCeil()). Amplitudes too
+# large for any scale get 'maxScale'.
+#
+def fitScale(vpp, numDiv, factor, ceil, maxScale=10):
+    s = ceil(vpp/numDiv*factor);
+    return maxScale if (s is None) else s;
+
+#
+# Checks the reading 'vpp' taken at 'scale' (V/div) on a screen of 'numDiv'
+# divisions. Returns (state, newScale) where 'state' is 'over' if the signal
+# filled more than 'fullScale' of the screen (it may have clipped), 'under' if
+# a smaller scale would still fit it with the margin 'factor', and 'ok'
+# otherwise. 'newScale' is the scale to measure it at again ('scale' if ok).
+# An overrange signal's true size is unknown, so its scale is stepped up by at
+# least 'overStep'.
+#
+def checkRange(vpp, scale, numDiv, factor, ceil, fullScale=.95, overStep=2, maxScale=10):
+    if (vpp > fullScale*numDiv*scale):
+        if (scale >= maxScale):
+            return "ok", scale; #Nothing larger to try
+        return "over", max(fitScale(overStep*vpp, numDiv, factor, ceil, maxScale), fitScale(overStep*scale*numDiv, numDiv, 1, ceil, maxScale));
+    ideal = fitScale(vpp, numDiv, factor, ceil, maxScale);
+    if (ideal < scale):
+        return "under", ideal;
+    return "ok", scale;
+
+#
+# Returns the indices of every 'k'-th point of a grid of 'n' points, plus the
+# last point (the endpoints are always included)
+#
+def decimatedIndices(n, k):
+    idxs = list(range(0, n, max(1, k)));
+    if (n > 0 and idxs[-1] != n-1):
+        idxs.append(n-1);
+    return idxs;
+
+#
+# Interpolates the curve through the points ('xs', 'ys') at each of 'x'
+# linearly in log-log space. Points outside the range of 'xs' get the value of
+# the nearest end. Points which aren't positive and finite are ignored. Returns
+# a list, or None if there are no usable points.
+#
+def interpolateAmplitudes(xs, ys, x):
+    pts = sorted((a, b) for a, b in zip(xs, ys) if a > 0 and b > 0 and np.isfinite(b));
+    if (len(pts) == 0):
+        return None;
+    lx = np.log10([p[0] for p in pts]);
+    ly = np.log10([p[1] for p in pts]);
+    return (10**np.interp(np.log10(x), lx, ly)).tolist();
+
+#
+# Checks a channel's screen trace taken at 'scale' (V/div). 'clipped' is True if
+# it reached the top or bottom of the screen and 'vpp' is its span. Returns
+# (state, newScale): 'over' and the next scale up the ladder ('step(scale, n)'
+# moves 'n' steps along it) if it clipped or spans more than the 'numDiv'
+# divisions of the screen, 'under' and the scale fitting it on
+# 'numDiv' divisions with the margin 'factor' if it spans less than 'minDivs'
+# divisions, and 'ok' and 'scale' otherwise.
+#
+def checkScreen(clipped, vpp, scale, numDiv, factor, ceil, step, minDivs=2, maxScale=10):
+    if (clipped or vpp > numDiv*scale):
+        if (scale >= maxScale):
+            return "ok", scale; #Nothing larger to try
+        return "over", step(scale, 1);
+    if (vpp < minDivs*scale):
+        ideal = fitScale(vpp, numDiv, factor, ceil, maxScale);
+        if (ideal < scale):
+            return "under", ideal;
+    return "ok", scale;
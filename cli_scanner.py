@@ -12,32 +12,43 @@ import matplotlib.pyplot as plot
 import sys
 import visa
 from kvar import write_kvar
+from scpi import CommandQueue
+from discovery import connectInstruments
+from transcript import TranscriptLog, RecordingInstrument, ReplayResourceManager
 
 ##********************************************************
 ##********************** INITIALIZE **********************
 
-rm = visa.ResourceManager()
-# Get the USB device, e.g. 'USB0::0x1AB1::0x0588::DS1ED141904883'
-instruments = rm.list_resources()
-scope_addr = list(filter(lambda x: 'DS1Z' in x, instruments))
-awg_addr = list(filter(lambda x: 'SDG2X' in x, instruments))
-if len(scope_addr) != 1 or len(awg_addr) != 1:
-	print('Bad instrument list', instruments)
+# Optional: 'record <file>' saves every command and reply, 'replay <file>' runs a recorded session without the instruments (see transcript.py)
+mode = sys.argv[1] if len(sys.argv) > 2 else ""
+try:
+	if mode == "replay":
+		rm = ReplayResourceManager(sys.argv[2])
+		scope, awg = rm.open_resource(rm.find("DS1Z"), timeout=30), rm.open_resource(rm.find("SDG2X"), timeout=30)
+	else:
+		rm = visa.ResourceManager()
+		# Get the USB device, e.g. 'USB0::0x1AB1::0x0588::DS1ED141904883' (resource strings are cached between runs)
+		scope, awg = connectInstruments(rm, ["DS1Z", "SDG2X"], timeout=30, chunk_size=1024) # bigger timeout for long mem
+except IOError as e:
+	print(e)
 	sys.exit(-1)
-scope = rm.open_resource(scope_addr[0], timeout=30, chunk_size=1024) # bigger timeout for long mem
+if mode == "record":
+	log = TranscriptLog(sys.argv[2])
+	scope, awg = RecordingInstrument(scope, log), RecordingInstrument(awg, log)
 print("Connected to scope");
-awg = rm.open_resource(awg_addr[0], timeout=30, chunk_size=1024) # bigger timeout for long mem
 print("Connected to generator");
 
 #Initialize oscilloscope to collect data
-#scope.write("MEAS:COUN:SOUR CHAN1");
-scope.write("MEAS:STAT:ITEM FREQ,CHAN1");
-#scope.write("MEAS:STAT:ITEM VRMS,CHAN1");
-#scope.write("MEAS:STAT:ITEM VRMS,CHAN2");
-scope.write("MEAS:STAT:ITEM VPP,CHAN1");
-scope.write("MEAS:STAT:ITEM VPP,CHAN2");
-scope.write("MEAS:STAT:ITEM VAVG,CHAN3");
-scope.write("MEAS:STAT:ITEM VAVG,CHAN4");
+init = CommandQueue();
+#init.write(scope, "MEAS:COUN:SOUR CHAN1");
+init.write(scope, "MEAS:STAT:ITEM FREQ,CHAN1");
+#init.write(scope, "MEAS:STAT:ITEM VRMS,CHAN1");
+#init.write(scope, "MEAS:STAT:ITEM VRMS,CHAN2");
+init.write(scope, "MEAS:STAT:ITEM VPP,CHAN1");
+init.write(scope, "MEAS:STAT:ITEM VPP,CHAN2");
+init.write(scope, "MEAS:STAT:ITEM VAVG,CHAN3");
+init.write(scope, "MEAS:STAT:ITEM VAVG,CHAN4");
+init.flush();
 
 freqs = [];
 in_vpp = [];
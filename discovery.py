@@ -0,0 +1,114 @@
+# This file defines cached discovery of the test instruments. Enumerating every
+# VISA resource can take seconds on USB-TMC hosts, so the resource strings
+# found last time are remembered in a small file and checked with a quick
+# '*IDN?' instead. The full enumeration only runs when the cached instruments
+# don't answer (ie. they were unplugged or swapped for other units).
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from discovery import *'.
+#
+# Example Usage:
+#	rm = visa.ResourceManager();
+#	scope, awg = connectInstruments(rm, ["DS1Z", "SDG2X"], timeout=30, chunk_size=1024);
+#
+
+import os
+
+from jsonstore import loadDict, saveDict
+
+#Default file in which the resource strings are cached
+defaultCacheFile = os.path.join(os.path.expanduser("~"), ".ripscanner_instruments.json");
+
+#
+# Reads the cache file 'fn'. Returns a dict of resource strings keyed by the
+# model string used to find them (ie. 'DS1Z'), or an empty dict if the file
+# doesn't exist or can't be read (see jsonstore.py).
+#
+def loadDiscoveryCache(fn=defaultCacheFile):
+    return loadDict(fn);
+
+#
+# Writes the dict 'cache' (see loadDiscoveryCache()) to the file 'fn'
+#
+def saveDiscoveryCache(cache, fn=defaultCacheFile):
+    saveDict(cache, fn, "instrument cache");
+
+#
+# Opens the resource 'addr' and checks that it answers '*IDN?' within
+# 'idnTimeout' ms and, if 'key' is given, that the reply names that model (ie.
+# 'DS1Z' - the model string is part of the instrument's serial no.). Returns
+# the open resource, or None if it doesn't respond or is another instrument.
+# 'openArgs' are passed to rm.open_resource().
+#
+def openValidated(rm, addr, key=None, idnTimeout=2000, **openArgs):
+    try:
+        inst = rm.open_resource(addr, **openArgs);
+    except Exception:
+        return None;
+
+    try:
+        old_timeout = inst.timeout;
+        inst.timeout = max(old_timeout, idnTimeout);
+        idn = inst.query("*IDN?").strip();
+        inst.timeout = old_timeout;
+    except Exception:
+        inst.close();
+        return None;
+
+    if (idn == ""):
+        inst.close();
+        return None;
+    if (key is not None and key.upper() not in idn.upper()):
+        print(addr + " is now '" + idn + "', not a " + key);
+        inst.close();
+        return None;
+
+    print("Found " + idn);
+    return inst;
+
+#
+# Opens one instrument for each model string in 'keys' (ie. ["DS1Z", "SDG2X"])
+# and returns them as a list (in the same order). The cached resource strings
+# are tried first. If any of them doesn't respond, or its '*IDN?' reply doesn't
+# name its model, the VISA resources are enumerated and exactly one resource
+# must match each key. Raises IOError if the instruments can't be found.
+# 'openArgs' are passed to rm.open_resource().
+#
+def connectInstruments(rm, keys, cacheFile=defaultCacheFile, **openArgs):
+    cache = loadDiscoveryCache(cacheFile);
+
+    #Fast path: validate the cached instruments
+    if (all(k in cache for k in keys)):
+        insts = [];
+        for k in keys:
+            inst = openValidated(rm, cache[k], k, **openArgs);
+            if (inst is None):
+                print("Cached " + k + " (" + cache[k] + ") did not respond as a " + k + ". Searching for instruments...");
+                break;
+            insts.append(inst);
+        if (len(insts) == len(keys)):
+            return insts;
+        for inst in insts:
+            inst.close();
+
+    #Slow path: enumerate everything
+    instruments = rm.list_resources();
+    insts = [];
+    for k in keys:
+        addr = list(filter(lambda x: k in x, instruments));
+        if (len(addr) != 1):
+            for inst in insts:
+                inst.close();
+            raise IOError("Failed to identify test instruments " + str(instruments));
+        insts.append(rm.open_resource(addr[0], **openArgs));
+        cache[k] = addr[0];
+
+    saveDiscoveryCache(cache, cacheFile);
+    return insts;
+
+#
+# Deletes the cache file 'fn' so the next connection enumerates the instruments.
+#
+def clearDiscoveryCache(fn=defaultCacheFile):
+    if (os.path.exists(fn)):
+        os.remove(fn);
@@ -0,0 +1,54 @@
+# This file defines the two-dimensional frequency x amplitude sweep (ie. for
+# characterising compression vs. frequency in one scan). The grid is measured
+# along a serpentine path: every amplitude of one frequency is measured before
+# moving to the next frequency (so the timebase stays put while the amplitude
+# steps), and the amplitude order alternates between frequencies so each point's
+# neighbour on the path is also its neighbour on the grid. The vertical scales
+# chosen for one point are then a good start for the next.
+#
+# The points are measured as one flat list (see flattenGrid()); denseGrid()
+# puts the readings back on the grid as a 2-D array with one row per amplitude
+# and one column per frequency.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from grid2d import *'.
+#
+# Example Usage:
+#	order = serpentineOrder(len(gridFreqs), len(gridAmpls));
+#	freqs, ampls = flattenGrid(gridFreqs, gridAmpls, order);
+#	(measure omeas at freqs, ampls)
+#	out = denseGrid(omeas, order, len(gridFreqs), len(gridAmpls)); #out[ampl. idx][freq. idx]
+#
+
+import numpy as np
+
+#
+# Returns the (frequency index, amplitude index) of each point of an 'nf' x
+# 'na' grid in the order to measure them. Frequencies are stepped in the outer
+# loop and the amplitudes run up at even frequencies and down at odd ones.
+#
+def serpentineOrder(nf, na):
+    order = [];
+    for fi in range(nf):
+        ais = range(na) if (fi % 2 == 0) else range(na-1, -1, -1);
+        order.extend([(fi, ai) for ai in ais]);
+    return order;
+
+#
+# Returns the frequency and amplitude of each point of 'order' (see
+# serpentineOrder()) on the grid 'gridFreqs' x 'gridAmpls' as two lists
+#
+def flattenGrid(gridFreqs, gridAmpls, order):
+    return [float(gridFreqs[p[0]]) for p in order], [float(gridAmpls[p[1]]) for p in order];
+
+#
+# Puts the values 'values' of the points of 'order' on an 'nf' x 'na' grid.
+# Returns an array of 'na' rows (amplitudes) by 'nf' columns (frequencies).
+# Points with no value (ie. 'values' is short) are 'fill'.
+#
+def denseGrid(values, order, nf, na, fill=np.nan):
+    grid = np.full((na, nf), fill, dtype=(object if type(fill) == str else float));
+    for k in range(min(len(values), len(order))):
+        fi, ai = order[k];
+        grid[ai][fi] = values[k];
+    return grid;
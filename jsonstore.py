@@ -0,0 +1,41 @@
+# This file defines the small JSON files the scanner keeps between runs (ie.
+# the instrument discovery cache, the learned settling profiles and the vertical
+# scale cache), each holding one dict. They only save time, so a missing or
+# unreadable file reads as empty, and failing to write one is reported but is
+# not an error: whatever it held is found again next time.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from jsonstore import *'.
+#
+# Example Usage:
+#	cache = loadDict("cache.json");
+#	cache["key"] = [1, 2, 3];
+#	saveDict(cache, "cache.json", "example cache");
+#
+
+import json
+
+#
+# Reads the dict in the JSON file 'fn'. Returns an empty dict if the file
+# doesn't exist, can't be read or doesn't hold a dict.
+#
+def loadDict(fn):
+    try:
+        with open(fn, 'r') as fin:
+            d = json.load(fin);
+    except (OSError, ValueError):
+        return {};
+    if (type(d) != dict):
+        return {};
+    return d;
+
+#
+# Writes the dict 'd' to the JSON file 'fn'. If it can't be written, prints a
+# message naming the file's contents 'what' (ie. 'scale cache').
+#
+def saveDict(d, fn, what):
+    try:
+        with open(fn, 'w') as fout:
+            json.dump(d, fout, indent=1);
+    except OSError as e:
+        print("Failed to save " + what + " (" + str(e) + ")");
@@ -0,0 +1,293 @@
+# This file defines the file-driven sample points of the 'From file' sample
+# point mode and the generator's 'File' amplitude mode. A point file holds one
+# point per row: the independent variable, or frequency/amplitude pairs. It may
+# be a KV1 file (the variables 'freqs' and/or 'ampls'), a CSV file or a plain
+# text file (values separated by commas, semicolons or whitespace; '#' starts a
+# comment and non-numeric lines before the first point are skipped as headers).
+#
+# The file is indexed once when it's opened (the byte offset of every point is
+# kept in a compact array and every value is parsed to check it), but the
+# points themselves are only read from the file when they're asked for, so very
+# long test plans aren't held in memory as Python lists. The file stays mapped
+# until close() and the last point read is kept, so reading the same point
+# again (as meas() does many times per point) doesn't touch the file. A
+# PointColumn behaves like a read-only list of one column's values (len(),
+# indexing, iteration).
+# checkLimits() validates a whole plan against the generator's limits before the
+# sweep starts, so a scan never stops halfway through at a bad point.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from pointfile import *'.
+#
+# Example Usage:
+#	pf = PointFile("plan.csv");
+#	freqs, ampls = pf.plan(True);
+#	if (ampls is None):
+#		ampls = RepeatedValue(1, len(freqs));
+#	errors = checkLimits(freqs, ampls, (1e-6, 40e6), (.002, 20));
+#
+
+from array import array
+import mmap
+import os
+import re
+
+#KV1 variable of each column of a point file
+kv1Columns = ("freqs", "ampls");
+
+_separators = re.compile(r"[,;\s]+");
+_kv1Array = re.compile(rb"^m<d>\s+(\w+)\s*\[", re.M);
+_kv1Value = re.compile(rb"[^,\]\s;]+");
+
+#
+# Splits a line of a CSV or text file into its fields (ignoring any comment)
+#
+def _fields(line):
+    line = line.split("#")[0].strip();
+    if (line == ""):
+        return [];
+    return _separators.split(line);
+
+#
+# Sample points read lazily from a KV1, CSV or text file. Raises OSError if the
+# file can't be read and ValueError if it doesn't hold any points or a value
+# can't be read (the message gives the line).
+#
+class PointFile:
+
+    def __init__(self, fn):
+        self.fn = fn;
+        self.format = "kv1" if fn.lower().endswith(".kv1") else ("csv" if fn.lower().endswith(".csv") else "text");
+        self.offsets = []; #Byte offsets of each column's values (KV1) or each row (CSV, text)
+        self.width = 0; #No. columns
+        self.count = 0; #No. points
+        if (self.format == "kv1"):
+            self._indexKV1();
+        else:
+            self._indexText();
+        if (self.count == 0):
+            raise ValueError("No sample points in '" + fn + "'");
+
+        #Keep the file mapped for reading points (see value())
+        self.fin = open(fn, 'rb');
+        self.mm = mmap.mmap(self.fin.fileno(), 0, access=mmap.ACCESS_READ);
+        self.last = (None, None); #(Point index, its values) of the last point read
+
+    #
+    # Finds the value of every point of the 'freqs' and 'ampls' variables
+    #
+    def _indexKV1(self):
+        self.names = ();
+        found = {};
+        if (os.path.getsize(self.fn) == 0):
+            return;
+        with open(self.fn, 'rb') as fin:
+            with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for var in _kv1Array.finditer(mm):
+                    name = var.group(1).decode('ascii', 'replace');
+                    if (name not in kv1Columns):
+                        continue;
+                    end = mm.find(b"]", var.end());
+                    if (end == -1):
+                        raise ValueError("Unterminated variable '" + name + "' in '" + self.fn + "'");
+                    offs = array('q');
+                    for val in _kv1Value.finditer(mm, var.end(), end):
+                        try:
+                            float(val.group());
+                        except ValueError:
+                            raise ValueError("Failed to read '" + val.group().decode('ascii', 'replace') + "' of '" + name + "' in '" + self.fn + "'");
+                        offs.append(val.start());
+                    found[name] = offs;
+
+        #Columns must be in the order of kv1Columns (ie. no amplitudes without frequencies)
+        for name in kv1Columns:
+            if (name not in found):
+                break;
+            self.offsets.append(found[name]);
+        self.width = len(self.offsets);
+        self.names = kv1Columns[0:self.width];
+        if (self.width == 0 and len(found) > 0): #An amplitude-only file
+            self.offsets.append(found["ampls"]);
+            self.width = 1;
+            self.names = ("ampls",);
+        self.count = min([len(o) for o in self.offsets]) if (self.width > 0) else 0;
+        if (self.width > 1 and len(self.offsets[0]) != len(self.offsets[1])):
+            raise ValueError("'freqs' and 'ampls' of '" + self.fn + "' have different lengths");
+
+    #
+    # Finds the start of every row and checks it has the same no. values as the
+    # first
+    #
+    def _indexText(self):
+        self.names = None;
+        offs = array('q');
+        with open(self.fn, 'rb') as fin:
+            pos = 0;
+            for lineNo, raw in enumerate(fin, 1):
+                start = pos;
+                pos += len(raw);
+                fields = _fields(raw.decode('utf-8', 'replace'));
+                if (len(fields) == 0):
+                    continue;
+                try:
+                    [float(v) for v in fields];
+                except ValueError:
+                    if (len(offs) == 0):
+                        continue; #Header
+                    raise ValueError("Failed to read line " + str(lineNo) + " of '" + self.fn + "'");
+                if (self.width == 0):
+                    self.width = len(fields);
+                elif (len(fields) != self.width):
+                    raise ValueError("Line " + str(lineNo) + " of '" + self.fn + "' has " + str(len(fields)) + " values instead of " + str(self.width));
+                offs.append(start);
+        self.offsets = [offs];
+        self.count = len(offs);
+
+    def __len__(self):
+        return self.count;
+
+    #
+    # Returns the plan's (frequencies, amplitudes) as PointColumns, either of
+    # which is None if the file doesn't hold it. A single column of a CSV or
+    # text file is the independent variable: frequencies if 'freqMode' is True,
+    # otherwise amplitudes. Wider files hold frequency/amplitude pairs.
+    #
+    def plan(self, freqMode):
+        if (self.names is not None):
+            return tuple(self.column(n) if (n in self.names) else None for n in kv1Columns);
+        if (self.width == 1):
+            return (self.column(0), None) if freqMode else (None, self.column(0));
+        return self.column(0), self.column(1);
+
+    #
+    # Returns column 'c' (an index, or for KV1 files the name of the variable)
+    # as a PointColumn. Raises ValueError if the file doesn't have it.
+    #
+    def column(self, c):
+        if (self.names is not None and type(c) == str):
+            if (c not in self.names):
+                raise ValueError("'" + self.fn + "' has no variable '" + c + "'");
+            c = self.names.index(c);
+        if (c < 0 or c >= self.width):
+            raise ValueError("'" + self.fn + "' has no column " + str(c));
+        return PointColumn(self, c);
+
+    #
+    # Reads every value of point 'i' from the mapped file. Returns a list with
+    # one value per column.
+    #
+    def _read(self, i):
+        if (self.names is not None):
+            return [float(_kv1Value.match(self.mm, self.offsets[c][i]).group()) for c in range(self.width)];
+        start = self.offsets[0][i];
+        end = self.mm.find(b"\n", start);
+        line = self.mm[start:(end if end != -1 else len(self.mm))];
+        return [float(v) for v in _fields(line.decode('utf-8', 'replace'))];
+
+    #
+    # Returns value 'c' of point 'i'
+    #
+    def value(self, i, c):
+        if (i < 0):
+            i += self.count;
+        if (i < 0 or i >= self.count):
+            raise IndexError("point index out of range");
+        if (self.last[0] != i):
+            self.last = (i, self._read(i));
+        return self.last[1][c];
+
+    #
+    # Yields the values of column 'c' in order
+    #
+    def values(self, c):
+        for i in range(self.count):
+            yield self._read(i)[c];
+
+    #
+    # Unmaps and closes the file. The points can't be read afterwards.
+    #
+    def close(self):
+        self.mm.close();
+        self.fin.close();
+
+#
+# One column of a PointFile, read from the file as it's used
+#
+class PointColumn:
+
+    def __init__(self, source, col):
+        self.source = source;
+        self.col = col;
+
+    def __len__(self):
+        return len(self.source);
+
+    def __getitem__(self, i):
+        return self.source.value(i, self.col);
+
+    def __iter__(self):
+        return self.source.values(self.col);
+
+    def __repr__(self):
+        return "<" + str(len(self)) + " points of '" + self.source.fn + "'>";
+
+#
+# A read-only list of 'n' copies of 'value' (ie. the default amplitude of every
+# point of a file-driven scan)
+#
+class RepeatedValue:
+
+    def __init__(self, value, n):
+        self.value = value;
+        self.n = n;
+
+    def __len__(self):
+        return self.n;
+
+    def __getitem__(self, i):
+        if (i < -self.n or i >= self.n):
+            raise IndexError("point index out of range");
+        return self.value;
+
+    def __iter__(self):
+        return (self.value for i in range(self.n));
+
+    def __repr__(self):
+        return "<" + str(self.n) + " x " + str(self.value) + ">";
+
+#
+# Checks that the frequencies 'fileFreqs' of a per-point amplitude file match
+# the sample frequencies 'freqs' (to within the fraction 'tol'). Returns a list
+# of messages describing the first 'maxErrors' mismatches.
+#
+def checkFrequencies(freqs, fileFreqs, tol=1e-3, maxErrors=10):
+    if (len(freqs) != len(fileFreqs)):
+        return ["The amplitude file has " + str(len(fileFreqs)) + " points but the scan has " + str(len(freqs))];
+    errors = [];
+    for idx, (f, ff) in enumerate(zip(freqs, fileFreqs)):
+        if (len(errors) >= maxErrors):
+            errors.append("...");
+            break;
+        if (abs(ff - f) > tol*abs(f)):
+            errors.append("Point " + str(idx) + ": the amplitude file's frequency " + str(ff) + " Hz doesn't match " + str(f) + " Hz");
+    return errors;
+
+#
+# Checks every point of the plan 'freqs'/'ampls' (read in one pass) against the
+# generator's frequency range 'freqRange' and amplitude range 'amplRange' (both
+# (min, max)). Returns a list of messages describing the first 'maxErrors' bad
+# points (empty if every point is valid).
+#
+def checkLimits(freqs, ampls, freqRange, amplRange, maxErrors=10):
+    errors = [];
+    if (len(freqs) != len(ampls)):
+        return ["The plan has " + str(len(freqs)) + " frequencies but " + str(len(ampls)) + " amplitudes"];
+    for idx, (f, a) in enumerate(zip(freqs, ampls)):
+        if (len(errors) >= maxErrors):
+            errors.append("...");
+            break;
+        if (not (freqRange[0] <= f <= freqRange[1])):
+            errors.append("Point " + str(idx) + ": " + str(f) + " Hz is outside the generator's range (" + str(freqRange[0]) + " to " + str(freqRange[1]) + " Hz)");
+        elif (not (amplRange[0] <= a <= amplRange[1])):
+            errors.append("Point " + str(idx) + ": " + str(a) + " Vpp is outside the generator's range (" + str(amplRange[0]) + " to " + str(amplRange[1]) + " Vpp)");
+    return errors;
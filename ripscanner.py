@@ -40,9 +40,20 @@ matplotlib.use("TkAgg")
 from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg, NavigationToolbar2Tk)
 from matplotlib.backend_bases import key_press_handler
 from matplotlib.figure import Figure
-from time import sleep
 import time
 from kvar import *
+from scpi import *
+from waveform import *
+from tfengine import *
+from discovery import *
+from simbench import SimResourceManager, SimBench
+from transcript import TranscriptLog, RecordingInstrument, ReplayResourceManager
+from stepscan import Station, meas, getFineScale, courseCeil, defaultScanSettings
+from autoscale import fitScale, interpolateAmplitudes
+from adaptive import adaptiveInsertions
+from pointfile import PointFile, PointColumn, RepeatedValue, checkLimits, checkFrequencies
+from grid2d import serpentineOrder, flattenGrid, denseGrid
+from scalecache import scaleCacheKey, lookupScales, storeScales, forgetScales, clearScaleCache
 import os
 
 import numpy as np
@@ -68,12 +79,63 @@ setMeasDelay = 1200; #Delay in ms between setting the lab instruments to the dat
 autoDualSweep = True; #When performing an automatic-scaled scan
 crudeVertSweepFactor = 2; #Algorithm: volts per division = (input_amplitude * crudeVertSweepFactor); (Default: 2)
 fineVertScaleFactor = 1.2; #Factor by which to scale measured amplitude when selecting a fine scale (Default: 1.2)
+clipDetection = False; #Check each output channel's screen trace after a point's first reading (and after a corrupt reading) and step only the scale of a channel which clipped or spans under 'minScreenDivs' divisions (default: False)
+minScreenDivs = 2; #Smallest no. vertical divisions a signal may span before its channel is rescaled (Default: 2)
+crudeDecimation = 1; #Crude sweep measures only every k-th point (plus the endpoints); the fine scales of the others are interpolated and corrected during the fine sweep if wrong. 1 to measure every point (Default: 1)
+predictiveAutoscale = False; #Predict each point's vertical scales from the gain of the points before it (see autoscale.py) and re-measure only points which were over/underrange, instead of the dual sweep (default: False)
+maxRescales = 3; #Maximum no. times a point is re-measured at a new vertical scale (default: 3)
+cacheFineScales = False; #Remember the vertical scales found for each point of a 'dutProfile' scan and start later scans of the same DUT type, grid and band/gain with them, skipping the crude sweep (see scalecache.py) (default: False)
+
+#Write settings
+coalescedWrites = False; #Send each point's settings as one write per instrument and wait on *OPC? instead of 'setMeasDelay' (default: False)
+concurrentConfig = False; #Configure the scope and generator at the same time (requires coalescedWrites) (default: False)
+
+#Read settings
+batchedReads = False; #Read frequency and all channel amplitudes in one SCPI transaction per reading (default: False)
+waveformAcquisition = False; #Measure every channel locally from one triggered binary capture instead of the scope's MEAS:STAT engine (default: False)
+
+#Settling settings
+adaptiveSettling = False; #Poll the scope and accept a point as soon as a sliding window of readings converges (see settling.py), instead of 'setMeasDelay' + two readings 'timeWithConstReading' apart (default: False)
+settlePollInterval = .05; #Time in seconds between readings while waiting for a point to settle (default: .05)
+settleWindow = 6; #No. readings in the settling detector's sliding window (default: 6)
+frequencyAwareSettling = False; #Size each point's initial wait and verification interval from the excitation period, 'numPeaksPerFrame' and the DUT's estimated time constant instead of 'setMeasDelay' and 'timeWithConstReading' (default: False)
+dutTimeConstant = .1; #Initial estimate of the DUT's settling time constant in seconds, refined as each scan progresses (default: .1)
+deferFailedPoints = False; #Skip points which fail the equilibrium check and retry them at the end of the sweep instead of aborting the scan. Points which fail again are saved as NaN (default: False)
+deferredSettleFactor = 3; #Factor by which the waits and retry time are extended when retrying a deferred point (default: 3)
+statVerification = False; #Reset the scope's measurement statistics once a point is configured and accept it when the standard deviation over 'statMinCount' acquisitions is within 'maxPercentAccepted' (one read per check instead of comparing readings) (default: False)
+statMinCount = 4; #No. acquisitions the scope's statistics must include before a point is judged (default: 4)
+dutProfile = ""; #Learn how long each point of this DUT type takes to settle and start later scans' points with those waits (see settling.py). Empty to disable (default: "")
+
+#Adaptive sampling settings
+adaptiveCoarsePoints = 9; #No. log-spaced points of the first pass of an 'Adaptive' scan ('No. Steps' is the total point budget) (default: 9)
+adaptiveTolerance = .25; #Largest expected gain interpolation error (dB) between neighbouring points of an 'Adaptive' scan (default: .25)
+adaptiveMaxStep = 3; #Largest gain change (dB) allowed between neighbouring points of an 'Adaptive' scan (default: 3)
+
+#Generator limits
+genFreqRange = (1e-6, 40e6); #Frequencies (Hz) the generator can output. Every sample point is checked against these before a scan starts (default: (1e-6, 40e6), SDG2042X)
+genAmplRange = (.002, 20); #Amplitudes (Vpp, high-Z) the generator can output (default: (.002, 20), SDG2042X)
+
+#Chirp settings
+chirpSweep = False; #In frequency modes, measure the whole TF from one generator log-sweep capture instead of stepping (default: False)
+chirpSweepTime = 2; #Duration of the generator's sweep in seconds (default: 2)
+
+#Multisine settings
+multisineExcitation = False; #In frequency modes, measure every frequency at once from a multisine uploaded to the generator (default: False)
+multisinePeriods = 2; #No. multisine periods analysed per capture (default: 2)
+multisineSettlePeriods = 2; #No. multisine periods to wait for the DUT to settle before capturing (default: 2)
 
 #Save settings
 saveUntilClear = True; #(If not in multi-band mode) saves TFs until 'Clear' is hit. Saves all when save command given.
 
 voiceAlerts = False;
 
+simulateBench = False; #Use a simulated scope, generator and DUT (see simbench.py) instead of the test instruments (default: False)
+recordTranscript = ""; #Record every instrument command and reply to this file (see transcript.py). Empty to disable (default: "")
+replayTranscript = ""; #Replay this transcript instead of connecting to the test instruments. Empty to disable (default: "")
+replayTiming = False; #Replay each command with its recorded duration instead of at full speed (default: False)
+replaySession = -1; #Session of 'replayTranscript' to replay (each recording to the same file adds a session; -1 for the last) (default: -1)
+timingFile = ""; #Append each scan's per-point timing breakdown to this CSV file (see timing.py). Empty to disable (default: "")
+
 #*********************************************************#
 #*********************************************************#
 
@@ -133,52 +195,90 @@ imeasSave = []; #2D save buffer for imeas values
 omeasSave = []; #2D save buffer for omeas values
 meas3Save = []; #2D save buffer for meas3 values
 meas4Save = []; #2D save buffer for meas4 values
+pointStatus = []; #Status of each point of the last meas() ('ok', 'rescanned' or 'missing')
+statusSave = []; #2D save buffer for pointStatus values
+timingSave = []; #Save buffer of each scan's per-point timing (TimingLog, see timing.py)
+phases = {}; #Phase (deg) of each output channel of the last scan ({channel: list}), empty unless it was a chirp scan
+phaseSave = []; #Save buffer of each scan's 'phases'
+phaseNames = {2: "out_phase", 3: "ch3_phase", 4: "ch4_phase"}; #KV1 variable of each output channel's phase
 
-#Define scale buffers (for dual-auto-sweep)
-fineScaleCh2 = []; #Fine-scale buffer (CH1)
-fineScaleCh3 = []; #Fine-scale buffer (CH2)
-fineScaleCh4 = []; #Fine-scale buffer (CH3)
+gridFreqs = []; #Frequency axis of a 2-D (freq. x ampl.) sweep
+gridAmpls = []; #Amplitude axis of a 2-D sweep
+gridOrder = []; #(Freq. index, ampl. index) of each point of a 2-D sweep, in the order measured
+gridSave = []; #Save buffer of 2-D sweeps (dicts of name -> axis or ampl. x freq. array)
 
-#These are the global variables modified by the command 'collect()' because I can't use references (because this isn't c++ apparantly :/ )
-fr, c1, c2, c3, c4 = 0, 0, 0, 0, 0;
+adaptiveBudget = 0; #Total no. points of an 'Adaptive' scan
 
 print("General Purpose Transfer Function Scanner");
 print("\n**** Copyright 2019, Giesbreceht Electronics ****");
 
-rm = visa.ResourceManager()
-# Get the USB device, e.g. 'USB0::0x1AB1::0x0588::DS1ED141904883'
-instruments = rm.list_resources()
-scope_addr = list(filter(lambda x: 'DS1Z' in x, instruments))
-awg_addr = list(filter(lambda x: 'SDG2X' in x, instruments))
-if len(scope_addr) != 1 or len(awg_addr) != 1:
-    print('Failed to identify test instruments', instruments)
+#Test instruments. These aren't connected until the first scan so the GUI starts immediately (and
+#can be used without the bench, ie. to review data).
+scope = None;
+awg = None;
+bench = None; #The instruments and the state of the scan run on them (see stepscan.py)
+
+#
+# Connects to the scope and generator (if not already connected) and initializes them to collect
+# data. The instruments' resource strings are cached (see discovery.py) so they don't need to be
+# searched for every time. Returns True if connected.
+#
+def connectTestEquipment():
+    global scope, awg, bench;
+
+    if (scope is not None and awg is not None):
+        return True;
+
+    try:
+        if (replayTranscript != ""): #Recorded session (see transcript.py)
+            rm = ReplayResourceManager(replayTranscript, replayTiming, session=replaySession);
+            s, a = rm.open_resource(rm.find("DS1Z"), timeout=30), rm.open_resource(rm.find("SDG2X"), timeout=30);
+        elif (simulateBench): #Simulated instruments and DUT (see simbench.py)
+            rm = SimResourceManager(SimBench());
+            s, a = rm.open_resource(rm.scopeAddr, timeout=30), rm.open_resource(rm.awgAddr, timeout=30);
+        else:
+            rm = visa.ResourceManager()
+            s, a = connectInstruments(rm, ["DS1Z", "SDG2X"], timeout=30, chunk_size=1024) # bigger timeout for long mem
+    except Exception as e:
+        print(str(e));
+        if (voiceAlerts):
+            os.system("say Verbindung zu Testgerat fehlgeschlagen -r 150& &>/dev/null");
+        return False;
+    if (recordTranscript != "" and replayTranscript == ""):
+        log = TranscriptLog(recordTranscript);
+        s, a = RecordingInstrument(s, log), RecordingInstrument(a, log);
+        print("Recording instrument transcript to " + recordTranscript);
+    scope = ShadowInstrument(s, "SCOPE");
+    print("Connected to scope");
+    awg = ShadowInstrument(a, "AWG");
+    print("Connected to generator");
+    bench = Station("", scope, awg);
     if (voiceAlerts):
-        os.system("say Verbindung zu Testgerat fehlgeschlagen -r 150& &>/dev/null");
-    sys.exit(-1)
-scope = rm.open_resource(scope_addr[0], timeout=30, chunk_size=1024) # bigger timeout for long mem
-print("Connected to scope");
-awg = rm.open_resource(awg_addr[0], timeout=30, chunk_size=1024) # bigger timeout for long mem
-print("Connected to generator");
-if (voiceAlerts):
-    os.system("say Verbindung zum Testgerat erfolgreich -r 150& &>/dev/null &");
-
-#Initialize oscilloscope to collect data
-#scope.write("MEAS:COUN:SOUR CHAN1");
-scope.write("MEAS:STAT:ITEM FREQ,CHAN1");
-#scope.write("MEAS:STAT:ITEM VRMS,CHAN1");
-#scope.write("MEAS:STAT:ITEM VRMS,CHAN2");
-scope.write("MEAS:STAT:ITEM VPP,CHAN1");
-scope.write("MEAS:STAT:ITEM VPP,CHAN2");
-scope.write("MEAS:STAT:ITEM VPP,CHAN3");
-scope.write("MEAS:STAT:ITEM VPP,CHAN4");
-# scope.write("MEAS:STAT:ITEM VAVG,CHAN4");
-
-#Set trigger
-scope.write("TRIG:EDG:SOUR CHAN1"); #Set trigger source to channel 1
-scope.write("TRIG:MODE EDGE") #Set trigger mode to edge
-scope.write("TRIG:EDGE:LEV 0") #Set trigger level to 0 V
-
-awg.write("C2:BSWV WVTP,SINE")
+        os.system("say Verbindung zum Testgerat erfolgreich -r 150& &>/dev/null &");
+
+    #Initialize oscilloscope to collect data
+    init = CommandQueue();
+    #init.write(scope, "MEAS:COUN:SOUR CHAN1");
+    init.write(scope, "MEAS:STAT:ITEM FREQ,CHAN1");
+    #init.write(scope, "MEAS:STAT:ITEM VRMS,CHAN1");
+    #init.write(scope, "MEAS:STAT:ITEM VRMS,CHAN2");
+    init.write(scope, "MEAS:STAT:ITEM VPP,CHAN1");
+    init.write(scope, "MEAS:STAT:ITEM VPP,CHAN2");
+    init.write(scope, "MEAS:STAT:ITEM VPP,CHAN3");
+    init.write(scope, "MEAS:STAT:ITEM VPP,CHAN4");
+    # init.write(scope, "MEAS:STAT:ITEM VAVG,CHAN4");
+
+    #Set trigger
+    init.write(scope, "TRIG:EDG:SOUR CHAN1"); #Set trigger source to channel 1
+    init.write(scope, "TRIG:MODE EDGE") #Set trigger mode to edge
+    init.write(scope, "TRIG:EDGE:LEV 0") #Set trigger level to 0 V
+
+    init.write(awg, "C2:BSWV WVTP,SINE")
+    init.flush();
+    if (waveformAcquisition or clipDetection):
+        setupWaveformRead(scope);
+
+    return True;
 
 #Define Subroutines
 ##def measVsAmp(fmeas, omeas, imeas, meas3, meas4):
@@ -239,324 +339,177 @@ def executeAutoNext():
 ##        tk.messagebox.showinfo("Auto-Next Complete", "Scanned High-band at max-gain. Select a different band for auto-next to engage again.");
 
 #
-# Takes a list of values ('rvals') to which to round, and
-# Returns the smallest one which is greater than
-# or equal to 'x'. 'rvals' must be in least to greatest order.
+# Returns the measurement to read from CH3 and CH4 (ie. 'Vpp' or 'Vavg' as
+# chosen in the GUI, or False if the channel is off) for readMeasurements()
 #
-def listCeil(x, rvals):
-    for cc in rvals:
-        if (x <= cc):
-            return cc;
+def auxMeasurements():
+    return (ch3Mode.get() if ch3on.get() == 1 else False), (ch4Mode.get() if ch4on.get() == 1 else False);
+
 #
-# Rounds the number 'x' to the closest oscilloscope 'course'
-# scaling value.
+# Returns the settings of meas() (see stepscan.py) as set in the SETTINGS
+# section
 #
-def courseCeil(x):
-    roundVals = [1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3, 200e-3, 500e-3, 1, 2, 5, 10];
-    return listCeil(x, roundVals);
+def scanSettings():
+    return {name: globals()[name] for name in defaultScanSettings};
 
 #
-# Calculates the max percent change between 'a' and 'b' (absolute values). If one is zero and the
-# other is non-zero, it returns a change of 1000%.
+# Measures the sample points 'freqs'/'ampls' on the bench with meas() (see
+# stepscan.py), appending the results to the bench's buffers. 'crudeSweep' and
+# 'scales' are passed to meas(). Returns False if the scan failed.
 #
-def mpc(a, b):
-    a = abs(a);
-    b = abs(b);
-    if (a-b) == 0:
-        return 0;
-    if (min(a, b) == 0):
-        return 1000;
-    return 100.0*abs(a-b)/min(a,b);
+def measBench(crudeSweep, scales=None):
+    if (aquisitionMode.get() != 0): #From file
+        print("Aquisition settings from file not yet suppored.");
+        return False;
+    bench.freqs, bench.ampls = freqs, ampls;
+    bench.ch3, bench.ch4 = auxMeasurements();
+    bench.amplMode = (scanMode.get() == 0);
+    bench.grid = (scanMode.get() == 3);
+    return meas(bench, crudeSweep, scanSettings(), scales);
 
 #
-# Collect a single data point using frequency as the independent variable.
-#
+# Measures the transfer function at every frequency in 'freqs' from a single
+# chirp (swept-sine) capture (see tfengine.py) and appends the results to the
+# buffers in the same form as meas(). The output is given as the Vpp it would
+# have with a sine input of the measured input amplitude, and the phase of each
+# output channel is put in 'phaseMeas' ({channel: list}, deg). If
+# 'autoDualSweep' is set, a crude capture is used to pick the vertical scales
+# for the final one.
 #
-# def collect(fmeas, imeas, omeas, meas3, meas4):
-def collect():
-    #Declare buffers
-    global fr, c1, c2, c3, c4;
+def measChirp(fmeas, imeas, omeas, meas3, meas4, phaseMeas):
+
+    chans = [1, 2];
+    if (ch3on.get() == 1):
+        chans.append(3);
+    if (ch4on.get() == 1):
+        chans.append(4);
+
+    ampl = ampls[0];
+    scales = {1: courseCeil(ampl/numDivVert*vertExpandFactor)};
+    for c in chans[1:]:
+        scales[c] = courseCeil(ampl*crudeVertSweepFactor);
 
-    # fr.append(float(scope.query("MEAS:COUN:VAL?")));
-    added = 0;
     try:
-        fr = float(scope.query("MEAS:STAT:ITEM? CURR,FREQ,CHAN1"));
-        added = 1;
-        c1 = float(scope.query("MEAS:STAT:ITEM? CURR,VPP,CHAN1"));
-        added = 2;
-        #        in_rms.append(float(scope.query("MEAS:STAT:ITEM? CURR,VRMS,CHAN1")));
-        c2 = float(scope.query("MEAS:STAT:ITEM? CURR,VPP,CHAN2"));
-        added = 3;
-        #        out_rms.append(float(scope.query("MEAS:STAT:ITEM? CURR,VRMS,CHAN2")));
-        if (ch3on.get() == 1):
-            c3 = float(scope.query("MEAS:STAT:ITEM? CURR,VPP,CHAN3"));
-        added = 4;
-        if (ch4on.get() == 1):
-            c4 = float(scope.query("MEAS:STAT:ITEM? CURR,VPP,CHAN4"));
-        added = 5;
-        #            print("\t** f = " + "{:09.4e}".format(freqs[i]) + " Hz\t**\tVin = " + "{:09.4e}".format(in_vpp[i]) + " Vpp\t" + "{:09.4e}".format(in_rms[i]) + " Vrms\t**\tVout = " + "{:09.4e}".format(out_vpp[i]) + " Vpp\t" + "{:09.4e}".format(out_rms[i]) + "Vrms\t**\tVlevel = " + "{:09.4e}".format(level_avg[i]) + "V");
-        print("\t** f = " + "{:09.4e}".format(fr) + " Hz\t**\tVin = " + "{:09.4e}".format(c1) + " Vpp\t**\tVout = " + "{:09.4e}".format(c2) + " Vpp\t**\tVc3 = " + "{:09.4e}".format(c3) + "V" + " Vpp\t**\tVc4 = " + "{:09.4e}".format(c4) + "V");
+        res = chirpScan(scope, awg, freqs, ampl, chans, scales, chirpSweepTime, numDivHoriz);
+        if (autoDualSweep): #Rescale each output to the largest amplitude seen during the crude chirp
+            print("Crude chirp completed. Calculating fine scales...");
+            for c in chans[1:]:
+                scales[c] = courseCeil(res.vpp[c]/numDivVert*fineVertScaleFactor);
+            res = chirpScan(scope, awg, freqs, ampl, chans, scales, chirpSweepTime, numDivHoriz);
     except Exception as e:
-        # print("Failed to collect data point. Fixing ");
-        #
-        # while (len(freqs) > noncorrupted_length):
-        #     del freqs[noncorrupted_length];
-        #
-        # while (len(in_vpp) > noncorrupted_length):
-        #     del in_vpp[noncorrupted_length];
-        #
-        # while (len(in_rms) > noncorrupted_length):
-        #     del in_rms[noncorrupted_length];
-        #
-        # while (len(out_vpp) > noncorrupted_length):
-        #     del out_vpp[noncorrupted_length];
-        #
-        # while (len(out_rms) > noncorrupted_length):
-        #     del out_rms[noncorrupted_length];
-        #
-        # while (len(level_avg) > noncorrupted_length):
-        #     del level_avg[noncorrupted_length];
-
-        print("Measurement error (" + str(added) + "). Point not recorded.");
+        print("Chirp measurement failed.");
         print("\t"+str(e));
         return False;
 
-    #Ensure data are valid...
-    if (fr > 1e30 or c1 > 1e30 or c2 > 1e30 or c3 > 1e30 or c4 > 1e30):
-        print("Received invalid data.");
-        return False;
-
-
+    for idx in range(len(res.freqs)):
+        fmeas.append(float(res.freqs[idx]));
+        imeas.append(res.inVpp);
+        omeas.append(float(res.gain[2][idx]*res.inVpp));
+        meas3.append(float(res.gain[3][idx]*res.inVpp) if 3 in res.gain else 0);
+        meas4.append(float(res.gain[4][idx]*res.inVpp) if 4 in res.gain else 0);
+        print("\t** f = " + "{:09.4e}".format(res.freqs[idx]) + " Hz\t**\tGain = " + "{:09.4e}".format(res.gain[2][idx]) + " V/V\t**\tPhase = " + "{:+07.2f}".format(res.phase[2][idx]) + " deg");
+    for c in res.phase:
+        phaseMeas[c] = [float(p) for p in res.phase[c]];
 
-    # fmeas.append(fr);
-    # imeas.append(c1);
-    # omeas.append(c2);
-    # meas3.append(c3);
-    # meas4.append(c4);
+    if (turnOffAfterScan):
+        awg.write("C2:OUTP OFF");
 
     return True;
 
 #
-# Takes the data collected from the first crude-scan and calculates the fine-resolution
-# vertical-scales to be used in the second scan.
+# Measures every frequency in 'freqs' at once with a multisine excitation (see
+# tfengine.py) and appends the results to the buffers in the same form as
+# meas(). The frequencies recorded are those of the tones, which are snapped to
+# the capture's FFT bins. If 'autoDualSweep' is set, a crude capture is used to
+# pick the vertical scales for the final one.
 #
-def getFineScale(fmeas, imeas, omeas, meas3, meas4):
+def measMultisine(fmeas, imeas, omeas, meas3, meas4):
 
-    global fineScaleCh2, fineScaleCh3, fineScaleCh4;
+    chans = [1, 2];
+    if (ch3on.get() == 1):
+        chans.append(3);
+    if (ch4on.get() == 1):
+        chans.append(4);
 
-    print("Calculating fine scales...");
+    ampl = ampls[0];
+    scales = {1: courseCeil(ampl/numDivVert*vertExpandFactor)};
+    for c in chans[1:]:
+        scales[c] = courseCeil(ampl*crudeVertSweepFactor);
+
+    try:
+        res = multisineScan(scope, awg, freqs, ampl, chans, scales, multisinePeriods, multisineSettlePeriods, numDivHoriz);
+        if (autoDualSweep): #Rescale each output to the largest amplitude seen during the crude capture
+            print("Crude multisine completed. Calculating fine scales...");
+            for c in chans[1:]:
+                scales[c] = courseCeil(res.vpp[c]/numDivVert*fineVertScaleFactor);
+            res = multisineScan(scope, awg, freqs, ampl, chans, scales, multisinePeriods, multisineSettlePeriods, numDivHoriz);
+    except Exception as e:
+        print("Multisine measurement failed.");
+        print("\t"+str(e));
+        return False;
 
-    fineScaleCh2 = [];
-    fineScaleCh3 = [];
-    fineScaleCh4 = [];
+    for idx in range(len(res.freqs)):
+        fmeas.append(float(res.freqs[idx]));
+        imeas.append(float(res.tones[1][idx]));
+        omeas.append(float(res.tones[2][idx]));
+        meas3.append(float(res.tones[3][idx]) if 3 in res.tones else 0);
+        meas4.append(float(res.tones[4][idx]) if 4 in res.tones else 0);
+        print("\t** f = " + "{:09.4e}".format(fmeas[-1]) + " Hz\t**\tVin = " + "{:09.4e}".format(imeas[-1]) + " Vpp\t**\tVout = " + "{:09.4e}".format(omeas[-1]) + " Vpp");
 
-    for idx in range(len(fmeas)): #For each sample point...
-        fineScaleCh2.append(courseCeil(omeas[idx]/numDivVert*fineVertScaleFactor)); #Get vert. scale that fits the measured amplitude (plus a little extra)
-        print("FS start value: "+str(omeas[idx]));
-        print("FS Added: " +str(courseCeil(omeas[idx]/numDivVert*fineVertScaleFactor)));
-        if (ch3on.get() == 1):
-            fineScaleCh3.append(courseCeil(meas3[idx]/numDivVert*fineVertScaleFactor)); #Get vert. scale that fits the measured amplitude (plus a little extra)
-        if (ch4on.get() == 1):
-            fineScaleCh4.append(courseCeil(meas4[idx]/numDivVert*fineVertScaleFactor)); #Get vert. scale that fits the measured amplitude (plus a little extra)
+    if (turnOffAfterScan):
+        awg.write("C2:OUTP OFF");
 
     return True;
+
 #
-# Measure a transfer function (using 1+ data points).
-#
+# Refines an 'Adaptive' scan (see adaptive.py). The points measured so far on
+# the bench (at the set frequencies 'freqs') are examined and new frequencies
+# are measured wherever the gain between neighbouring points can't be
+# interpolated to within 'adaptiveTolerance', until no interval needs a point
+# or 'adaptiveBudget' points were measured. The scales of the new points are
+# interpolated from their neighbours. On return the bench's buffers (and point
+# statuses), 'freqs' and 'ampls' hold every point in order of frequency.
 #
-def meas(fmeas, imeas, omeas, meas3, meas4, crudeSweep):
-
-    firstPoint = True;
-
-    amplitude = 1;
-
-    #Turn on generator
-    awg.write("C2:OUTP ON");
-
-    for idx in range(len(freqs)):
-        #Set frequency
-        awg.write("C2:BSWV FRQ,"+str(freqs[idx]))
-        print("SCPI<AWG> C2:BSWV FRQ,"+str(freqs[idx]));
-
-        #Set amplitude
-        awg.write("C2:BSWV AMP,"+str(ampls[idx]));
-        print("SCPI<AWG> C2:BSWV AMP,"+str(ampls[idx]));
-
-        #Configure scope settings
-        if (aquisitionMode.get() == 0): #Automatic
-
-            #Determine time/div setting
-            totalTime = 1/freqs[idx]*numPeaksPerFrame;
-            timePerDiv = totalTime/numDivHoriz;
-            scope.write("TIM:MAIN:SCAL "+str(timePerDiv));
-            print("SCPI<SCOPE> TIM:MAIN:SCAL "+str(timePerDiv));
-
-            #********** Determine volts/div setting
-
-            #Channel 1 always a function of input amplitude
-            voltsPerDiv = courseCeil(ampls[idx]/numDivVert*vertExpandFactor);
-            scope.write("CHAN1:SCAL "+str(voltsPerDiv));
-            print("SCPI<SCOPE> CHAN1:SCAL "+str(voltsPerDiv));
-
-            #Iteratively select scale for CH2, 3, 4
-            if (autoDualSweep == True): #If dual-sweep... (ie. set to auto vertical scale (!from file) and dual-sweep is on)
-                if (crudeSweep): #If performing crudeSweep, voltsPerDiv for every channel is just scaled up greatly from CH1 scale.
-                    voltsPerDiv = courseCeil(ampls[idx]*crudeVertSweepFactor);
-
-                    scope.write("CHAN2:SCAL "+str(voltsPerDiv));
-                    print("SCPI<SCOPE> CHAN2:SCAL "+str(voltsPerDiv));
-                    if (ch3on.get() == 1):
-                        scope.write("CHAN3:SCAL "+str(voltsPerDiv));
-                        print("SCPI<SCOPE> CHAN3:SCAL "+str(voltsPerDiv));
-                    if (ch4on.get() == 1):
-                        scope.write("CHAN4:SCAL "+str(voltsPerDiv));
-                        print("SCPI<SCOPE> CHAN4:SCAL "+str(voltsPerDiv));
-                else: #Performing fine-sweep. Use channel vert-scales from list 'fineScaleChX'
-                    if (len(fineScaleCh2) < 1):
-                        print("Fine scale list is unpopulated!");
-                        return False;
-                    scope.write("CHAN2:SCAL "+str(fineScaleCh2[idx]));
-                    print("SCPI<SCOPE> CHAN2:SCAL "+str(fineScaleCh2[idx]));
-                    if (ch3on.get() == 1):
-                        scope.write("CHAN3:SCAL "+str(fineScaleCh3[idx]));
-                        print("SCPI<SCOPE> CHAN3:SCAL "+str(fineScaleCh3[idx]));
-                    if (ch4on.get() == 1):
-                        scope.write("CHAN4:SCAL "+str(fineScaleCh4[idx]));
-                        print("SCPI<SCOPE> CHAN4:SCAL "+str(fineScaleCh4[idx]));
-                    if (str(fineScaleCh2[idx]) == "None"):
-                        print("Error occured w/ vert scale being called 'none'. Length of fsc2: "+str(len(fineScaleCh2)));
-
-            else: #using guess method that is somewhat arbitrary (mult. by a fixed coef. to get scale)
-                if (firstPoint): #guess it's about the size of the input if no idea
-                    scope.write("CHAN2:SCAL "+str(voltsPerDiv));
-                    print("SCPI<SCOPE> CHAN2:SCAL "+str(voltsPerDiv));
-                    if (ch3on.get() == 1):
-                        pass;
-                        scope.write("CHAN3:SCAL "+str(voltsPerDiv));
-                        print("SCPI<SCOPE> CHAN3:SCAL "+str(voltsPerDiv));
-                    if (ch4on.get() == 1):
-                        scope.write("CHAN4:SCAL "+str(voltsPerDiv));
-                        print("SCPI<SCOPE> CHAN4:SCAL "+str(voltsPerDiv));
-
-
-
-        else: #From file
-            print("Aquisition settings from file not yet suppored.");
-            return False;
-
-
-        #**********************************************************************************#
-        #*********************  DATA INTEGRITY AND EQUILIBRIUM CHECKER ********************#
-        # The introduction of this code accelerated the scan speed dramatically because it #
-        # eliminated the need to wait a fixed time to establish equilibrium. These fixed   #
-        # times were inordinately large to help even the slowest sample points to scan, but#
-        # failures were not uncommon. The boost to data reliability and elimination of     #
-        # corrupt data has made the program far faster, more accurate, and reliable. NICE. #
-        #**********************************************************************************#
-        #                                                                                  #
-        # Looks for:                                                                       #
-        #   - Corrupt data from scope (ie. value > 1e30)                                   #
-        #   - Measured and set frequency don't match (Added 5.5.2019)                      #
-        #   - Value changes too quickly (not at equilibrium)                               #
-        #                                                                                  #
-        #**********************************************************************************#
-
-        #Read everything and check for equilibrium and data integrity
-        num_failed = 0;
-        start = time.time(); #Get total time req'd for data point
-        sleep(setMeasDelay*1e-3); #Initial pause to let everything equilibrate
-        oldf = 0;
-        oldi = 0;
-        oldo = 0;
-        old3 = 0;
-        old4 = 0;
-        verifying = False; #Specifies if it's collected a first point or verifying that point w/ a second measurement.
-        total_no_scans = 0;
-        while (True): #continue trying until accurate readings are had...
-            total_no_scans += 1;
-            #Take a measurement. If it fails (an exception occurs or data > 1e30 (corrupted)), increment num_failed
-            if (not collect()): #Results of collect() are saved in global variables fr, c1, c2, c3, c4 because I can't pass by reference variables :(. Collect will return false if bad/corrupt data is received (value will be > 1e30).
-                num_failed += 1;
-                sleep(.333); #Wait 100 ms
-                if (num_failed > 15): #Cancel scan if too many attempts fail (Takes a maximum of 5 seconds to fail + initial delay)
-                    print("Failed to collect all data points successfully.");
-                    return False;
-            else: #Measurement didn'throw an error or give corrupted data
-                num_failed = 0; #Reset fail counter
-                if (verifying):
-                    dval = max(mpc(oldf, fr), mpc(oldi, c1), mpc(oldo, c2), mpc(old3, c3), mpc(old4, c4));
-                    if (dval <= maxPercentAccepted):
-                        print("Passed scan No. " + str(total_no_scans) + " with an error of " + str(dval) + " %. Tot. elapsed time: " + str(time.time()-start) + " sec");
-                        break; #The measurement has satisfied the subroutine's integrity check
-                    else: #The measurement was too far off from the original measurement, try again
-                        oldf = fr; #Update the measurements...
-                        oldi = c1;
-                        oldo = c2;
-                        old3 = c3;
-                        old4 = c4;
-                        print("The measurement, although non-corrupt, failed the equilibrium+integrity check.");
-                        print("\tAfter ~" + str(timeWithConstReading) + " seconds, % change: " + str(dval));
-                        print("\tTET: "+str(time.time()-start));
-                        if (time.time() - start > maxRetryTime):
-                            print("Measurement retry time expired. Aborting scan.");
-                            return False;
-                        sleep(timeWithConstReading); #Wait a bit...
-                else:
-                    if (mpc(fr, freqs[idx]) > maxPercentAcceptedFrequencyDelta): #Ensure measured and set frequencies match (within a certain margin of error)
-                        print("The measurement, although non-corrupt, failed the equilibrium+integrity check.");
-                        print("\tFrequency was out of spec. Set: " + str(freqs[idx]) + " Hz \tMeas: " + str(fr) + " Hz");
-                        print("\tTET: "+str(time.time()-start));
-                        if (time.time() - start > maxRetryTime):
-                            print("Measurement retry time expired. Aborting scan.");
-                            return False;
-                        sleep(timeWithConstReading); #Wait a bit...
-                        continue;
-                    verifying = True;
-                    oldf = fr;
-                    oldi = c1;
-                    oldo = c2;
-                    old3 = c3;
-                    old4 = c4;
-
-                    sleep(timeWithConstReading); #Wait a bit...
-
-        #Once past the data integrity+equilibrium check, append to the list
-        fmeas.append(fr);
-        imeas.append(c1);
-        omeas.append(c2);
-        meas3.append(c3);
-        meas4.append(c4);
-
-        #**********************************************************************************#
-        #*****************  END of DATA INTEGRITY AND EQUILIBRIUM CHECKER *****************#
-        #**********************************************************************************#
-
-        # if (aquisitionMode.get() == 0):
-        #     pass;
-        #For each channel...
-            #See if last value was > 1000...
-                #If so...
-                    #set boolean so all last get poped.
-                    #Increase vertical scale by a constant
-
-
-
-
-        # if (scanMode.get() == 0): #Amplitude mode
-        #     # fmeas[:], imeas[:], omeas[:], meas3[:], meas4[:] = collectAmpl();
-        #     pass;
-        # else: #Frequency mode
-        #     # fmeas[:], imeas[:], omeas[:], meas3[:], meas4[:] = collectFreq();
-        #     pass;
-
-    if (turnOffAfterScan):
-        awg.write("C2:OUTP OFF");
+def refineAdaptive():
+    global freqs, ampls;
 
-    # scope.write();
+    status = bench.pointStatus if len(bench.pointStatus) == len(bench.fmeas) else ["ok"]*len(bench.fmeas);
+    rows = sorted(zip(freqs, ampls, bench.fmeas, bench.imeas, bench.omeas, bench.meas3, bench.meas4, status)); #One row per point
+
+    while (len(rows) < adaptiveBudget):
+        gains = [20*np.log10(row[4]/row[3]) if (row[3] > 0 and row[4] > 0) else np.nan for row in rows];
+        newFreqs = adaptiveInsertions([row[0] for row in rows], gains, adaptiveTolerance, adaptiveBudget-len(rows), adaptiveMaxStep);
+        if (len(newFreqs) == 0):
+            break;
+        print("Adaptive sampling: measuring " + str(len(newFreqs)) + " more points (" + str(len(rows)) + " of " + str(adaptiveBudget) + " measured).");
+
+        #Start the new points at the scales of their interpolated amplitudes
+        freqs = newFreqs;
+        ampls = [rows[0][1]]*len(newFreqs);
+        scales = {};
+        for c in bench.outputChannels():
+            vpp = interpolateAmplitudes([row[0] for row in rows], [row[2+c] for row in rows], newFreqs);
+            if (vpp is None):
+                scales[c] = [fitScale(a*crudeVertSweepFactor, 1, 1, courseCeil) for a in ampls];
+            else:
+                scales[c] = [fitScale(v, numDivVert, fineVertScaleFactor, courseCeil) for v in vpp];
 
+        bench.clear();
+        if (not measBench(False, scales)):
+            return False;
+        rows = sorted(rows + list(zip(freqs, ampls, bench.fmeas, bench.imeas, bench.omeas, bench.meas3, bench.meas4, bench.pointStatus)));
+
+    freqs = [row[0] for row in rows];
+    ampls = [row[1] for row in rows];
+    bench.freqs, bench.ampls = freqs, ampls;
+    bench.fmeas = [row[2] for row in rows];
+    bench.imeas = [row[3] for row in rows];
+    bench.omeas = [row[4] for row in rows];
+    bench.meas3 = [row[5] for row in rows];
+    bench.meas4 = [row[6] for row in rows];
+    bench.pointStatus = [row[7] for row in rows];
     return True;
 
-
 #
 # Processes everything for a scan. Reads info from the GUI, files, etc. and
 # begins a scan (using the meas() function, which in turn, makes multiple calls
@@ -564,58 +517,123 @@ def meas(fmeas, imeas, omeas, meas3, meas4, crudeSweep):
 #
 def scan():
     global plot
-    global fmeasSave, imeasSave, omeasSave, meas3Save, meas4Save
+    global fmeasSave, imeasSave, omeasSave, meas3Save, meas4Save, statusSave
+    global gridSave, timingSave, phases, phaseSave
+    global pointStatus
     global fmeas, imeas, omeas, meas3, meas4
     global lxi,lxo,lxf,lx3, lx4,lni,lno,lnf,ln3,ln4,mxi,mxo,mxf,mx3,mx4,mni
     global mno,mnf,mn3,mn4,hxi,hxo,hxf,hx3,hx4,hni,hno,hnf,hn3,hn4
     global basei,baseo,basef,base3,base4
 
+    #Connect to the test equipment on the first scan
+    if (not connectTestEquipment()):
+        tk.messagebox.showerror("Scan Failed!", "Failed to connect to the test instruments.");
+        return False;
+
     #Get sample frequencies/amplitudes
     if (not getSampleFreqsAmpls()):
         tk.messagebox.showerror("Scan Failed!", "Failed to determine sample frequencies/amplitudes");
         return False;
 
-    print("Frequencies to measure: (Hz)" + str(freqs));
+    print("Frequencies to measure: (Hz)" + (str(freqs) if len(freqs) <= 100 else " " + str(len(freqs)) + " points"));
 
     #Clear buffers
-    fmeas = [];
-    omeas = [];
-    imeas = [];
-    meas3 = [];
-    meas4 = [];
+    bench.clear();
+    bench.ch3, bench.ch4 = auxMeasurements();
 
     scan_start = time.time();
 
-    #Perform measurements (If set to auto-vertical scale dual-auto-sweep, this will be the crude sweep)
-    if (not meas(fmeas, imeas, omeas, meas3, meas4, True)): #'True' says to do the crude-sweep. This will be ignored if not in automatic & dual-sweep modes.
-        # os.system("say Scan fehlgeschlagen -r 150& &>/dev/null &");
-        tk.messagebox.showerror("Scan Failed!", "Failed to complete measurements.");
-        return False;
-
-
+    #Forget the instrument state from the last scan (the front panels may have been used since). The
+    #shadowed state is kept between the crude and fine sweeps so unchanged settings aren't rewritten.
+    scope.invalidate();
+    awg.invalidate();
+
+    #Add any aux. measurement other than Vpp (ie. Vavg) to the scope's statistics
+    aux = CommandQueue();
+    for c, item in zip((3, 4), auxMeasurements()):
+        if (auxItem(item) not in (None, "VPP")):
+            aux.write(scope, "MEAS:STAT:ITEM " + auxItem(item) + ",CHAN" + str(c));
+    aux.flush();
+
+    #Start each scan from the initial DUT time constant estimate (it's refined by the crude sweep for the fine sweep)
+    bench.startScan(scanSettings());
+
+    #Look up the vertical scales of the last scan of this DUT type over the same grid (see scalecache.py)
+    scaleKey = None;
+    if (cacheFineScales and dutProfile != "" and aquisitionMode.get() == 0 and scale.get() != 4): #An adaptive scan's grid isn't known in advance
+        bandSetting = [band.get(), gain.get()] if (scanMode.get() == 2) else None;
+        scaleKey = scaleCacheKey(dutProfile, scanMode.get(), freqs, ampls, bandSetting, bench.outputChannels());
+        bench.cachedScales = lookupScales(scaleKey);
+        if (bench.cachedScales is not None):
+            print("Using the cached vertical scales of '" + dutProfile + "'");
+
+    phases = {};
+    if (chirpSweep and (scanMode.get() == 1 or scanMode.get() == 2)): #Swept-sine: the whole TF from one capture
+        if (not measChirp(bench.fmeas, bench.imeas, bench.omeas, bench.meas3, bench.meas4, phases)):
+            tk.messagebox.showerror("Scan Failed!", "Failed to complete chirp measurement.");
+            return False;
+        print("Chirp scan completed successfully.");
+    elif (multisineExcitation and (scanMode.get() == 1 or scanMode.get() == 2)): #Multisine: every tone from one capture
+        if (not measMultisine(bench.fmeas, bench.imeas, bench.omeas, bench.meas3, bench.meas4)):
+            tk.messagebox.showerror("Scan Failed!", "Failed to complete multisine measurement.");
+            return False;
+        print("Multisine scan completed successfully.");
+    else:
+        #Go straight to the fine sweep if its scales are cached
+        cachedPass = False;
+        if (bench.cachedScales is not None and autoDualSweep == True and not predictiveAutoscale):
+            bench.fineScaleCh2 = bench.cachedScales[2];
+            bench.fineScaleCh3 = bench.cachedScales.get(3, []);
+            bench.fineScaleCh4 = bench.cachedScales.get(4, []);
+            cachedPass = measBench(False);
+            if (not cachedPass):
+                if (not bench.scaleCacheMiss):
+                    tk.messagebox.showerror("Scan Failed!", "Failed to complete fine-resolution measurements.");
+                    return False;
+                print("A point overranged with the cached scales. Running the crude sweep.");
+                forgetScales(scaleKey);
+                bench.cachedScales = None;
+                bench.clear();
 
-    #Zero-in on vertical-scale if set to dual-sweep
-    if (aquisitionMode.get() == 0 and autoDualSweep == True): #If set to auto vertical scale (!from file) and dual-sweep is on...
-        print("Course-scan completed successfully.");
-        if (not getFineScale(fmeas, imeas, omeas, meas3, meas4)): #Get fine-res sample freqs/ampls
+        #Perform measurements (If set to auto-vertical scale dual-auto-sweep, this will be the crude sweep)
+        if (not cachedPass and not measBench(True)): #'True' says to do the crude-sweep. This will be ignored if not in automatic & dual-sweep modes.
             # os.system("say Scan fehlgeschlagen -r 150& &>/dev/null &");
-            tk.messagebox.showerror("Scan Failed!", "Failed to determine fine-resolution vertical scales.");
+            tk.messagebox.showerror("Scan Failed!", "Failed to complete measurements.");
             return False;
 
-        #Clear buffers
-        fmeas =[];
-        omeas = [];
-        imeas = [];
-        meas3 = [];
-        meas4 = [];
 
-        if (not meas(fmeas, imeas, omeas, meas3, meas4, False)): #'False' says to do the fine-sweep.
-            # os.system("say Scan fehlgeschlagen -r 150& &>/dev/null &");
-            tk.messagebox.showerror("Scan Failed!", "Failed to complete fine-resolution measurements.");
-            return False;
-        print("Fine-resolution scan completed successfully.");
-    else:
-        print("Scan completed successfully.");
+
+        #Zero-in on vertical-scale if set to dual-sweep
+        if (cachedPass):
+            print("Fine-resolution scan completed successfully (cached scales).");
+        elif (aquisitionMode.get() == 0 and autoDualSweep == True and not predictiveAutoscale): #If set to auto vertical scale (!from file) and dual-sweep is on...
+            print("Course-scan completed successfully.");
+            if (not getFineScale(bench, scanSettings())): #Get fine-res sample freqs/ampls
+                # os.system("say Scan fehlgeschlagen -r 150& &>/dev/null &");
+                tk.messagebox.showerror("Scan Failed!", "Failed to determine fine-resolution vertical scales.");
+                return False;
+
+            #Clear buffers
+            bench.clear();
+
+            if (not measBench(False)): #'False' says to do the fine-sweep.
+                # os.system("say Scan fehlgeschlagen -r 150& &>/dev/null &");
+                tk.messagebox.showerror("Scan Failed!", "Failed to complete fine-resolution measurements.");
+                return False;
+            print("Fine-resolution scan completed successfully.");
+        else:
+            print("Scan completed successfully.");
+
+        #Fill in the coarse grid where the TF isn't resolved by it
+        if (scale.get() == 4 and (scanMode.get() == 1 or scanMode.get() == 2)):
+            if (not refineAdaptive()):
+                tk.messagebox.showerror("Scan Failed!", "Failed to complete adaptive measurements.");
+                return False;
+            print("Adaptive scan completed successfully (" + str(len(bench.fmeas)) + " points).");
+
+    #The scan's results
+    fmeas, imeas, omeas, meas3, meas4 = bench.fmeas, bench.imeas, bench.omeas, bench.meas3, bench.meas4;
+    pointStatus = bench.pointStatus;
 
     duration = (time.time() - scan_start);
     if (voiceAlerts):
@@ -623,6 +641,21 @@ def scan():
         "19 Punkte in 5 Sekunden gescannt"
 
     print("Scan time: " + str(duration) + " sec");
+    print("Scan rate: " + str(len(fmeas)/duration) + " points/sec");
+    print("Redundant instrument writes skipped: " + str(scope.skipped + awg.skipped));
+    print(bench.timing.summary());
+    if (timingFile != ""):
+        bench.timing.export(timingFile);
+
+    if (bench.settleProfile is not None): #Keep what was learned for the next scan of this DUT type
+        bench.settleProfile.save();
+    if (scaleKey is not None and not ((chirpSweep or multisineExcitation) and (scanMode.get() == 1 or scanMode.get() == 2))): #Keep the scales for the next scan of this DUT type
+        if (predictiveAutoscale):
+            if (len(bench.pointScaleLog) == len(freqs)):
+                storeScales(scaleKey, dutProfile, {c: [bench.pointScaleLog[i][c] for i in range(len(freqs))] for c in bench.outputChannels()});
+        elif (autoDualSweep == True):
+            fineScales = {2: bench.fineScaleCh2, 3: bench.fineScaleCh3, 4: bench.fineScaleCh4};
+            storeScales(scaleKey, dutProfile, {c: fineScales[c] for c in bench.outputChannels()});
 
     #Add to graph
     if (scanMode.get() == 0):
@@ -636,6 +669,11 @@ def scan():
         print("Plotting:")
         print("\tFreqs: " + str(fmeas));
         print("\tGains:" + str(gains));
+    elif(scanMode.get() == 3): #One TF per amplitude
+        gains = denseGrid(np.multiply(20, np.log10(np.divide(omeas, imeas))).tolist(), gridOrder, len(gridFreqs), len(gridAmpls));
+        for ai in range(len(gridAmpls)):
+            plot.semilogx(gridFreqs, gains[ai], linestyle='dashed', marker='o', markersize=3, label=str(gridAmpls[ai]) + " Vpp");
+        plot.legend();
 
     #Save results
     if (scanMode.get() == 0 or scanMode.get() == 1):
@@ -648,6 +686,9 @@ def scan():
             omeasSave = [];
             meas3Save = [];
             meas4Save = [];
+            statusSave = [];
+            timingSave = [];
+            phaseSave = [];
 
         #Append results to save buffers
         fmeasSave.append(fmeas);
@@ -655,6 +696,22 @@ def scan():
         omeasSave.append(omeas);
         meas3Save.append(meas3);
         meas4Save.append(meas4);
+        statusSave.append(pointStatus if len(pointStatus) == len(fmeas) else ["ok"]*len(fmeas)); #Chirp & multisine scans don't set point statuses
+        timingSave.append(bench.timing);
+        phaseSave.append(phases);
+
+    elif (scanMode.get() == 3): #2-D sweep: put the points back on the grid
+
+        if (not saveUntilClear):
+            print("Wiping last data set");
+            gridSave = [];
+
+        nf, na = len(gridFreqs), len(gridAmpls);
+        gridSave.append({"grid_freqs": gridFreqs, "grid_ampls": gridAmpls,
+                         "freqs": denseGrid(fmeas, gridOrder, nf, na), "in_vpp": denseGrid(imeas, gridOrder, nf, na),
+                         "out_vpp": denseGrid(omeas, gridOrder, nf, na), "ch3_vpp": denseGrid(meas3, gridOrder, nf, na),
+                         "ch4_vpp": denseGrid(meas4, gridOrder, nf, na), "status": denseGrid(pointStatus, gridOrder, nf, na, "missing"),
+                         "timing": bench.timing});
 
     #Get band & gain & update status panels
     elif (scanMode.get() == 2): #Only if multiband update status panels
@@ -755,12 +812,43 @@ def scan():
         executeAutoNext();
 
 #
-# Reads the GUI to determine the sample frequencies or amplitudes
+# Reads the GUI to determine the sample frequencies or amplitudes. Point files
+# the new plan doesn't read from (all of them if it couldn't be read) are
+# closed before returning.
 #
 def getSampleFreqsAmpls():
+    for pts in (freqs, ampls): #Close the previous plan's point files
+        if (isinstance(pts, PointColumn)):
+            pts.source.close();
+
+    opened = []; #Point files opened for the new plan
+    ok = False;
+    try:
+        ok = readSampleFreqsAmpls(opened);
+    finally:
+        for pf in opened:
+            if (not ok or not any(isinstance(pts, PointColumn) and pts.source is pf for pts in (freqs, ampls))):
+                pf.close();
+    return ok;
+
+#
+# Opens the point file 'fn' (see pointfile.py) and adds it to the list 'opened'
+#
+def openPointFile(fn, opened):
+    pf = PointFile(fn);
+    opened.append(pf);
+    return pf;
+
+#
+# Sets the sample frequencies and amplitudes from the GUI (see
+# getSampleFreqsAmpls()), adding the point files it opens to 'opened'
+#
+def readSampleFreqsAmpls(opened):
     global freqs, ampls;
+    global adaptiveBudget;
+    global gridFreqs, gridAmpls, gridOrder;
 
-    if (scanMode.get() == 1 or scanMode.get() == 2): #Frequency is indep-var
+    if (scanMode.get() == 1 or scanMode.get() == 2 or scanMode.get() == 3): #Frequency is indep-var (or the first axis of a 2-D sweep)
         if scale.get() == 0: #Linear
             try:
                 a = (float(scaleNumberEntry0.get()));
@@ -797,9 +885,32 @@ def getSampleFreqsAmpls():
                 return False;
             freqs = np.logspace(a, b, c)
             print(a, b, c);
-        elif scale.get() == 2: #From File
-            print("Note: Frequencies from file are not yet supported.");
-            return False;
+        elif scale.get() == 2: #From File (read lazily, see pointfile.py)
+            try:
+                freqs, fileAmpls = openPointFile(scaleFileEntry.get(), opened).plan(True);
+            except (OSError, ValueError) as e:
+                print("Failed to read sample point file (" + str(e) + ")");
+                return False;
+            if (freqs is None):
+                print("Sample point file '" + scaleFileEntry.get() + "' has no frequencies");
+                return False;
+        elif scale.get() == 4: #Adaptive: coarse log grid, refined after it's measured (see refineAdaptive())
+            try:
+                a = np.log10(float(scaleNumberEntry0.get()));
+            except:
+                print("Failed to read start frequency ("+scaleNumberEntry0.get()+")");
+                return False;
+            try:
+                b = np.log10(float(scaleNumberEntry2.get()));
+            except:
+                print("Failed to read end frequency ("+scaleNumberEntry2.get()+")");
+                return False;
+            try:
+                adaptiveBudget = int(scaleNumberEntry1.get());
+            except:
+                print("Failed to read number of frequency steps ("+scaleNumberEntry1.get()+")");
+                return False;
+            freqs = np.logspace(a, b, max(2, min(adaptiveCoarsePoints, adaptiveBudget))).tolist();
         elif scale.get() == 3: #From entry
             try:
                 freqstr = scaleListEntry.get().split(",");
@@ -810,20 +921,55 @@ def getSampleFreqsAmpls():
                 print("Failed to read frequency entries");
                 return False;
 
-        fstr = "";
-        for f in freqs:
-            fstr = fstr+ str(round(f)) + " ";
-        print("Frequencies: " + fstr)
-
-        amp_dflt = 0;
-        try:
-            amp_dflt = float(genNumberEntry0.get())
-        except:
-            print("Failed to read amplitude entry");
-            return False;
-        ampls = [];
-        for i in range(len(freqs)):
-            ampls.append(amp_dflt);
+        if (len(freqs) > 100): #ie. a long test plan from a file
+            print("Frequencies: " + str(len(freqs)) + " from " + str(round(freqs[0])) + " to " + str(round(freqs[-1])));
+        else:
+            fstr = "";
+            for f in freqs:
+                fstr = fstr+ str(round(f)) + " ";
+            print("Frequencies: " + fstr)
+
+        if (scanMode.get() == 3): #Frequency x amplitude grid, measured along a serpentine path (see grid2d.py)
+            if (scale.get() == 4):
+                print("Note: Adaptive sampling is not supported in 2-D sweeps.");
+                return False;
+            try:
+                gridAmpls = [float(a) for a in genGridEntry.get().split(",")];
+            except:
+                print("Failed to read 2-D sweep amplitudes ("+genGridEntry.get()+")");
+                return False;
+            gridFreqs = [float(f) for f in freqs];
+            gridOrder = serpentineOrder(len(gridFreqs), len(gridAmpls));
+            freqs, ampls = flattenGrid(gridFreqs, gridAmpls, gridOrder);
+            print("Amplitudes: " + " ".join(str(round(a, 3)) for a in gridAmpls) + " (" + str(len(freqs)) + " points)");
+        elif (genAmplMode.get() == 1): #Amplitude of each point from a file
+            try:
+                fileFreqs, ampls = openPointFile(genFileEntry.get(), opened).plan(False);
+            except (OSError, ValueError) as e:
+                print("Failed to read amplitude file (" + str(e) + ")");
+                return False;
+            if (ampls is None):
+                print("Amplitude file '" + genFileEntry.get() + "' has no amplitudes");
+                return False;
+            errors = checkFrequencies(freqs, fileFreqs) if (fileFreqs is not None) else ([] if len(ampls) == len(freqs) else ["The amplitude file has " + str(len(ampls)) + " points but the scan has " + str(len(freqs))]);
+            if (len(errors) > 0):
+                print("Amplitude file doesn't match the sample points:\n\t" + "\n\t".join(errors));
+                return False;
+        elif (scale.get() == 2 and fileAmpls is not None): #Amplitudes paired with the frequencies
+            ampls = fileAmpls;
+        else:
+            amp_dflt = 0;
+            try:
+                amp_dflt = float(genNumberEntry0.get())
+            except:
+                print("Failed to read amplitude entry");
+                return False;
+            if (scale.get() == 2):
+                ampls = RepeatedValue(amp_dflt, len(freqs));
+            else:
+                ampls = [];
+                for i in range(len(freqs)):
+                    ampls.append(amp_dflt);
 
     else: #Amplitude is indep-var
         freqs=[]; #Clear the frequencies - this tells the program it is in amplitude mode
@@ -861,8 +1007,17 @@ def getSampleFreqsAmpls():
                 print("Failed to read number of amplitude steps ("+scaleNumberEntry1.get()+")");
                 return False;
             ampls = np.logspace(a, b, c)
-        elif scale.get() == 2: #From File
-            print("Note: Frequencies from file are not yet supported.");
+        elif scale.get() == 2: #From File (read lazily, see pointfile.py)
+            try:
+                fileFreqs, ampls = openPointFile(scaleFileEntry.get(), opened).plan(False);
+            except (OSError, ValueError) as e:
+                print("Failed to read sample point file (" + str(e) + ")");
+                return False;
+            if (ampls is None):
+                print("Sample point file '" + scaleFileEntry.get() + "' has no amplitudes");
+                return False;
+        elif scale.get() == 4: #Adaptive
+            print("Note: Adaptive sampling is only supported in frequency modes.");
             return False;
         elif scale.get() == 3: #From entry
             try:
@@ -874,22 +1029,35 @@ def getSampleFreqsAmpls():
                 print("Failed to read frequency entries");
                 return False;
 
-        fstr = "";
-        for f in ampls:
-            fstr = fstr+ str(round(f, 3)) + " ";
-        print("Amplitudes: " + fstr)
-
-        freq_dflt = 0;
-        try:
-            freq_dflt = float(genListEntry.get());
-        except:
-            print("Failed to read amplitude entry");
-            return False;
-        freqs = [];
-        for i in range(len(ampls)):
-            freqs.append(freq_dflt);
+        if (len(ampls) > 100): #ie. a long test plan from a file
+            print("Amplitudes: " + str(len(ampls)) + " from " + str(round(ampls[0], 3)) + " to " + str(round(ampls[-1], 3)));
+        else:
+            fstr = "";
+            for f in ampls:
+                fstr = fstr+ str(round(f, 3)) + " ";
+            print("Amplitudes: " + fstr)
 
+        if (scale.get() == 2 and fileFreqs is not None): #Frequencies paired with the amplitudes
+            freqs = fileFreqs;
+        else:
+            freq_dflt = 0;
+            try:
+                freq_dflt = float(genListEntry.get());
+            except:
+                print("Failed to read amplitude entry");
+                return False;
+            if (scale.get() == 2):
+                freqs = RepeatedValue(freq_dflt, len(ampls));
+            else:
+                freqs = [];
+                for i in range(len(ampls)):
+                    freqs.append(freq_dflt);
 
+    #Check every point before the sweep starts so it can't stop at one the generator can't output
+    errors = checkLimits(freqs, ampls, genFreqRange, genAmplRange);
+    if (len(errors) > 0):
+        print("Invalid sample points:\n\t" + "\n\t".join(errors));
+        return False;
 
     return True
 
@@ -916,16 +1084,49 @@ def save():
                 kvs = assemble_kvar(kvs, "out_vpp"+str(idx), omeasSave[idx]); #Save output data array
                 kvs = assemble_kvar(kvs, "ch3_vpp"+str(idx), meas3Save[idx]); #Save ch3 data array
                 kvs = assemble_kvar(kvs, "ch4_vpp"+str(idx), meas4Save[idx]); #Save ch4 data array
+                if (deferFailedPoints):
+                    kvs = assemble_kvar(kvs, "status"+str(idx), statusSave[idx]); #Save which points were re-measured or are missing
+                for key, vals in timingSave[idx].columns().items(): #Save where each point's time went (one value per attempt)
+                    kvs = assemble_kvar(kvs, "timing_"+key+str(idx), vals);
+                for c, vals in phaseSave[idx].items(): #Save the phase of each output channel (chirp scans)
+                    kvs = assemble_kvar(kvs, phaseNames[c]+str(idx), vals);
             write_assembled_kvar(fn, kvs);
             print("Wrote: "+kvs);
         else:
             print("Saving last TF");
+            columnVars = {"timing_"+key: vals for key, vals in timingSave[0].columns().items()}; #Per-point timing and (chirp scans) phase columns
+            columnVars.update({phaseNames[c]: vals for c, vals in phaseSave[0].items()});
             try:
-                write_kvar(fn,hd, freqs=fmeasSave[0], in_vpp=imeasSave[0], out_vpp=omeasSave[0], ch3_vpp=meas3Save[0], ch4_vpp=meas4Save[0]);
+                if (deferFailedPoints):
+                    write_kvar(fn,hd, freqs=fmeasSave[0], in_vpp=imeasSave[0], out_vpp=omeasSave[0], ch3_vpp=meas3Save[0], ch4_vpp=meas4Save[0], status=statusSave[0], **columnVars);
+                else:
+                    write_kvar(fn,hd, freqs=fmeasSave[0], in_vpp=imeasSave[0], out_vpp=omeasSave[0], ch3_vpp=meas3Save[0], ch4_vpp=meas4Save[0], **columnVars);
             except Exception as e:
                 print("Failed to save data.");
                 print("\t"+str(e));
                 return;
+    elif (scanMode.get() == 3): #2-D sweeps: each array is saved row by row (one row per amplitude of 'grid_ampls')
+        if (len(gridSave) == 0):
+            print("No 2-D sweep to save.");
+            return;
+        kvs = begin_kvar(hd);
+        for idx in range(len(gridSave)):
+            suffix = str(idx) if (saveUntilClear) else "";
+            for key, value in gridSave[idx].items():
+                if (key == "status" and not deferFailedPoints):
+                    continue;
+                if (key == "timing"): #One value per attempt, in the order measured
+                    for tkey, vals in value.columns().items():
+                        kvs = assemble_kvar(kvs, "timing_"+tkey+suffix, vals);
+                    continue;
+                vals = [float(v) for v in value] if (type(value) == list) else [(v if type(v) == str else float(v)) for v in value.flatten()];
+                kvs = assemble_kvar(kvs, key+suffix, vals);
+        try:
+            write_assembled_kvar(fn, kvs);
+        except Exception as e:
+            print("Failed to save data.");
+            print("\t"+str(e));
+            return;
     else:
         print("Oh no! This isn't implimented yet!");
         return;
@@ -995,6 +1196,10 @@ def setScan2():
     enableMultibands();
     setToFreqMode();
 
+def setScan3():
+    disableMultibands();
+    setToFreqMode();
+
 def disableMultibands():
     bandEntryBandRB1.configure(state = tk.DISABLED)
     bandEntryBandRB2.configure(state = tk.DISABLED)
@@ -1054,6 +1259,19 @@ def enableMultibands():
 
     pass;
 
+#
+# Removes the cached vertical scales (see scalecache.py) of the DUT profile, or
+# of every DUT if no profile is set, so the next scan finds them again
+#
+def forgetCachedScales():
+
+    who = ("'" + dutProfile + "'") if (dutProfile != "") else "every DUT";
+    if (not tk.messagebox.askokcancel("Forget Scales", "Forget the cached vertical scales of " + who + "?")):
+        return;
+
+    n = clearScaleCache(dutProfile if (dutProfile != "") else None);
+    print("Removed " + str(n) + " cached scale set(s) of " + who + ".");
+
 def clearAllBands():
 
     #Verify action
@@ -1143,7 +1361,7 @@ ctrl.title("Rip Scanner");
 
 modeFrame = tk.Frame(ctrl, relief=tk.RAISED, bd=1);
 modeLabel = tk.Label(modeFrame, text="Scanner:", font='LARGE_FONT');
-modeLabel.grid(row=0, column=0, columnspan=4);
+modeLabel.grid(row=0, column=0, columnspan=5);
 
 scanModeLabel = tk.Label(modeFrame, text="Scanned Param.:");
 scanModeLabel.grid(row=1, column=0, sticky='E');
@@ -1155,6 +1373,8 @@ scanModeRB2 = tk.Radiobutton(modeFrame, text="Freq.", variable=scanMode, value=1
 scanModeRB2.grid(row=1, column=2, stick='W');
 scanModeRB3 = tk.Radiobutton(modeFrame, text="Freq. (multi-band)", variable=scanMode, value=2, command=setScan2);
 scanModeRB3.grid(row=1, column=3, stick='W');
+scanModeRB4 = tk.Radiobutton(modeFrame, text="Freq. x Ampl.", variable=scanMode, value=3, command=setScan3);
+scanModeRB4.grid(row=1, column=4, stick='W');
 
 ch3on = tk.IntVar();
 ch4on = tk.IntVar();
@@ -1318,6 +1538,11 @@ genListLabel.grid(row=4, column=1, sticky='E');
 genListEntry = tk.Entry(genFrame, width=13);
 genListEntry.grid(row=4, column=2, sticky='W');
 
+genGridLabel = tk.Label(genFrame, text="2-D ampls. (Vpp): ");
+genGridLabel.grid(row=5, column=1, sticky='E');
+genGridEntry = tk.Entry(genFrame, width=18);
+genGridEntry.grid(row=5, column=2, sticky='W');
+
 ##dfltFreqLabel = tk.Label(genFrame, text="Dflt Frequency: ");
 ##dfltFreqLabel.grid(row=1, column=0);
 ##dfltFreqEntry = tk.Entry(genFrame, width=10);
@@ -1356,6 +1581,8 @@ scaleRB3 = tk.Radiobutton(scaleFrame, text="From file", variable=scale, value=2)
 scaleRB3.grid(row=3, column=0, sticky='W')
 scaleRB4 = tk.Radiobutton(scaleFrame, text="From list", variable=scale, value=3);
 scaleRB4.grid(row=4, column=0, sticky='W')
+scaleRB5 = tk.Radiobutton(scaleFrame, text="Adaptive", variable=scale, value=4);
+scaleRB5.grid(row=5, column=0, sticky='W')
 
 scaleNumberFrame = tk.Frame(scaleFrame, relief='sunken');
 scaleNumberLabel0 = tk.Label(scaleNumberFrame, text="Start:");
@@ -1481,6 +1708,10 @@ highMinBandScanLabel.grid(row=3, column=5, sticky='W');
 clearAllButton = tk.Button(scanStatusFrame, text="Clear", bg='red', command=clearAllBands);
 clearAllButton.grid(row=4, column=5);
 
+#Forget cached scales button
+forgetScalesButton = tk.Button(scanStatusFrame, text="Forget Scales", command=forgetCachedScales);
+forgetScalesButton.grid(row=4, column=3, columnspan=2);
+
 scanStatusFrame.grid(row=5, column=0);
 
 scanButton=tk.Button(ctrl, text='Scan', width=8, command=scan, bg='blue', fg='white');
@@ -1540,5 +1771,7 @@ genListEntry.insert(0, 1e3); #Set default frequency to 1KHz
 ctrl.mainloop();
 
 #Disconnect from test equipment when program is finished running
-scope.close();
-awg.close();
+if (scope is not None):
+    scope.close();
+if (awg is not None):
+    awg.close();
@@ -0,0 +1,89 @@
+# This file defines the persistent cache of the vertical scales chosen for each
+# point of a scan. Repeat scans of the same board type over the same grid end up
+# with the same scales, so the scales found last time are kept in a small file
+# and used to go straight to the final (fine) measurement. A scan only falls
+# back to finding the scales again if a point overranges with the cached ones.
+#
+# Entries are keyed by the DUT profile, the scan mode, the frequency and
+# amplitude grid, the band/gain setting and the channels used, so changing any
+# of them misses the cache. clearScaleCache() removes a profile's entries (or
+# every entry) when the hardware changed.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from scalecache import *'.
+#
+# Example Usage:
+#	key = scaleCacheKey("GEQ-rev3", 1, freqs, ampls, None, [2, 3]);
+#	scales = lookupScales(key); #{2: [...], 3: [...]} or None
+#	storeScales(key, "GEQ-rev3", {2: fineScaleCh2, 3: fineScaleCh3});
+#
+
+import hashlib
+import json
+import os
+
+from jsonstore import loadDict, saveDict
+
+#Default file in which the scales are cached
+defaultScaleCacheFile = os.path.join(os.path.expanduser("~"), ".ripscanner_scales.json");
+
+#
+# Returns the cache key of a scan of DUT profile 'profile' in scan mode 'mode'
+# over the frequencies 'freqs' and amplitudes 'ampls', with the band/gain
+# setting 'band' (None if not in a multiband mode) and output channels 'chans'.
+#
+def scaleCacheKey(profile, mode, freqs, ampls, band, chans):
+    desc = [profile, mode, [float("{:.6g}".format(f)) for f in freqs], [float("{:.6g}".format(a)) for a in ampls], band, sorted(chans)];
+    return hashlib.sha1(json.dumps(desc).encode('ascii')).hexdigest();
+
+#
+# Reads the cache file 'fn'. Returns a dict of entries ({"profile": name,
+# "scales": {channel: [V/div per point]}}) keyed by cache key, or an empty dict
+# if the file doesn't exist or can't be read (see jsonstore.py).
+#
+def loadScaleCache(fn=defaultScaleCacheFile):
+    return loadDict(fn);
+
+#
+# Writes the dict 'cache' (see loadScaleCache()) to the file 'fn'
+#
+def saveScaleCache(cache, fn=defaultScaleCacheFile):
+    saveDict(cache, fn, "scale cache");
+
+#
+# Returns the cached scales for 'key' as a dict of lists (V/div per point)
+# keyed by channel no., or None if there are none.
+#
+def lookupScales(key, fn=defaultScaleCacheFile):
+    entry = loadScaleCache(fn).get(key);
+    if (entry is None):
+        return None;
+    return {int(c): s for c, s in entry["scales"].items()};
+
+#
+# Caches 'scales' (a dict of lists of V/div keyed by channel no.) under 'key'
+# for the DUT profile 'profile'
+#
+def storeScales(key, profile, scales, fn=defaultScaleCacheFile):
+    cache = loadScaleCache(fn);
+    cache[key] = {"profile": profile, "scales": {str(c): list(s) for c, s in scales.items()}};
+    saveScaleCache(cache, fn);
+
+#
+# Removes the entry 'key' from the cache file 'fn'
+#
+def forgetScales(key, fn=defaultScaleCacheFile):
+    cache = loadScaleCache(fn);
+    if (key in cache):
+        del cache[key];
+        saveScaleCache(cache, fn);
+
+#
+# Removes every entry of the DUT profile 'profile' (or every entry if 'profile'
+# is None) from the cache file 'fn'. Returns the no. entries removed.
+#
+def clearScaleCache(profile=None, fn=defaultScaleCacheFile):
+    cache = loadScaleCache(fn);
+    keep = {k: e for k, e in cache.items() if profile is not None and e.get("profile") != profile};
+    saveScaleCache(keep, fn);
+    return len(cache) - len(keep);
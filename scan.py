@@ -1,30 +1,32 @@
+from scpi import CommandQueue
+from discovery import connectInstruments
+
 #
 # Initializes the test equipment and sets them up to
 # scan or generate the appropriate signals.
 #
 def initializeTestEquipment():
 	rm = visa.ResourceManager()
-	# Get the USB device, e.g. 'USB0::0x1AB1::0x0588::DS1ED141904883'
-	instruments = rm.list_resources()
-	scope_addr = list(filter(lambda x: 'DS1Z' in x, instruments))
-	awg_addr = list(filter(lambda x: 'SDG2X' in x, instruments))
-	if len(scope_addr) != 1 or len(awg_addr) != 1:
-		print('Bad instrument list', instruments)
+	# Get the USB device, e.g. 'USB0::0x1AB1::0x0588::DS1ED141904883' (resource strings are cached between runs)
+	try:
+		scope, awg = connectInstruments(rm, ["DS1Z", "SDG2X"], timeout=30, chunk_size=1024) # bigger timeout for long mem
+	except IOError as e:
+		print(e)
 		sys.exit(-1)
-	scope = rm.open_resource(scope_addr[0], timeout=30, chunk_size=1024) # bigger timeout for long mem
 	print("Connected to scope");
-	awg = rm.open_resource(awg_addr[0], timeout=30, chunk_size=1024) # bigger timeout for long mem
 	print("Connected to generator");
 
 	#Initialize oscilloscope to collect data
-	#scope.write("MEAS:COUN:SOUR CHAN1");
-	scope.write("MEAS:STAT:ITEM FREQ,CHAN1");
-	#scope.write("MEAS:STAT:ITEM VRMS,CHAN1");
-	#scope.write("MEAS:STAT:ITEM VRMS,CHAN2");
-	scope.write("MEAS:STAT:ITEM VPP,CHAN1");
-	scope.write("MEAS:STAT:ITEM VPP,CHAN2");
-	scope.write("MEAS:STAT:ITEM VAVG,CHAN3");
-	scope.write("MEAS:STAT:ITEM VAVG,CHAN4");
+	init = CommandQueue();
+	#init.write(scope, "MEAS:COUN:SOUR CHAN1");
+	init.write(scope, "MEAS:STAT:ITEM FREQ,CHAN1");
+	#init.write(scope, "MEAS:STAT:ITEM VRMS,CHAN1");
+	#init.write(scope, "MEAS:STAT:ITEM VRMS,CHAN2");
+	init.write(scope, "MEAS:STAT:ITEM VPP,CHAN1");
+	init.write(scope, "MEAS:STAT:ITEM VPP,CHAN2");
+	init.write(scope, "MEAS:STAT:ITEM VAVG,CHAN3");
+	init.write(scope, "MEAS:STAT:ITEM VAVG,CHAN4");
+	init.flush();
 
 #
 #
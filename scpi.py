@@ -0,0 +1,353 @@
+# This file defines the SCPI helper layer shared by ripscanner.py, scan.py and
+# cli_scanner.py. It sits between the scanner and the pyvisa resources for the
+# oscilloscope and generator and is responsible for keeping the number of VISA
+# transactions (USB round trips) per sample point as small as possible.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from scpi import *'.
+#
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+#
+# A single reading of the scope. 'freq' is the CH1 frequency in Hz, 'ch1'-'ch4'
+# are the measured values (Vpp unless an aux. measurement was selected) of each
+# channel. Channels which were not read are reported as 0.
+#
+MeasRecord = namedtuple('MeasRecord', ['freq', 'ch1', 'ch2', 'ch3', 'ch4']);
+
+#Number of VISA transactions issued since the last call to resetRoundTrips(). Private
+#so 'from scpi import *' can't leave a stale copy of it - read it with getRoundTrips().
+_roundTrips = 0;
+
+#
+# Resets the round trip counter (call at the start of each sample point)
+#
+def resetRoundTrips():
+    global _roundTrips;
+    _roundTrips = 0;
+
+#
+# Returns the number of transactions issued since the last call to resetRoundTrips()
+#
+def getRoundTrips():
+    return _roundTrips;
+
+#
+# Adds 'n' transactions to the round trip counter
+#
+def countRoundTrip(n=1):
+    global _roundTrips;
+    _roundTrips += n;
+
+#
+# Concatenates the queries in the list 'queries' into one SCPI program message,
+# sends it to 'inst' in a single transaction and returns the replies as a list
+# of floats (in the same order as 'queries'). Raises ValueError if the number of
+# values in the reply doesn't match the number of queries.
+#
+# Example Usage:
+#	fr, vpp = batchQuery(scope, ["MEAS:STAT:ITEM? CURR,FREQ,CHAN1", "MEAS:STAT:ITEM? CURR,VPP,CHAN1"]);
+#
+def batchQuery(inst, queries):
+    msg = ";".join(":"+q.lstrip(":") for q in queries);
+    with instLock(inst):
+        reply = inst.query(msg);
+    countRoundTrip();
+
+    vals = reply.strip().split(";");
+    if (len(vals) != len(queries)):
+        raise ValueError("Expected " + str(len(queries)) + " values in reply, received " + str(len(vals)) + " ('" + reply.strip() + "')");
+
+    return [float(v) for v in vals];
+
+#
+# Returns the measurement read from an aux. channel given the 'ch3'/'ch4'
+# argument of readMeasurements(): None if the channel is off, 'VPP' if it's
+# True, otherwise the measurement named (ie. 'VAVG' or 'Vavg').
+#
+def auxItem(ch):
+    if (ch is None or ch is False):
+        return None;
+    if (ch is True):
+        return "VPP";
+    return str(ch).upper();
+
+#
+# Returns the MEAS:STAT:ITEM? queries of one reading for statistic 'item': CH1
+# frequency, CH1 & CH2 Vpp and each enabled aux. channel's measurement
+#
+def measurementQueries(item, ch3=False, ch4=False):
+    queries = ["MEAS:STAT:ITEM? "+item+",FREQ,CHAN1", "MEAS:STAT:ITEM? "+item+",VPP,CHAN1", "MEAS:STAT:ITEM? "+item+",VPP,CHAN2"];
+    if (auxItem(ch3) is not None):
+        queries.append("MEAS:STAT:ITEM? "+item+","+auxItem(ch3)+",CHAN3");
+    if (auxItem(ch4) is not None):
+        queries.append("MEAS:STAT:ITEM? "+item+","+auxItem(ch4)+",CHAN4");
+    return queries;
+
+#
+# Reads the frequency of CH1 and the Vpp of CH1 & CH2 (plus CH3 and CH4 if
+# 'ch3' or 'ch4' are set) from the scope's measurement statistics in a single
+# round trip. 'ch3'/'ch4' are True to read the channel's Vpp, or the name of
+# the aux. measurement to read (ie. 'VAVG'). 'item' is the statistic to read
+# (CURR, AVER, MIN, MAX, DEV, CNT). Returns a MeasRecord.
+#
+def readMeasurements(scope, ch3=False, ch4=False, item="CURR"):
+    vals = batchQuery(scope, measurementQueries(item, ch3, ch4));
+
+    c3 = vals[3] if auxItem(ch3) is not None else 0;
+    c4 = vals[-1] if auxItem(ch4) is not None else 0;
+
+    return MeasRecord(vals[0], vals[1], vals[2], c3, c4);
+
+#
+# Reads several statistics of the measurements read by readMeasurements() in a
+# single round trip. 'items' lists the statistics to read (ie. AVER, DEV, CNT).
+# Returns a dict of MeasRecords keyed by statistic.
+#
+# Example Usage:
+#	stats = readStatistics(scope);
+#	print(stats["DEV"].ch2/stats["AVER"].ch2);
+#
+def readStatistics(scope, ch3=False, ch4=False, items=("AVER", "DEV", "CNT")):
+    queries = [];
+    for item in items:
+        queries += measurementQueries(item, ch3, ch4);
+
+    vals = batchQuery(scope, queries);
+
+    stats = {};
+    n = len(queries)//len(items);
+    for i in range(len(items)):
+        v = vals[i*n:(i+1)*n];
+        stats[items[i]] = MeasRecord(v[0], v[1], v[2], v[3] if auxItem(ch3) is not None else 0, v[-1] if auxItem(ch4) is not None else 0);
+    return stats;
+
+#
+# Returns the name used when echoing SCPI commands sent to 'inst'
+#
+def instName(inst):
+    if (isinstance(inst, ShadowInstrument)):
+        return inst.name;
+    return str(getattr(inst, "resource_name", "INST"));
+
+#
+# Wraps a pyvisa resource and remembers the last value committed for each
+# setting written through 'setting()', so writes which wouldn't change the
+# instrument's state (and would make the scope re-arm and re-settle) are
+# skipped. All other attributes (query(), write(), close(), ...) are passed
+# through to the wrapped resource.
+#
+# Example Usage:
+#	scope = ShadowInstrument(rm.open_resource(addr), "SCOPE");
+#	scope.setting("TIM:MAIN:SCAL ", 1e-3); #Written
+#	scope.setting("TIM:MAIN:SCAL ", 1e-3); #Skipped
+#
+class ShadowInstrument:
+
+    def __init__(self, inst, name):
+        self.inst = inst; #Wrapped pyvisa resource
+        self.name = name; #Name used when echoing SCPI commands
+        self.state = {}; #Last value committed for each setting header
+        self.skipped = 0; #No. writes skipped since the last call to invalidate()
+
+    def __getattr__(self, attr):
+        return getattr(self.inst, attr);
+
+    #
+    # Writes 'header'+'value' to the instrument unless 'value' is the last value
+    # committed for 'header'. 'header' includes the separator between the command
+    # and the value (ie. "C2:BSWV FRQ," or "CHAN1:SCAL "). Returns True if the
+    # command was written. The write holds the instrument's lock (see instLock())
+    # so it can't interleave with a concurrent flush or another thread.
+    #
+    def setting(self, header, value):
+        if (self.isCurrent(header, value)):
+            self.skipped += 1;
+            return False;
+
+        with instLock(self):
+            self.inst.write(header + str(value));
+            self.commit(header, value); #Only remember the value once it has been written
+        print("SCPI<" + self.name + "> " + header + str(value));
+        return True;
+
+    #
+    # Returns True if 'value' is the last value committed for 'header'
+    #
+    def isCurrent(self, header, value):
+        return self.state.get(header) == str(value);
+
+    #
+    # Records that 'value' has been written to the instrument for 'header'
+    #
+    def commit(self, header, value):
+        self.state[header] = str(value);
+
+    #
+    # Writes 'cmd' directly, forgetting any shadowed setting it might change.
+    #
+    def write(self, cmd):
+        with instLock(self):
+            self.forget(cmd);
+            return self.inst.write(cmd);
+
+    #
+    # Forgets any shadowed setting the command 'cmd' might change
+    #
+    def forget(self, cmd):
+        for header in list(self.state):
+            if (cmd.lstrip(":").startswith(header.rstrip(" ,"))):
+                del self.state[header];
+
+    #
+    # Forgets all shadowed settings so the next value of each setting is always
+    # written (call if the instrument may have been changed from its front panel).
+    #
+    def invalidate(self):
+        self.state = {};
+        self.skipped = 0;
+
+#
+# Collects the configuration commands for a sample point and sends them as one
+# semicolon-joined program message per instrument, ending each message with a
+# single '*OPC?' so flush() returns only once every instrument has finished
+# applying its settings. Settings written to a ShadowInstrument are skipped if
+# they wouldn't change the instrument's state. Works with plain pyvisa resources
+# as well (ie. from scan.py and cli_scanner.py).
+#
+# If 'immediate' is True, commands are written as soon as they are queued and
+# flush() does nothing (the behavior before command coalescing was added).
+#
+# Example Usage:
+#	q = CommandQueue();
+#	q.setting(awg, "C2:BSWV FRQ,", 1e3);
+#	q.setting(scope, "TIM:MAIN:SCAL ", 1e-3);
+#	q.write(scope, "TRIG:MODE EDGE");
+#	q.flush(); #One transaction to the AWG, one to the scope
+#
+class CommandQueue:
+
+    def __init__(self, immediate=False):
+        self.immediate = immediate;
+        self.pending = {}; #Instrument -> list of (command, header, value) to write on flush()
+        self.skipped = 0; #No. settings skipped because they were already current
+        self.durations = {}; #Instrument name -> seconds its last flush() took (incl. the *OPC? barrier)
+
+    #
+    # Queues the setting 'header'+'value' for 'inst' (see ShadowInstrument.setting())
+    #
+    def setting(self, inst, header, value):
+        if (isinstance(inst, ShadowInstrument)):
+            if (self.immediate):
+                return inst.setting(header, value);
+            if (inst.isCurrent(header, value)):
+                inst.skipped += 1;
+                self.skipped += 1;
+                return False;
+        elif (self.immediate):
+            inst.write(header + str(value));
+            return True;
+
+        self.pending.setdefault(inst, []).append((header + str(value), header, value));
+        return True;
+
+    #
+    # Queues the raw command 'cmd' for 'inst'
+    #
+    def write(self, inst, cmd):
+        if (self.immediate):
+            inst.write(cmd);
+            return;
+        self.pending.setdefault(inst, []).append((cmd, None, None));
+
+    #
+    # Sends the queued commands (one transaction per instrument) and waits for
+    # each instrument's '*OPC?' reply. 'timeout' (ms) is the longest the barrier
+    # may take. If 'parallel' is True the instruments are configured at the same
+    # time (ie. the scope's timebase change overlaps with the generator settling).
+    # Returns the number of transactions issued. The time each instrument took
+    # is left in 'durations'.
+    #
+    def flush(self, timeout=5000, parallel=False):
+        items = list(self.pending.items());
+        self.pending = {};
+
+        if (parallel and len(items) > 1):
+            futures = [configPool().submit(timedConfig, inst, cmds, timeout) for inst, cmds in items];
+            replies = [f.result() for f in futures]; #Re-raises any exception from the worker threads
+        else:
+            replies = [timedConfig(inst, cmds, timeout) for inst, cmds in items];
+
+        for i in range(len(items)): #Echo in a fixed order, regardless of which instrument finished first
+            print("SCPI<" + instName(items[i][0]) + "> " + replies[i][0]);
+            self.durations[instName(items[i][0])] = replies[i][1];
+
+        return len(items);
+
+#Thread pool used to configure instruments concurrently (created on first use)
+_configPool = None;
+
+#Lock for each instrument, so only one thread talks to an instrument at a time
+_instLocks = {};
+_instLocksLock = threading.Lock();
+
+#
+# Returns the thread pool used by CommandQueue.flush(parallel=True)
+#
+def configPool():
+    global _configPool;
+    with _instLocksLock:
+        if (_configPool is None):
+            _configPool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="scpi");
+    return _configPool;
+
+#
+# Returns the lock which serializes all I/O with 'inst' (a pyvisa resource or
+# ShadowInstrument - both share the same lock).
+#
+def instLock(inst):
+    res = inst.inst if isinstance(inst, ShadowInstrument) else inst;
+    with _instLocksLock:
+        if (res not in _instLocks):
+            _instLocks[res] = threading.RLock();
+        return _instLocks[res];
+
+#
+# Sends the queued commands 'cmds' (see CommandQueue) to 'inst' as one message
+# ending in '*OPC?' and updates the shadowed state once the reply is received.
+# Returns the message sent (without the barrier).
+#
+def sendConfig(inst, cmds, timeout):
+    msg = ";".join(":"+c[0].lstrip(":") for c in cmds);
+
+    with instLock(inst):
+        #The barrier can take far longer than a normal query (ie. timebase changes)
+        res = inst.inst if isinstance(inst, ShadowInstrument) else inst;
+        old_timeout = res.timeout;
+        res.timeout = max(old_timeout, timeout);
+        try:
+            res.query(msg + ";*OPC?");
+        finally:
+            res.timeout = old_timeout;
+
+        #Update the shadowed state now that the settings have been applied
+        if (isinstance(inst, ShadowInstrument)):
+            for c in cmds:
+                if (c[1] is None):
+                    inst.forget(c[0]);
+                else:
+                    inst.commit(c[1], c[2]);
+
+    return msg;
+
+#
+# Calls sendConfig() and returns the message sent and the time (s) it took
+#
+def timedConfig(inst, cmds, timeout):
+    start = time.time();
+    msg = sendConfig(inst, cmds, timeout);
+    return msg, time.time() - start;
@@ -0,0 +1,319 @@
+# This file defines the statistical settling detector used to decide when a
+# measurement point has reached equilibrium. Rather than waiting a fixed time
+# and comparing two readings, the scope is polled quickly and the most recent
+# readings of every channel are kept in a sliding window. A point is declared
+# settled once, for every channel, the scatter of the window plus the drift
+# still expected from an exponential-decay fit of the window is within the
+# accepted tolerance.
+#
+# The scope's measurement statistics only change once per acquisition, so
+# repeated (identical) readings are ignored and only new acquisitions enter the
+# window.
+#
+# SettlingBudget sizes the wait before the first reading and the interval
+# between readings for each point from the excitation period and an estimate of
+# the DUT's time constant, which is refined as the scan progresses.
+#
+# statisticsError() judges a point from a single read of the scope's own
+# measurement statistics (average, standard deviation and count).
+#
+# SettlingProfile remembers how long each point of a DUT type took to settle,
+# per frequency, in a small file so later scans of the same product can start
+# each point with the wait it needed before.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from settling import *'.
+#
+# Example Usage:
+#	det = SettlingDetector(maxPercentAccepted);
+#	while (not det.settled()):
+#		det.add(readMeasurements(scope));
+#		sleep(.05);
+#
+
+from collections import deque
+import os
+
+import numpy as np
+
+from jsonstore import loadDict, saveDict
+
+#Default file in which the learned settling profiles are kept
+defaultProfileFile = os.path.join(os.path.expanduser("~"), ".ripscanner_settling.json");
+
+#
+# Drift (same units as 'y') still to come if the readings 'y' approach their
+# final value as an exponential decay. The successive differences of such a
+# series shrink by a constant ratio 'r' (0 < r < 1), so the remaining drift is
+# the geometric sum d_last*r/(1-r). If the differences don't decay (r >= 1) the
+# series is still ramping and the drift is taken as the average step times the
+# window length. Negative ratios mean the steps are dominated by noise, which
+# is accounted for separately by the scatter.
+#
+def decayResidual(y):
+    d = np.diff(y);
+    if (len(d) < 2):
+        return np.inf;
+    den = np.dot(d[:-1], d[:-1]);
+    if (den == 0):
+        return 0; #Readings identical
+    r = np.dot(d[1:], d[:-1])/den; #Least squares fit of d[k+1] = r*d[k]
+    if (r <= 0):
+        return 0;
+    if (r < .95):
+        return abs(d[-1])*r/(1-r);
+    return abs(np.mean(d))*len(y);
+
+#
+# Sliding-window convergence test of the readings of several channels
+#
+class SettlingDetector:
+
+    #
+    # 'tolerance' is the accepted error (%), 'window' the no. readings in the
+    # sliding window and 'minReadings' the no. readings required before the
+    # point can be accepted. Channels reading 0 (ie. turned off) are not checked.
+    #
+    def __init__(self, tolerance, window=6, minReadings=3):
+        self.tolerance = tolerance;
+        self.minReadings = max(3, minReadings);
+        self.readings = deque(maxlen=max(window, self.minReadings));
+        self.duplicates = 0; #No. repeated readings ignored
+        self.added = 0; #No. readings added since the last reset
+        self.repeats = 0; #No. times the newest reading was repeated
+        self.lastError = None; #Worst channel's estimated error (%) at the last test
+
+    #
+    # Empties the window (ie. after the scope was reconfigured)
+    #
+    def reset(self):
+        self.readings.clear();
+        self.added = 0;
+        self.repeats = 0;
+        self.lastError = None;
+
+    #
+    # Adds the reading 'rec' (a tuple with one value per channel, ie. a
+    # MeasRecord). Returns False if the reading was a repeat of the last one and
+    # was ignored.
+    #
+    def add(self, rec):
+        if (len(self.readings) > 0 and tuple(rec) == self.readings[-1]):
+            self.duplicates += 1;
+            self.repeats += 1;
+            return False;
+        self.readings.append(tuple(rec));
+        self.added += 1;
+        self.repeats = 0;
+        return True;
+
+    #
+    # Returns the estimated error (%) of the worst channel: two standard
+    # deviations of the window plus the drift still expected from the decay fit,
+    # relative to the newest reading. If 'final' is True and there are too few
+    # readings for the fit, the percent change between the last two readings is
+    # used instead (the scope acquires too slowly to fill the window in time),
+    # and a single reading which was read again counts as constant, like the
+    # two-reading check in ripscanner.py.
+    #
+    def error(self, final=False):
+        if (len(self.readings) < self.minReadings):
+            if (final and len(self.readings) == 1 and self.repeats > 0):
+                return 0;
+            if (not final or len(self.readings) < 2):
+                return np.inf;
+            a = np.abs(self.readings[-2]);
+            b = np.abs(self.readings[-1]);
+            return 100*max([abs(a[c]-b[c])/min(a[c], b[c]) for c in range(len(a)) if a[c] != b[c]] + [0]);
+        data = np.array(self.readings, dtype=float);
+        worst = 0;
+        for c in range(data.shape[1]):
+            y = data[:, c];
+            if (y[-1] == 0):
+                continue; #Channel off or no signal
+            scatter = np.std(np.diff(y))/np.sqrt(2); #Noise of a single reading, insensitive to the trend
+            worst = max(worst, 100*(2*scatter + decayResidual(y))/abs(y[-1]));
+        return worst;
+
+    #
+    # Returns True if the readings in the window have converged. Pass 'final' as
+    # True for the last test before giving up (see error()).
+    #
+    def settled(self, final=False):
+        self.lastError = self.error(final);
+        return self.lastError <= self.tolerance;
+
+#
+# Judges a point from the scope's own measurement statistics (see
+# readStatistics() in scpi.py), read after the statistics were reset. Returns
+# the worst channel's relative standard deviation (%) and the smallest no.
+# acquisitions the statistics were computed from. Channels which weren't read
+# (average of 0) are not checked. Invalid values (> 1e30) give an infinite
+# error.
+#
+def statisticsError(stats):
+    aver, dev, cnt = stats["AVER"], stats["DEV"], stats["CNT"];
+    worst = 0;
+    count = np.inf;
+    for c in range(len(aver)):
+        if (aver[c] == 0):
+            continue; #Channel not read
+        count = min(count, cnt[c]);
+        if (abs(aver[c]) > 1e30 or abs(dev[c]) > 1e30):
+            worst = np.inf;
+            continue;
+        worst = max(worst, 100*dev[c]/abs(aver[c]));
+    return worst, count;
+
+#
+# Per-point settling budget. The time needed for a point to settle is modelled
+# as the DUT's settling (an exponential with time constant 'tau', which takes
+# tau*ln(100/tolerance) to come within the tolerance) plus one full scope frame
+# of 'periods' excitation periods, so the measurement statistics are computed
+# from a settled acquisition. Readings taken less than a frame apart come from
+# the same acquisition, so the verification interval is never shorter than a
+# frame.
+#
+# 'tau' starts at the given estimate and is refined after every point with
+# update(): a point which passed with the fewest readings possible shrinks it,
+# one which needed extra readings grows it towards the time it actually took.
+#
+class SettlingBudget:
+
+    def __init__(self, tolerance, periods, tau=.1, minTau=1e-3, shrink=.7, gain=.5):
+        self.tolerance = tolerance;
+        self.periods = periods; #No. excitation periods per scope frame (ie. numPeaksPerFrame)
+        self.tau = tau; #Estimated DUT time constant (s)
+        self.minTau = minTau;
+        self.shrink = shrink; #Factor applied to 'tau' after a point settled at once
+        self.gain = gain; #Fraction of the way 'tau' moves towards a slower point's estimate
+
+    #
+    # Time (s) for the DUT to come within the tolerance of its final value
+    #
+    def decayTime(self):
+        return self.tau*np.log(100/self.tolerance);
+
+    #
+    # Duration (s) of one scope frame at excitation frequency 'f' (Hz)
+    #
+    def frameTime(self, f):
+        return self.periods/f;
+
+    #
+    # Time (s) to wait after configuring a point at frequency 'f' before the
+    # first reading
+    #
+    def initialWait(self, f):
+        return self.decayTime() + self.frameTime(f);
+
+    #
+    # Time (s) between readings while verifying a point at frequency 'f'. The
+    # interval is at least 'minInterval' (s).
+    #
+    def interval(self, f, minInterval=0):
+        return max(self.frameTime(f), minInterval);
+
+    #
+    # Retry limit (s) for a point at frequency 'f': 'base' (s), extended so the
+    # initial wait and 'readings' verification readings always fit
+    #
+    def retryTime(self, f, base, readings=3, minInterval=0):
+        return max(base, self.initialWait(f) + readings*self.interval(f, minInterval));
+
+    #
+    # Refines 'tau' from a point at frequency 'f' which took 'elapsed' seconds
+    # and 'readings' readings to settle, 'extra' of them more than the minimum
+    # the check needs.
+    #
+    def update(self, f, elapsed, readings, extra):
+        if (extra <= 0):
+            self.tau = max(self.minTau, self.tau*self.shrink);
+            return;
+        observed = max(elapsed - readings*self.frameTime(f), 0)/np.log(100/self.tolerance);
+        self.tau = max(self.minTau, self.tau + self.gain*(observed - self.tau));
+
+#
+# Learned settling times of one DUT type. The time each point took to settle is
+# kept per frequency bin ('binsPerDecade' bins per decade), 'history' points
+# per bin. The estimate for a bin is the mean of its times weighted by 'decay'
+# per point of age (so the profile follows hardware changes), after rejecting
+# times more than 3 (scaled) median absolute deviations from the median (ie. a
+# point which was disturbed).
+#
+# The wait given for a point is the estimate scaled by 'probe' (< 1) less the
+# time the readings themselves take. A point which still settles at once
+# records a shorter time, so the waits keep shrinking until points need an
+# extra reading, which pushes them back up.
+#
+class SettlingProfile:
+
+    def __init__(self, name, fn=defaultProfileFile, history=20, decay=.8, probe=.9, binsPerDecade=10):
+        self.name = name;
+        self.fn = fn;
+        self.history = history;
+        self.decay = decay;
+        self.probe = probe;
+        self.binsPerDecade = binsPerDecade;
+        self.bins = loadSettlingProfiles(fn).get(name, {});
+
+    #
+    # Key of the frequency bin of 'f' (Hz)
+    #
+    def key(self, f):
+        return str(int(round(self.binsPerDecade*np.log10(f))));
+
+    #
+    # Records that a point at frequency 'f' (Hz) took 'elapsed' seconds to settle
+    #
+    def record(self, f, elapsed):
+        times = self.bins.setdefault(self.key(f), []);
+        times.append(round(float(elapsed), 4));
+        del times[:-self.history];
+
+    #
+    # Returns the learned settling time (s) at frequency 'f', or None if no
+    # point in its bin has been recorded.
+    #
+    def estimate(self, f):
+        times = np.array(self.bins.get(self.key(f), []), dtype=float);
+        if (len(times) == 0):
+            return None;
+        med = np.median(times);
+        spread = 3*1.4826*np.median(np.abs(times - med));
+        weights = self.decay**np.arange(len(times)-1, -1, -1); #Newest time has weight 1
+        keep = np.abs(times - med) <= spread;
+        return float(np.sum(weights[keep]*times[keep])/np.sum(weights[keep]));
+
+    #
+    # Returns the time (s) to wait before the first reading at frequency 'f' if
+    # the readings of the equilibrium check take 'readingTime' seconds, or None
+    # if nothing was learned for the frequency.
+    #
+    def initialWait(self, f, readingTime):
+        t = self.estimate(f);
+        if (t is None):
+            return None;
+        return max(0, self.probe*t - readingTime);
+
+    #
+    # Writes the profile to its file, keeping the other profiles in it
+    #
+    def save(self):
+        profiles = loadSettlingProfiles(self.fn);
+        profiles[self.name] = self.bins;
+        saveSettlingProfiles(profiles, self.fn);
+
+#
+# Reads the profile file 'fn'. Returns a dict of profiles (dicts of lists of
+# settling times keyed by frequency bin) keyed by name, or an empty dict if the
+# file doesn't exist or can't be read (see jsonstore.py).
+#
+def loadSettlingProfiles(fn=defaultProfileFile):
+    return loadDict(fn);
+
+#
+# Writes the dict 'profiles' (see loadSettlingProfiles()) to the file 'fn'
+#
+def saveSettlingProfiles(profiles, fn=defaultProfileFile):
+    saveDict(profiles, fn, "settling profiles");
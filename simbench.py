@@ -0,0 +1,435 @@
+# This file defines a simulated bench (a DS1000Z oscilloscope and SDG2000X
+# generator connected to a DUT) which can be used in place of the real test
+# instruments to benchmark and tune the scanner without tying up hardware.
+# SimResourceManager stands in for visa.ResourceManager(), so the rest of the
+# program (meas(), scan(), ...) runs unmodified.
+#
+# The simulation answers the subset of SCPI used by the scanner and models:
+#	* A configurable DUT transfer function for CH2-CH4 (CH1 is the input)
+#	* First-order settling of the DUT after the generator is changed
+#	* Scope re-arming after a timebase or vertical scale change, during which
+#	  the measurement statistics are invalid ('9.9e37')
+#	* Gaussian measurement noise and randomly corrupt ('9.9e37') readings
+#	* Clipping ('9.9e37') when a trace doesn't fit on the screen
+#	* A fixed latency per VISA transaction (plus extra for timebase changes)
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from simbench import *'.
+#
+# Example Usage:
+#	rm = SimResourceManager(SimBench(tf=peakingFilter(1e3, 12, 1.4)));
+#	scope = rm.open_resource(rm.list_resources()[0]);
+#	print(scope.query("MEAS:STAT:ITEM? CURR,VPP,CHAN2"));
+#
+
+from time import sleep
+import time
+
+import numpy as np
+
+#Value returned by the scope for an invalid measurement
+INVALID = 9.9e37;
+
+#
+# Returns the transfer function (a function of frequency in Hz returning a
+# complex gain) of a peaking EQ band centred on 'f0' Hz with 'gainDB' dB of
+# boost (or cut if negative) and quality factor 'Q'.
+#
+def peakingFilter(f0, gainDB, Q):
+    A = 10**(gainDB/40);
+    def tf(f):
+        s = 1j*np.asarray(f, dtype=float)/f0;
+        return (s**2 + s/Q*A + 1)/(s**2 + s/(Q*A) + 1);
+    return tf;
+
+#
+# State of the simulated bench shared by the simulated scope and generator.
+#
+class SimBench:
+
+    #
+    # 'tf' is the DUT's transfer function to CH2 (see peakingFilter()) and
+    # 'tfAux' a dict of transfer functions to CH3/CH4 (default: same as CH2).
+    # 'tau' is the DUT's settling time constant (sec), 'noise' the relative
+    # standard deviation of each reading, 'pCorrupt' the probability a reading
+    # is corrupt, 'latency' the time per VISA transaction (sec), 'rearm' the
+    # time the scope takes to restart acquiring after a setting change (sec)
+    # and 'timebaseLatency' the extra time a timebase change takes (sec).
+    #
+    def __init__(self, tf=None, tfAux=None, tau=.05, noise=.002, pCorrupt=.01, latency=.002, rearm=.05, timebaseLatency=.1, seed=None):
+        self.tf = tf if tf is not None else peakingFilter(1e3, 12, 1.4);
+        self.tfAux = tfAux if tfAux is not None else {};
+        self.tau = tau;
+        self.noise = noise;
+        self.pCorrupt = pCorrupt;
+        self.latency = latency;
+        self.rearm = rearm;
+        self.timebaseLatency = timebaseLatency;
+        self.rng = np.random.default_rng(seed);
+
+        #Generator state
+        self.freq = 1e3;
+        self.ampl = 1.0;
+        self.output = False;
+        self.lastFreq = self.freq; #Frequency before the last change
+        self.changeTime = time.time(); #Time of the last generator change
+        self.startVpp = {1: 0, 2: 0, 3: 0, 4: 0}; #Vpp of each channel at the last generator change
+
+        #Scope state
+        self.scales = {1: 1.0, 2: 1.0, 3: 1.0, 4: 1.0};
+        self.timebase = 1e-3;
+        self.offset = 0;
+        self.running = True;
+        self.stopAt = None; #Time a single capture completes
+        self.lastAcq = time.time(); #Time of the last acquisition
+        self.items = {}; #(type, chan) -> [curr, count, sum, sumsq, min, max]
+        self.wavSource = 1;
+
+        #Statistics
+        self.transactions = 0;
+        self.writes = 0;
+        self.queries = 0;
+
+    #
+    # Transfer function to channel 'chan' at 'f' Hz
+    #
+    def gain(self, chan, f):
+        if (chan == 1):
+            return 1;
+        if (chan in self.tfAux):
+            return self.tfAux[chan](f);
+        return self.tf(f);
+
+    #
+    # Settled Vpp of channel 'chan' at time 't' (sec)
+    #
+    def trueVpp(self, chan, t):
+        target = abs(self.gain(chan, self.freq))*self.ampl if self.output else 0;
+        if (chan == 1):
+            return target; #The generator output changes instantly
+        return target + (self.startVpp[chan] - target)*np.exp(-(t - self.changeTime)/self.tau);
+
+    #
+    # Records a change of the generator's output at time 't' so the DUT settles from its present state
+    #
+    def generatorChanged(self, t):
+        for c in self.startVpp:
+            self.startVpp[c] = self.trueVpp(c, t);
+        self.changeTime = t;
+
+    #
+    # Time between the scope's acquisitions (sec)
+    #
+    def acqPeriod(self):
+        return max(self.timebase*12, .02) + .01;
+
+    #
+    # Records a change of the scope's settings at time 't': the scope re-arms and
+    # the measurement statistics restart.
+    #
+    def scopeChanged(self, t):
+        self.lastAcq = t + self.rearm;
+        for k in self.items:
+            self.items[k] = [INVALID, 0, 0, 0, np.inf, -np.inf];
+
+    #
+    # Simulates one reading of measurement 'typ' ('FREQ', 'VPP', 'VAVG' or 'VRMS')
+    # of channel 'chan' acquired at time 't'
+    #
+    def sample(self, typ, chan, t):
+        if (self.rng.random() < self.pCorrupt):
+            return INVALID;
+
+        vpp = self.trueVpp(chan, t);
+        if (vpp > self.scales[chan]*8): #Clipped
+            return INVALID;
+
+        if (typ == "FREQ"):
+            if (vpp < self.scales[chan]*.2): #Too small to trigger a frequency count
+                return INVALID;
+            f = self.freq if t - self.changeTime > 2*self.timebase*12 else self.lastFreq;
+            return f*(1 + self.noise*.1*self.rng.standard_normal());
+
+        noisy = vpp*(1 + self.noise*self.rng.standard_normal()) + self.scales[chan]*.01*abs(self.rng.standard_normal());
+        if (typ == "VPP"):
+            return noisy;
+        if (typ == "VRMS"):
+            return noisy/(2*np.sqrt(2));
+        return self.scales[chan]*.01*self.rng.standard_normal(); #VAVG of a sine
+
+    #
+    # Runs every acquisition which would have happened up to time 'now'
+    #
+    def acquire(self, now):
+        if (not self.running and self.stopAt is None):
+            return;
+        end = now if self.stopAt is None else min(now, self.stopAt);
+        period = self.acqPeriod();
+        n = int((end - self.lastAcq)/period);
+        if (n <= 0):
+            return;
+        times = self.lastAcq + period*np.arange(max(1, n-100), n+1); #Only the last 100 matter
+        self.lastAcq += n*period;
+
+        for key, st in self.items.items():
+            for t in times:
+                v = self.sample(key[0], key[1], t);
+                st[0] = v;
+                if (v != INVALID):
+                    st[1] += 1;
+                    st[2] += v;
+                    st[3] += v*v;
+                    st[4] = min(st[4], v);
+                    st[5] = max(st[5], v);
+
+    #
+    # Returns the statistic 'stat' (CURR, AVER, MIN, MAX, DEV or CNT) of measurement
+    # 'typ' of channel 'chan'
+    #
+    def statistic(self, stat, typ, chan):
+        key = (typ, chan);
+        if (key not in self.items):
+            self.items[key] = [INVALID, 0, 0, 0, np.inf, -np.inf];
+        self.acquire(time.time());
+        st = self.items[key];
+
+        if (stat == "CURR"):
+            return st[0];
+        if (stat == "CNT"):
+            return st[1];
+        if (st[1] == 0):
+            return INVALID;
+        if (stat == "AVER"):
+            return st[2]/st[1];
+        if (stat == "MIN"):
+            return st[4];
+        if (stat == "MAX"):
+            return st[5];
+        if (stat == "DEV"):
+            mean = st[2]/st[1];
+            return np.sqrt(max(st[3]/st[1] - mean*mean, 0));
+        raise IOError("Unsupported statistic '" + stat + "'");
+
+    #
+    # Returns the screen waveform of channel 'chan' as a IEEE 488.2 block of
+    # bytes (WAV:FORM BYTE, WAV:MODE NORM)
+    #
+    def waveformBlock(self, chan):
+        now = time.time();
+        t = self.offset + (np.arange(1200) - 600)*self.timebase*12/1200;
+        vpp = self.trueVpp(chan, now);
+        g = self.gain(chan, self.freq);
+        v = vpp/2*np.sin(2*np.pi*self.freq*t + np.angle(g)) + self.scales[chan]*.02*self.rng.standard_normal(len(t));
+        data = np.clip(np.round(v/(self.scales[chan]/25) + 127), 0, 255).astype(np.uint8).tobytes();
+        return ("#9" + "{:09d}".format(len(data))).encode('ascii') + data + b"\n";
+
+#
+# A simulated instrument. Answers the SCPI program messages written to it
+# (commands separated by ';') and mimics a pyvisa resource.
+#
+class SimInstrument:
+
+    def __init__(self, bench, resource_name, idn, timeout=2000, **kwargs):
+        self.bench = bench;
+        self.resource_name = resource_name;
+        self.idn = idn;
+        self.timeout = timeout;
+        self.raw = None; #Binary reply waiting to be read with read_raw()
+
+    #
+    # Runs each command in 'msg' and returns the replies of the queries (joined with ';')
+    #
+    def execute(self, msg):
+        b = self.bench;
+        b.transactions += 1;
+        sleep(b.latency);
+
+        replies = [];
+        for cmd in msg.strip().split(";"):
+            cmd = cmd.strip().lstrip(":");
+            if (cmd == ""):
+                continue;
+            parts = cmd.split(" ", 1);
+            header = parts[0].upper();
+            args = parts[1].split(",") if len(parts) > 1 else [];
+            reply = self.command(header, args);
+            if (reply is not None):
+                replies.append(str(reply));
+
+        return ";".join(replies);
+
+    def command(self, header, args):
+        if (header == "*IDN?"):
+            return self.idn;
+        if (header == "*OPC?"):
+            return 1;
+        if (header == "*RST" or header == "*CLS"):
+            return None;
+        raise IOError("Simulated instrument doesn't support '" + header + "'");
+
+    def write(self, msg):
+        self.bench.writes += 1;
+        reply = self.execute(msg);
+        if (reply != ""):
+            self.raw = reply.encode('ascii') + b"\n";
+
+    def write_raw(self, data):
+        self.bench.writes += 1;
+        self.bench.transactions += 1;
+        sleep(self.bench.latency);
+
+    def query(self, msg):
+        self.bench.queries += 1;
+        return self.execute(msg) + "\n";
+
+    def read_raw(self):
+        raw = self.raw;
+        self.raw = None;
+        if (raw is None):
+            raise IOError("Simulated instrument has no reply waiting (timeout)");
+        return raw;
+
+    def read(self):
+        return self.read_raw().decode('ascii', errors='replace');
+
+    def close(self):
+        pass;
+
+#
+# Simulated Rigol DS1000Z oscilloscope
+#
+class SimScope(SimInstrument):
+
+    def command(self, header, args):
+        b = self.bench;
+        now = time.time();
+
+        if (header == "MEAS:STAT:ITEM?"):
+            return b.statistic(args[0].upper(), args[1].upper(), int(args[2][-1]));
+        if (header == "MEAS:STAT:ITEM"):
+            b.items.setdefault((args[0].upper(), int(args[1][-1])), [INVALID, 0, 0, 0, np.inf, -np.inf]);
+            return None;
+        if (header in ("MEAS:STAT:RES", "MEAS:STAT:RESET")):
+            b.acquire(now);
+            for k in b.items:
+                b.items[k] = [b.items[k][0], 0, 0, 0, np.inf, -np.inf];
+            return None;
+        if (header.startswith("CHAN") and header.endswith(":SCAL")):
+            b.scales[int(header[4])] = float(args[0]);
+            b.scopeChanged(now);
+            return None;
+        if (header == "TIM:MAIN:SCAL"):
+            sleep(b.timebaseLatency);
+            b.timebase = float(args[0]);
+            b.scopeChanged(time.time());
+            return None;
+        if (header == "TIM:MAIN:OFFS"):
+            b.offset = float(args[0]);
+            return None;
+        if (header == "RUN"):
+            b.running = True;
+            b.stopAt = None;
+            b.scopeChanged(now);
+            return None;
+        if (header == "STOP"):
+            b.acquire(now);
+            b.running = False;
+            return None;
+        if (header == "SING"):
+            b.scopeChanged(now);
+            b.stopAt = b.lastAcq + b.acqPeriod();
+            return None;
+        if (header == "TRIG:STAT?"):
+            if (b.stopAt is not None and now >= b.stopAt):
+                b.acquire(now);
+                b.running = False;
+                b.stopAt = None;
+            if (not b.running):
+                return "STOP";
+            return "WAIT" if b.stopAt is not None else "TD";
+        if (header.startswith("TRIG:") or header in ("WAV:MODE", "WAV:FORM", "ACQ:MDEP", "WAV:STAR", "WAV:STOP")):
+            return None;
+        if (header == "ACQ:MDEP?"):
+            return 1200;
+        if (header == "ACQ:SRAT?"):
+            return 1200/(b.timebase*12);
+        if (header == "WAV:SOUR"):
+            b.wavSource = int(args[0][-1]);
+            return None;
+        if (header == "WAV:PRE?"):
+            c = b.wavSource;
+            return "0,0,1200,1," + str(b.timebase*12/1200) + "," + str(-b.timebase*6) + ",0," + str(b.scales[c]/25) + ",0,127";
+        if (header == "WAV:DATA?"):
+            self.raw = b.waveformBlock(b.wavSource);
+            return None;
+
+        return SimInstrument.command(self, header, args);
+
+    def write(self, msg):
+        self.bench.writes += 1;
+        self.execute(msg); #Binary replies are left in self.raw by the command
+
+#
+# Simulated Siglent SDG2000X generator (CH2 drives the DUT)
+#
+class SimAWG(SimInstrument):
+
+    def command(self, header, args):
+        b = self.bench;
+        now = time.time();
+
+        if (header == "C2:BSWV"):
+            for i in range(0, len(args)-1, 2):
+                key = args[i].upper();
+                if (key == "FRQ"):
+                    b.generatorChanged(now);
+                    b.lastFreq = b.freq;
+                    b.freq = float(args[i+1]);
+                elif (key == "AMP"):
+                    b.generatorChanged(now);
+                    b.ampl = float(args[i+1]);
+            return None;
+        if (header == "C2:OUTP"):
+            b.generatorChanged(now);
+            b.output = (args[0].upper() == "ON");
+            return None;
+        if (header in ("C2:SWWV", "C2:ARWV", "C2:SRATE", "C2:WVDT")):
+            return None;
+
+        return SimInstrument.command(self, header, args);
+
+#
+# Stands in for visa.ResourceManager() and opens the simulated scope and
+# generator of 'bench'. If 'stations' is more than 1, that many independent
+# benches (each with its own scope, generator and DUT) are simulated and
+# 'bench' is used for the first one.
+#
+class SimResourceManager:
+
+    scopeAddr = "USB0::0x1AB1::0x04CE::DS1ZSIM000001::INSTR";
+    awgAddr = "USB0::0xF4EC::0x1102::SDG2XSIM00001::INSTR";
+
+    def __init__(self, bench=None, stations=1):
+        self.bench = bench if bench is not None else SimBench();
+        self.benches = [self.bench] + [SimBench() for i in range(stations-1)];
+
+    #
+    # Returns the (scope, generator) resource strings of simulated station 'i'
+    #
+    def stationAddrs(self, i):
+        return self.scopeAddr.replace("000001", "{:06d}".format(i+1)), self.awgAddr.replace("00001", "{:05d}".format(i+1));
+
+    def list_resources(self):
+        addrs = [];
+        for i in range(len(self.benches)):
+            addrs.extend(self.stationAddrs(i));
+        return tuple(addrs);
+
+    def open_resource(self, addr, **kwargs):
+        for i in range(len(self.benches)):
+            scopeAddr, awgAddr = self.stationAddrs(i);
+            if (addr == scopeAddr):
+                return SimScope(self.benches[i], addr, "RIGOL TECHNOLOGIES,DS1104Z," + scopeAddr.split("::")[3] + ",00.04.04", **kwargs);
+            if (addr == awgAddr):
+                return SimAWG(self.benches[i], addr, "Siglent Technologies,SDG2042X," + awgAddr.split("::")[3] + ",2.01.01", **kwargs);
+        raise IOError("No simulated resource '" + addr + "'");
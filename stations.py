@@ -0,0 +1,174 @@
+# This file defines the multi-station scanner. Every oscilloscope found on the
+# host is paired with a generator to form a station, and independent frequency
+# scans are run on all stations at once (one worker thread per station). Each
+# station keeps its own result and fine-scale buffers, so stations never share
+# state, and because the instruments of different stations have separate locks
+# (see scpi.instLock()) throughput scales with the number of stations.
+#
+# Each station is a stepscan.Station, so its points are measured by the same
+# meas() as ripscanner.py's bench, with the settings passed to scan().
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from stations import *'.
+#
+# Example Usage (command line):
+#	python stations.py 10 20e3 30 1 board
+#	(scans 10 Hz - 20 kHz in 30 log steps at 1 Vpp on every station and saves
+#	 board_<station>.kv1 for each)
+#
+
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import time
+
+import numpy as np
+
+from kvar import write_kvar
+from scpi import ShadowInstrument, CommandQueue
+from waveform import setupWaveformRead
+import stepscan
+from stepscan import meas, getFineScale, defaultScanSettings
+
+#
+# A scope/generator pair and the results of the scans run on it
+#
+class Station(stepscan.Station):
+
+    def __init__(self, name, scope, awg, ch3=False, ch4=False):
+        super().__init__(name, ShadowInstrument(scope, "SCOPE" + name), ShadowInstrument(awg, "AWG" + name), ch3, ch4);
+
+    #
+    # Sets the instruments up to collect data with the settings 'st' (as
+    # ripscanner.py does on connection)
+    #
+    def initialize(self, st):
+        init = CommandQueue();
+        init.write(self.scope, "MEAS:STAT:ITEM FREQ,CHAN1");
+        for c in range(1, 5):
+            init.write(self.scope, "MEAS:STAT:ITEM VPP,CHAN" + str(c));
+        init.write(self.scope, "TRIG:EDG:SOUR CHAN1");
+        init.write(self.scope, "TRIG:MODE EDGE");
+        init.write(self.scope, "TRIG:EDGE:LEV 0");
+        init.write(self.awg, "C2:BSWV WVTP,SINE");
+        init.write(self.awg, "C2:OUTP ON");
+        init.flush(parallel=True);
+        if (st["waveformAcquisition"] or st["clipDetection"]):
+            setupWaveformRead(self.scope);
+
+    #
+    # Scans the transfer function at 'freqs'/'ampls' with the settings 'st'
+    # (with a crude and a fine sweep if 'autoDualSweep' is set). Returns True if
+    # successful.
+    #
+    def scan(self, freqs, ampls, st=defaultScanSettings):
+        start = time.time();
+        self.freqs, self.ampls = freqs, ampls;
+        self.clear();
+        self.startScan(st);
+        self.scope.invalidate();
+        self.awg.invalidate();
+        self.initialize(st);
+
+        if (not meas(self, True, st)):
+            return False;
+
+        if (st["autoDualSweep"] and not st["predictiveAutoscale"]):
+            #Calculate the fine scales from the crude sweep, then repeat
+            if (not getFineScale(self, st)):
+                return False;
+            self.clear();
+            if (not meas(self, False, st)):
+                return False;
+
+        self.log("Scanned " + str(len(self.fmeas)) + " points in " + "{:.1f}".format(time.time()-start) + " sec");
+        return True;
+
+    #
+    # Saves the last scan (run with the settings 'st') to the KV1 file
+    # 'filename' with the same variables as ripscanner.py's save(): the point
+    # statuses if 'deferFailedPoints' is set, and the per-point timing
+    #
+    def save(self, filename, header, st=defaultScanSettings):
+        columnVars = {"timing_"+key: vals for key, vals in self.timing.columns().items()};
+        if (st["deferFailedPoints"]):
+            columnVars["status"] = self.pointStatus;
+        write_kvar(filename, header, freqs=self.fmeas, in_vpp=self.imeas, out_vpp=self.omeas, ch3_vpp=self.meas3, ch4_vpp=self.meas4, **columnVars);
+
+#
+# Finds every scope ('DS1Z') and generator ('SDG2X') attached to 'rm' and pairs
+# them into stations. 'pairs' is an optional dict mapping (part of) a scope's
+# resource string to (part of) its generator's, ie. {"DS1ZA123": "SDG2XB456"};
+# otherwise scopes and generators are paired in order of their resource strings.
+# 'openArgs' are passed to rm.open_resource(). Returns a list of Stations.
+#
+def discoverStations(rm, pairs=None, **openArgs):
+    instruments = rm.list_resources();
+    scopes = sorted(filter(lambda x: 'DS1Z' in x, instruments));
+    awgs = sorted(filter(lambda x: 'SDG2X' in x, instruments));
+
+    if (pairs):
+        matched = [];
+        for s, a in pairs.items():
+            sa = [x for x in scopes if s in x];
+            aa = [x for x in awgs if a in x];
+            if (len(sa) != 1 or len(aa) != 1):
+                raise IOError("Failed to find station pair " + s + "/" + a + " in " + str(instruments));
+            matched.append((sa[0], aa[0]));
+    else:
+        if (len(scopes) != len(awgs)):
+            print("Found " + str(len(scopes)) + " scopes and " + str(len(awgs)) + " generators. Unpaired instruments will be ignored.");
+        matched = list(zip(scopes, awgs));
+
+    if (len(matched) == 0):
+        raise IOError("Failed to identify any test stations " + str(instruments));
+
+    stations = [];
+    for i in range(len(matched)):
+        print("Station " + str(i+1) + ": " + matched[i][0] + " + " + matched[i][1]);
+        stations.append(Station(str(i+1), rm.open_resource(matched[i][0], **openArgs), rm.open_resource(matched[i][1], **openArgs)));
+    return stations;
+
+#
+# Runs Station.scan(freqs, ampls, st) on every station in 'stations' at the same
+# time (one worker thread per station). Returns a list of the results (True if
+# the station's scan succeeded) in the same order as 'stations'.
+#
+def runStations(stations, freqs, ampls, st=defaultScanSettings):
+    with ThreadPoolExecutor(max_workers=len(stations), thread_name_prefix="station") as pool:
+        futures = [pool.submit(s.scan, freqs, ampls, st) for s in stations];
+        results = [];
+        for i in range(len(futures)):
+            try:
+                results.append(futures[i].result());
+            except Exception as e:
+                stations[i].log("Scan failed. " + str(e));
+                results.append(False);
+    return results;
+
+if __name__ == "__main__":
+    if (len(sys.argv) < 6):
+        print("Usage: python stations.py <start Hz> <end Hz> <no. steps> <ampl. Vpp> <file prefix> [sim <no. stations>]");
+        sys.exit(-1);
+
+    freqs = np.logspace(np.log10(float(sys.argv[1])), np.log10(float(sys.argv[2])), int(sys.argv[3])).tolist();
+    ampls = [float(sys.argv[4])]*len(freqs);
+
+    if (len(sys.argv) > 6 and sys.argv[6] == "sim"): #Simulated stations (see simbench.py)
+        from simbench import SimResourceManager
+        rm = SimResourceManager(stations=int(sys.argv[7]) if len(sys.argv) > 7 else 2);
+    else:
+        import visa
+        rm = visa.ResourceManager();
+
+    stations = discoverStations(rm, timeout=30, chunk_size=1024);
+
+    start = time.time();
+    results = runStations(stations, freqs, ampls);
+    duration = time.time() - start;
+
+    npts = 0;
+    for i in range(len(stations)):
+        if (results[i]):
+            stations[i].save(sys.argv[5] + "_" + stations[i].name + ".kv1", "Station " + stations[i].name);
+            npts += len(stations[i].fmeas);
+    print("Scanned " + str(npts) + " points on " + str(len(stations)) + " stations in " + "{:.1f}".format(duration) + " sec (" + "{:.2f}".format(npts/duration) + " points/sec)");
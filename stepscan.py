@@ -0,0 +1,825 @@
+# This file defines the stepped-sine scan engine: meas() steps the generator
+# through the sample points, configures the scope for each and records the point
+# once it passes the data integrity and equilibrium check, and getFineScale()
+# picks the vertical scales of a dual sweep's fine sweep from its crude sweep.
+#
+# Everything a scan changes is kept in a Station: the scope and generator, the
+# sample points, the result and fine-scale buffers and the settling, timing and
+# scale state. ripscanner.py measures its bench through one Station and
+# stations.py runs a Station per scope/generator pair at the same time, so both
+# measure points with the same code. The scan settings are passed as a dict
+# keyed by the names of the SETTINGS section of ripscanner.py (see
+# defaultScanSettings and ripscanner.py for a description of each).
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from stepscan import *'.
+#
+# Example Usage:
+#	bench = Station("", ShadowInstrument(scope, "SCOPE"), ShadowInstrument(awg, "AWG"));
+#	bench.freqs, bench.ampls = [100, 1e3, 10e3], [1, 1, 1];
+#	bench.startScan(defaultScanSettings);
+#	if (meas(bench, True, defaultScanSettings) and getFineScale(bench, defaultScanSettings)):
+#		bench.clear();
+#		meas(bench, False, defaultScanSettings);
+#
+
+from collections import namedtuple
+import time
+
+import numpy as np
+
+from scpi import CommandQueue, MeasRecord, readMeasurements, readStatistics, auxItem, instName, resetRoundTrips, getRoundTrips, countRoundTrip
+from waveform import readWaveformMeasurements, screenTraces
+from settling import SettlingDetector, SettlingBudget, SettlingProfile, statisticsError
+from timing import PointTiming, TimingLog
+from autoscale import predictAmplitude, fitScale, checkRange, checkScreen, decimatedIndices, interpolateAmplitudes
+
+#Scan settings (the defaults of the SETTINGS section of ripscanner.py)
+defaultScanSettings = {
+    "numPeaksPerFrame": 10,
+    "numDivHoriz": 12,
+    "numDivVert": 8,
+    "timeWithConstReading": .5,
+    "maxPercentAccepted": 5,
+    "maxPercentAcceptedFrequencyDelta": 5,
+    "maxRetryTime": 6,
+    "vertExpandFactor": 1.5,
+    "turnOffAfterScan": False,
+    "setMeasDelay": 1200,
+    "autoDualSweep": True,
+    "crudeVertSweepFactor": 2,
+    "fineVertScaleFactor": 1.2,
+    "clipDetection": False,
+    "minScreenDivs": 2,
+    "crudeDecimation": 1,
+    "predictiveAutoscale": False,
+    "maxRescales": 3,
+    "coalescedWrites": False,
+    "concurrentConfig": False,
+    "batchedReads": False,
+    "waveformAcquisition": False,
+    "adaptiveSettling": False,
+    "settlePollInterval": .05,
+    "settleWindow": 6,
+    "frequencyAwareSettling": False,
+    "dutTimeConstant": .1,
+    "deferFailedPoints": False,
+    "deferredSettleFactor": 3,
+    "statVerification": False,
+    "statMinCount": 4,
+    "dutProfile": "",
+};
+
+#
+# Takes a list of values ('rvals') to which to round, and
+# Returns the smallest one which is greater than
+# or equal to 'x'. 'rvals' must be in least to greatest order.
+#
+def listCeil(x, rvals):
+    for cc in rvals:
+        if (x <= cc):
+            return cc;
+#Oscilloscope 'course' scaling values (V/div)
+courseScales = [1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3, 200e-3, 500e-3, 1, 2, 5, 10];
+
+#
+# Rounds the number 'x' to the closest oscilloscope 'course'
+# scaling value.
+#
+def courseCeil(x):
+    return listCeil(x, courseScales);
+
+#
+# Returns the oscilloscope 'course' scaling value 'n' steps above (or below if
+# 'n' is negative) 'x', which must be a course value. Stops at the ends.
+#
+def courseStep(x, n):
+    i = courseScales.index(listCeil(x, courseScales));
+    return courseScales[max(0, min(len(courseScales)-1, i+n))];
+
+#
+# Calculates the max percent change between 'a' and 'b' (absolute values). If one is zero and the
+# other is non-zero, it returns a change of 1000%.
+#
+def mpc(a, b):
+    a = abs(a);
+    b = abs(b);
+    if (a-b) == 0:
+        return 0;
+    if (min(a, b) == 0):
+        return 1000;
+    return 100.0*abs(a-b)/min(a,b);
+
+#
+# A scope/generator pair and the state of the scan run on it. 'scope' and 'awg'
+# are ShadowInstruments (see scpi.py). 'ch3'/'ch4' are the aux. measurement of
+# CH3/CH4 as for readMeasurements() (False if the channel is off).
+#
+class Station:
+
+    def __init__(self, name, scope, awg, ch3=False, ch4=False):
+        self.name = name;
+        self.scope = scope;
+        self.awg = awg;
+        self.ch3 = ch3;
+        self.ch4 = ch4;
+        self.freqs = []; #Sample frequencies
+        self.ampls = []; #Sample amplitudes
+        self.amplMode = False; #True if amplitude is the independent variable
+        self.grid = False; #True if the points are a 2-D (freq. x ampl.) sweep's serpentine path (see grid2d.py)
+        self.reading = MeasRecord(0, 0, 0, 0, 0); #Last reading (see collect())
+        self.stats = None; #Statistics of the last reading if read with 'statVerification'
+        self.fineScaleCh2 = []; #Fine-scale buffer (CH2)
+        self.fineScaleCh3 = []; #Fine-scale buffer (CH3)
+        self.fineScaleCh4 = []; #Fine-scale buffer (CH4)
+        self.cachedScales = None; #Scales from the scale cache for the current scan ({channel: [V/div per point]}), None if not cached
+        self.scaleCacheMiss = False; #Set by meas() if a point overranged with the cached scales
+        self.pointScaleLog = {}; #Index -> {channel: V/div} each point was accepted at (predictive autoscale)
+        self.crudeIndices = []; #Indices of the points measured by the last crude sweep
+        self.interpolatedScales = False; #True if some fine scales were interpolated from a decimated crude sweep
+        self.settleBudget = None;
+        self.settleProfile = None;
+        self.timing = TimingLog(); #Where each point's time goes (see timing.py)
+        self.clear();
+
+    #
+    # Clears the result buffers
+    #
+    def clear(self):
+        self.fmeas = []; #Freq. buffer
+        self.imeas = []; #Input ampl. buffer
+        self.omeas = []; #Output ampl. buffer
+        self.meas3 = []; #CH3 buffer
+        self.meas4 = []; #CH4 buffer
+        self.pointStatus = []; #Status of each point of the last meas() ('ok', 'rescanned' or 'missing')
+
+    #
+    # Starts a new scan with the settings 'st': the settling budget starts from
+    # the initial DUT time constant estimate, the DUT's settling profile is
+    # loaded and the timing log and cached scales are cleared
+    #
+    def startScan(self, st):
+        self.settleBudget = SettlingBudget(st["maxPercentAccepted"], st["numPeaksPerFrame"], st["dutTimeConstant"]);
+        self.settleProfile = SettlingProfile(st["dutProfile"]) if (st["dutProfile"] != "") else None;
+        self.timing = TimingLog();
+        self.cachedScales = None;
+        self.interpolatedScales = False;
+
+    #
+    # Returns the output channels whose vertical scales are set automatically
+    #
+    def outputChannels(self):
+        chans = [2];
+        if (self.ch3):
+            chans.append(3);
+        if (self.ch4):
+            chans.append(4);
+        return chans;
+
+    def log(self, msg):
+        print(("[" + self.name + "] " if self.name != "" else "") + msg);
+
+#
+# Takes a single reading of the station's scope (frequency and every enabled
+# channel) into 'station.reading'. Returns False if the reading failed or is
+# corrupt (a value > 1e30).
+#
+def collect(station, st):
+    scope = station.scope;
+    fr, c1, c2, c3, c4 = station.reading;
+    added = 0;
+    try:
+        if (st["waveformAcquisition"] or st["batchedReads"] or st["statVerification"]): #Read every channel from a single capture or in a single round trip
+            if (st["waveformAcquisition"]):
+                rec = readWaveformMeasurements(scope, station.ch3, station.ch4);
+            elif (st["statVerification"]): #Averages since the statistics were reset, with their deviations and counts
+                station.stats = readStatistics(scope, station.ch3, station.ch4);
+                rec = station.stats["AVER"];
+            else:
+                rec = readMeasurements(scope, station.ch3, station.ch4);
+            fr, c1, c2 = rec.freq, rec.ch1, rec.ch2;
+            if (station.ch3):
+                c3 = rec.ch3;
+            if (station.ch4):
+                c4 = rec.ch4;
+            added = 5;
+        else:
+            fr = float(scope.query("MEAS:STAT:ITEM? CURR,FREQ,CHAN1"));
+            countRoundTrip();
+            added = 1;
+            c1 = float(scope.query("MEAS:STAT:ITEM? CURR,VPP,CHAN1"));
+            countRoundTrip();
+            added = 2;
+            c2 = float(scope.query("MEAS:STAT:ITEM? CURR,VPP,CHAN2"));
+            countRoundTrip();
+            added = 3;
+            if (station.ch3):
+                c3 = float(scope.query("MEAS:STAT:ITEM? CURR," + auxItem(station.ch3) + ",CHAN3"));
+                countRoundTrip();
+            added = 4;
+            if (station.ch4):
+                c4 = float(scope.query("MEAS:STAT:ITEM? CURR," + auxItem(station.ch4) + ",CHAN4"));
+                countRoundTrip();
+            added = 5;
+        station.log("\t** f = " + "{:09.4e}".format(fr) + " Hz\t**\tVin = " + "{:09.4e}".format(c1) + " Vpp\t**\tVout = " + "{:09.4e}".format(c2) + " Vpp\t**\tVc3 = " + "{:09.4e}".format(c3) + "V" + " Vpp\t**\tVc4 = " + "{:09.4e}".format(c4) + "V");
+    except Exception as e:
+        station.log("Measurement error (" + str(added) + "). Point not recorded.");
+        station.log("\t"+str(e));
+        return False;
+    finally:
+        station.reading = MeasRecord(fr, c1, c2, c3, c4);
+
+    #Ensure data are valid...
+    if (fr > 1e30 or c1 > 1e30 or c2 > 1e30 or c3 > 1e30 or c4 > 1e30):
+        station.log("Received invalid data.");
+        return False;
+
+    return True;
+
+#
+# Takes the data collected from the first crude-scan and calculates the fine-resolution
+# vertical-scales to be used in the second scan.
+#
+def getFineScale(station, st):
+
+    station.log("Calculating fine scales...");
+
+    omeas, meas3, meas4 = station.omeas, station.meas3, station.meas4;
+    station.interpolatedScales = (len(station.fmeas) < len(station.freqs));
+    if (station.interpolatedScales): #Decimated crude sweep: interpolate the amplitudes of the points it skipped
+        station.log("Interpolating the amplitudes of " + str(len(station.freqs)-len(station.fmeas)) + " points from " + str(len(station.fmeas)) + " crude points...");
+        omeas = interpolateCrude(station, omeas);
+        meas3 = interpolateCrude(station, meas3);
+        meas4 = interpolateCrude(station, meas4);
+
+    station.fineScaleCh2 = [];
+    station.fineScaleCh3 = [];
+    station.fineScaleCh4 = [];
+
+    for idx in range(len(omeas)): #For each sample point...
+        if (np.isnan(omeas[idx])): #Point missing from the crude sweep (see 'deferFailedPoints'), keep its crude scale
+            crude = courseCeil(station.ampls[idx]*st["crudeVertSweepFactor"]);
+            station.fineScaleCh2.append(crude);
+            if (station.ch3):
+                station.fineScaleCh3.append(crude);
+            if (station.ch4):
+                station.fineScaleCh4.append(crude);
+            continue;
+        station.fineScaleCh2.append(courseCeil(omeas[idx]/st["numDivVert"]*st["fineVertScaleFactor"])); #Get vert. scale that fits the measured amplitude (plus a little extra)
+        station.log("FS start value: "+str(omeas[idx]));
+        station.log("FS Added: " +str(courseCeil(omeas[idx]/st["numDivVert"]*st["fineVertScaleFactor"])));
+        if (station.ch3):
+            station.fineScaleCh3.append(courseCeil(meas3[idx]/st["numDivVert"]*st["fineVertScaleFactor"])); #Get vert. scale that fits the measured amplitude (plus a little extra)
+        if (station.ch4):
+            station.fineScaleCh4.append(courseCeil(meas4[idx]/st["numDivVert"]*st["fineVertScaleFactor"])); #Get vert. scale that fits the measured amplitude (plus a little extra)
+
+    return True;
+
+#
+# Interpolates the amplitudes 'vals' measured at the points 'crudeIndices' of
+# the station's last crude sweep to every point of the grid, along the TF in
+# log-log space (see autoscale.py). Returns a list with one value per point (NaN
+# if nothing was measured).
+#
+def interpolateCrude(station, vals):
+    ampls, crude = station.ampls, station.crudeIndices;
+    x = ampls if (station.amplMode) else station.freqs; #Independent variable
+    gains = interpolateAmplitudes([x[i] for i in crude], [vals[k]/ampls[crude[k]] for k in range(len(vals))], x);
+    if (gains is None):
+        return [np.nan]*len(station.freqs);
+    return [gains[i]*ampls[i] for i in range(len(station.freqs))];
+
+#
+# Checks the screen trace of every output channel (see waveform.py) and steps
+# the vertical scale of each channel which clipped (or, if 'under' is True,
+# spans less than 'minScreenDivs' divisions) along the courseCeil() ladder.
+# Returns a dict of the new scales of the channels which were rescaled.
+#
+def rescaleClipped(station, st, under=True):
+    scope = station.scope;
+    chans = station.outputChannels();
+    try:
+        clipped, span = screenTraces(scope, chans);
+    except Exception as e:
+        station.log("Failed to check the screen traces (" + str(e) + ")");
+        return {};
+
+    changed = {};
+    for k in range(len(chans)):
+        header = "CHAN" + str(chans[k]) + ":SCAL ";
+        if (scope.state.get(header) is None): #Scale unknown
+            continue;
+        scale = float(scope.state[header]);
+        state, newScale = checkScreen(clipped[k], span[k], scale, st["numDivVert"], st["fineVertScaleFactor"], courseCeil, courseStep, st["minScreenDivs"] if under else 0);
+        if (state != "ok"):
+            station.log("\tCH" + str(chans[k]) + (" clipped" if state == "over" else " spans under " + str(st["minScreenDivs"]) + " div.") + " at " + str(scale) + " V/div. Rescaling to " + str(newScale) + " V/div.");
+            scope.setting(header, newScale);
+            changed[chans[k]] = newScale;
+    return changed;
+
+#
+# Predicts the vertical scale of each output channel for point 'idx' from the
+# last two points measured before it ('results' as kept by meas()), by
+# extrapolating each channel's gain along the TF (see autoscale.py). Channels
+# with no usable points get the crude sweep's scale. Returns {channel: V/div}.
+#
+def predictScales(station, st, idx, results):
+    ampls = station.ampls;
+    prev = [k for k in sorted(results) if k < idx and not np.isnan(results[k][2])][-2:];
+    if (station.grid): #2-D sweep: hold the gain of the point's neighbour on the serpentine path
+        prev = prev[-1:];
+    x = ampls if (station.amplMode) else station.freqs; #Independent variable
+    scales = {};
+    for c in station.outputChannels():
+        vpp = predictAmplitude([x[k] for k in prev], [results[k][c]/ampls[k] for k in prev], x[idx]);
+        if (vpp is None):
+            scales[c] = fitScale(ampls[idx]*st["crudeVertSweepFactor"], 1, 1, courseCeil);
+        else:
+            scales[c] = fitScale(vpp*ampls[idx], st["numDivVert"], st["fineVertScaleFactor"], courseCeil);
+    return scales;
+
+#
+# Called when the point at frequency 'f' passed the equilibrium check after
+# 'elapsed' seconds and 'readings' readings ('extra' more than the check needs
+# at best). Refines the settling budget and records the time in the DUT's
+# settling profile.
+#
+def settledPoint(station, f, elapsed, readings, extra):
+    station.settleBudget.update(f, elapsed, readings, extra);
+    if (station.settleProfile is not None):
+        station.settleProfile.record(f, elapsed);
+
+#
+# A sample point being measured by meas(): its index, the sweep it's measured
+# in ('crude', 'fine', 'adaptive' or 'single'), its PointTiming, whether it was
+# deferred to the end of the sweep, the vertical scales of its output channels
+# ({channel: V/div}), the no. times each point of the sweep was rescaled
+# ({index: count}, shared by every point) and whether its scales are only a
+# guess which is corrected if the reading doesn't fit them (see correctScales())
+#
+MeasPoint = namedtuple('MeasPoint', ['idx', 'sweep', 'timing', 'deferred', 'scales', 'rescales', 'correcting']);
+
+#
+# Waits of a point while it settles: the time it started settling, the time
+# between readings while polling and while verifying, and the time after which
+# it's given up (all in seconds)
+#
+SettleWaits = namedtuple('SettleWaits', ['start', 'poll', 'verify', 'retry']);
+
+#
+# Returns how meas() decides a point has settled with the settings 'st':
+# 'capture' (one waveform capture after the settle wait), 'stats' (the scope's
+# statistics), 'window' (a sliding window of readings converges, see
+# settling.py) or 'pair' (two readings 'timeWithConstReading' apart agree)
+#
+def settlingStrategy(st):
+    if (st["waveformAcquisition"]):
+        return "capture";
+    if (st["statVerification"]):
+        return "stats";
+    if (st["adaptiveSettling"]):
+        return "window";
+    return "pair";
+
+#
+# Sets the generator and the scope up for 'point' and fills in 'point.scales'
+# with the vertical scales of its output channels: 'scales' chosen by the
+# caller (see meas()), 'autoScales' chosen after it was over/underrange,
+# predicted from the points already measured ('results'), the crude or fine
+# scales of a dual sweep, or the input's scale. Returns the time the settings
+# were sent (the point settles from then), once they're applied (*OPC?) if
+# 'coalescedWrites' is set.
+#
+def configurePoint(station, st, point, scales, autoScales, results):
+    scope, awg = station.scope, station.awg;
+    idx, pt = point.idx, point.timing;
+    freq, ampl = station.freqs[idx], station.ampls[idx];
+    cfg = CommandQueue(not st["coalescedWrites"]); #Collects the point's configuration
+
+    #Set frequency and amplitude
+    cfg.setting(awg, "C2:BSWV FRQ,", freq);
+    cfg.setting(awg, "C2:BSWV AMP,", ampl);
+    pt.add("awg", time.time()-pt.start); #Only the writes themselves if not coalesced, otherwise ~0
+    tcfg = time.time();
+
+    #Determine time/div setting
+    totalTime = 1/freq*st["numPeaksPerFrame"];
+    timePerDiv = totalTime/st["numDivHoriz"];
+    cfg.setting(scope, "TIM:MAIN:SCAL ", timePerDiv);
+
+    #Channel 1 always a function of input amplitude
+    voltsPerDiv = courseCeil(ampl/st["numDivVert"]*st["vertExpandFactor"]);
+    cfg.setting(scope, "CHAN1:SCAL ", voltsPerDiv);
+
+    #Select scale for CH2, 3, 4
+    chans = station.outputChannels();
+    if (scales is not None): #Scales chosen by the caller
+        point.scales.update(autoScales.get(idx, {c: scales[c][idx] for c in chans}));
+    elif (st["predictiveAutoscale"]): #Single pass: predict the scales from the points already measured
+        point.scales.update(autoScales.get(idx, predictScales(station, st, idx, results)));
+    elif (point.sweep == "crude"): #voltsPerDiv for every channel is just scaled up greatly from CH1 scale
+        point.scales.update({c: courseCeil(ampl*st["crudeVertSweepFactor"]) for c in chans});
+    elif (point.sweep == "fine"): #Use channel vert-scales from list 'fineScaleChX'
+        fineScales = {2: station.fineScaleCh2, 3: station.fineScaleCh3, 4: station.fineScaleCh4};
+        point.scales.update({c: fineScales[c][idx] for c in chans});
+        if (point.scales[2] is None):
+            station.log("Error occured w/ vert scale being called 'none'. Length of fsc2: "+str(len(station.fineScaleCh2)));
+    else: #using guess method that is somewhat arbitrary (the size of the input)
+        point.scales.update({c: voltsPerDiv for c in chans});
+    for c in chans:
+        cfg.setting(scope, "CHAN"+str(c)+":SCAL ", point.scales[c]);
+
+    sent = time.time();
+    pt.add("scope", sent-tcfg);
+    if (st["coalescedWrites"]):
+        cfg.flush(parallel=st["concurrentConfig"]); #Returns once both instruments report the settings are applied (*OPC?)
+        if (st["concurrentConfig"]): #The instruments were configured at the same time, so split the wall time between them
+            share = (time.time()-sent)/max(sum(cfg.durations.values()), 1e-9);
+        else:
+            share = 1;
+        pt.add("awg", cfg.durations.get(instName(awg), 0)*share);
+        pt.add("scope", cfg.durations.get(instName(scope), 0)*share);
+    return sent;
+
+#**********************************************************************************#
+#*********************  DATA INTEGRITY AND EQUILIBRIUM CHECKER ********************#
+# The introduction of this code accelerated the scan speed dramatically because it #
+# eliminated the need to wait a fixed time to establish equilibrium. These fixed   #
+# times were inordinately large to help even the slowest sample points to scan, but#
+# failures were not uncommon. The boost to data reliability and elimination of     #
+# corrupt data has made the program far faster, more accurate, and reliable. NICE. #
+#**********************************************************************************#
+#                                                                                  #
+# Looks for:                                                                       #
+#   - Corrupt data from scope (ie. value > 1e30)                                   #
+#   - Measured and set frequency don't match (Added 5.5.2019)                      #
+#   - Value changes too quickly (not at equilibrium)                               #
+#                                                                                  #
+#**********************************************************************************#
+
+#
+# Waits for 'point', configured at the time 'start', to settle (see
+# settlingStrategy() for 'strategy') and leaves its reading in
+# 'station.reading'. Returns False if it didn't settle within its retry time or
+# too many readings were corrupt.
+#
+def awaitSettled(station, st, strategy, point, start):
+    freq = station.freqs[point.idx];
+    budget = station.settleBudget;
+
+    #Intervals between readings and the time the point's given
+    retry = st["maxRetryTime"];
+    poll = st["settlePollInterval"];
+    verify = st["timeWithConstReading"];
+    if (st["frequencyAwareSettling"]): #Budget the point from its excitation period and the DUT's time constant
+        poll = budget.interval(freq, st["settlePollInterval"]);
+        verify = budget.interval(freq, budget.tau); #Readings a time constant apart differ if still settling
+        retry = budget.retryTime(freq, st["maxRetryTime"], max(st["settleWindow"], st["statMinCount"]), max(poll, verify));
+    settleScale = 1;
+    if (point.deferred): #Give a point which failed during the sweep more time
+        settleScale = st["deferredSettleFactor"];
+        retry *= st["deferredSettleFactor"];
+
+    #Initial pause to let everything equilibrate
+    settle = SettlingDetector(st["maxPercentAccepted"], st["settleWindow"]);
+    learnedWait = None;
+    if (station.settleProfile is not None): #Wait as long as this DUT type needed before
+        learnedWait = station.settleProfile.initialWait(freq, settle.minReadings*poll if (strategy == "window") else verify);
+    if (learnedWait is not None):
+        point.timing.sleep("settle", learnedWait*settleScale);
+    elif (st["frequencyAwareSettling"]):
+        point.timing.sleep("settle", budget.initialWait(freq)*settleScale);
+    elif (strategy == "capture" or not (st["coalescedWrites"] or st["adaptiveSettling"])): #A waveform point is accepted from its first capture, so it always waits
+        point.timing.sleep("settle", st["setMeasDelay"]*1e-3*settleScale);
+
+    waits = SettleWaits(start, poll, verify, retry);
+    if (strategy == "stats"):
+        return settleByStatistics(station, st, point, waits);
+    if (strategy == "window"):
+        return settleByWindow(station, st, point, waits, settle);
+    return settleByReadings(station, st, point, waits, strategy == "capture");
+
+#
+# Returns the output channels of the station's last reading which are invalid
+# (> 1e30, as the scope reports a trace which doesn't fit on the screen) while
+# the input and its frequency were read. A scope which is still re-arming
+# invalidates every measurement, so then none are.
+#
+def overranged(station):
+    rec = station.reading;
+    if (rec.freq > 1e30 or rec.ch1 > 1e30):
+        return set();
+    return set(c for c in station.outputChannels() if rec[c] > 1e30);
+
+#
+# Steps the vertical scale of each of the channels 'chans' of 'point' one step
+# up the courseCeil() ladder. Returns a dict of the new scales of the channels
+# which were rescaled (not those already at the largest scale).
+#
+def stepUp(station, point, chans):
+    changed = {};
+    for c in sorted(chans):
+        if (point.scales.get(c) is None):
+            continue;
+        newScale = courseStep(point.scales[c], 1);
+        if (newScale != point.scales[c]):
+            station.log("\tCH" + str(c) + " overrange (invalid reading) at " + str(point.scales[c]) + " V/div. Rescaling to " + str(newScale) + " V/div.");
+            station.scope.setting("CHAN" + str(c) + ":SCAL ", newScale);
+            changed[c] = newScale;
+    return changed;
+
+#
+# Takes a reading of 'point' (see collect()), retrying corrupt readings. If
+# 'checkScreen' is True, or the first reading is corrupt and 'clipDetection' is
+# set, the screen traces are checked after the reading and the channels which
+# clipped or are too small are rescaled (see rescaleClipped()). If the point's
+# scales are being corrected, an output channel which reads invalid twice in a
+# row is taken to be overrange and stepped up (see stepUp()) whether or not
+# 'clipDetection' is set. Both count against 'maxRescales' and keep
+# 'point.scales' and the fine scales in step. Returns 'ok', 'rescaled' (the
+# point must be judged again from new readings) or 'failed' (too many corrupt
+# readings).
+#
+def readPoint(station, st, point, checkScreen):
+    idx, pt = point.idx, point.timing;
+    num_failed = 0;
+    lastOver = set(); #Output channels invalid in the last reading
+    while (True):
+        ok = pt.read(lambda: collect(station, st)); #collect() will return false if bad/corrupt data is received (value will be > 1e30).
+        canRescale = point.rescales.get(idx, 0) < st["maxRescales"];
+        changed = {};
+        if (checkScreen or (not ok and num_failed == 0 and st["clipDetection"])): #Rescale only the channels which clipped (ie. the corrupt values) or are too small
+            checkScreen = False;
+            changed = rescaleClipped(station, st, point.sweep != "crude") if canRescale else {};
+        over = overranged(station) if (not ok) else set();
+        if (len(changed) == 0 and point.correcting and canRescale): #A single corrupt value may be noise, the same channel twice is the trace off the screen
+            changed = stepUp(station, point, over & lastOver);
+        lastOver = over;
+        if (len(changed) > 0):
+            point.rescales[idx] = point.rescales.get(idx, 0) + 1;
+            point.scales.update(changed);
+            if (point.sweep == "fine"):
+                fineScales = {2: station.fineScaleCh2, 3: station.fineScaleCh3, 4: station.fineScaleCh4};
+                for c in changed:
+                    fineScales[c][idx] = changed[c];
+            pt.retry("rescale");
+            return "rescaled";
+        if (ok):
+            return "ok";
+        num_failed += 1;
+        pt.retry("corrupt");
+        pt.sleep("wait", .333);
+        if (num_failed > 15): #Cancel scan if too many attempts fail (Takes a maximum of 5 seconds to fail + initial delay)
+            station.log("Failed to collect all data points successfully.");
+            return "failed";
+
+#
+# Accepts 'point' once two readings 'waits.verify' apart (at the set frequency)
+# agree to 'maxPercentAccepted', or if 'single' is True (a waveform capture) the
+# first reading at the set frequency. Returns False if the retry time expired.
+#
+def settleByReadings(station, st, point, waits, single):
+    freq, pt = station.freqs[point.idx], point.timing;
+    old = None; #Reading being verified
+    checkScreen = st["clipDetection"]; #Check the screen traces after the first reading
+    while (True): #continue trying until accurate readings are had...
+        got = readPoint(station, st, point, checkScreen);
+        checkScreen = False;
+        if (got == "failed"):
+            return False;
+        if (got == "rescaled"): #Read the point again at the new scale
+            old = None;
+            checkScreen = True;
+            pt.sleep("wait", waits.poll);
+            continue;
+        rec = station.reading;
+        if (old is not None):
+            dval = max(mpc(a, b) for a, b in zip(old, rec));
+            if (dval <= st["maxPercentAccepted"]):
+                station.log("Passed scan No. " + str(len(pt.reads)) + " with an error of " + str(dval) + " %. Tot. elapsed time: " + str(time.time()-waits.start) + " sec");
+                station.log("\tRead round trips for point: " + str(getRoundTrips()));
+                settledPoint(station, freq, time.time()-waits.start, len(pt.reads), len(pt.reads)-2);
+                return True; #The measurement has satisfied the subroutine's integrity check
+            pt.retry("unsettled"); #The measurement was too far off from the original measurement, try again
+            old = rec;
+            station.log("The measurement, although non-corrupt, failed the equilibrium+integrity check.");
+            station.log("\tAfter ~" + str(waits.verify) + " seconds, % change: " + str(dval));
+        elif (mpc(rec.freq, freq) > st["maxPercentAcceptedFrequencyDelta"]): #Ensure measured and set frequencies match (within a certain margin of error)
+            pt.retry("frequency");
+            station.log("The measurement, although non-corrupt, failed the equilibrium+integrity check.");
+            station.log("\tFrequency was out of spec. Set: " + str(freq) + " Hz \tMeas: " + str(rec.freq) + " Hz");
+        elif (single): #A single triggered capture after the settle wait needs no second reading
+            station.log("Passed scan No. " + str(len(pt.reads)) + " from a single capture. Tot. elapsed time: " + str(time.time()-waits.start) + " sec");
+            station.log("\tRead round trips for point: " + str(getRoundTrips()));
+            settledPoint(station, freq, time.time()-waits.start, len(pt.reads), len(pt.reads)-1);
+            return True;
+        else:
+            old = rec;
+            pt.sleep("wait", waits.verify); #Wait a bit...
+            continue;
+        station.log("\tTET: "+str(time.time()-waits.start));
+        if (time.time() - waits.start > waits.retry):
+            station.log("Measurement retry time expired. Aborting scan.");
+            return False;
+        pt.sleep("wait", waits.verify); #Wait a bit...
+
+#
+# Polls 'point' every 'waits.poll' seconds and accepts it as soon as the
+# readings at the set frequency converge in the sliding window 'settle' (see
+# settling.py). Returns False if the retry time expired first.
+#
+def settleByWindow(station, st, point, waits, settle):
+    freq, pt = station.freqs[point.idx], point.timing;
+    checkScreen = st["clipDetection"];
+    while (True):
+        got = readPoint(station, st, point, checkScreen);
+        checkScreen = False;
+        if (got == "failed"):
+            return False;
+        if (got == "rescaled"):
+            settle.reset();
+            checkScreen = True;
+            pt.sleep("wait", waits.poll);
+            continue;
+        rec = station.reading;
+        atFreq = mpc(rec.freq, freq) <= st["maxPercentAcceptedFrequencyDelta"];
+        if (not atFreq): #Readings from before the new frequency don't count
+            pt.retry("frequency");
+            settle.reset();
+        elif (settle.add(rec) and settle.settled()):
+            station.log("Settled after scan No. " + str(len(pt.reads)) + " with an estimated error of " + str(settle.lastError) + " %. Tot. elapsed time: " + str(time.time()-waits.start) + " sec");
+            station.log("\tRead round trips for point: " + str(getRoundTrips()));
+            settledPoint(station, freq, time.time()-waits.start, settle.added, settle.added - settle.minReadings);
+            return True;
+        if (time.time() - waits.start > waits.retry):
+            if (settle.settled(final=True)):
+                station.log("Accepted after scan No. " + str(len(pt.reads)) + " at the retry time limit with an error of " + str(settle.lastError) + " %");
+                settledPoint(station, freq, time.time()-waits.start, settle.added, settle.added);
+                return True;
+            station.log("Measurement retry time expired (estimated error: " + str(settle.lastError) + " %). Aborting scan.");
+            return False;
+        if (atFreq):
+            pt.retry("unsettled");
+        pt.sleep("wait", waits.poll);
+
+#
+# Judges 'point' from the scope's statistics: they're reset once it's
+# configured, and it's accepted when the deviation over 'statMinCount'
+# acquisitions is within 'maxPercentAccepted' (at the set frequency). Returns
+# False if the retry time expired first.
+#
+def settleByStatistics(station, st, point, waits):
+    scope = station.scope;
+    freq, pt = station.freqs[point.idx], point.timing;
+    minCount = st["statMinCount"];
+    scope.write("MEAS:STAT:RES"); #Only acquisitions from after the wait count
+    pt.sleep("settle", minCount*waits.poll); #The point can't be judged before it has enough acquisitions
+    checkScreen = st["clipDetection"];
+    while (True):
+        got = readPoint(station, st, point, checkScreen);
+        checkScreen = False;
+        if (got == "failed"):
+            return False;
+        if (got == "rescaled"): #Start the statistics over at the new scale
+            scope.write("MEAS:STAT:RES");
+            checkScreen = True;
+            pt.sleep("wait", minCount*waits.poll);
+            continue;
+        dval, count = statisticsError(station.stats);
+        atFreq = mpc(station.reading.freq, freq) <= st["maxPercentAcceptedFrequencyDelta"];
+        if (count >= minCount and dval <= st["maxPercentAccepted"] and atFreq):
+            station.log("Passed scan No. " + str(len(pt.reads)) + " with a deviation of " + str(dval) + " % over " + str(int(count)) + " acquisitions. Tot. elapsed time: " + str(time.time()-waits.start) + " sec");
+            station.log("\tRead round trips for point: " + str(getRoundTrips()));
+            settledPoint(station, freq, time.time()-waits.start, len(pt.reads), len(pt.reads)-1);
+            return True;
+        if (count >= minCount): #Still settling (or the wrong frequency): start the statistics over
+            pt.retry("unsettled" if atFreq else "frequency");
+            station.log("The measurement, although non-corrupt, failed the equilibrium+integrity check.");
+            station.log("\tDeviation over " + str(int(count)) + " acquisitions: " + str(dval) + " %");
+            scope.write("MEAS:STAT:RES");
+        if (time.time() - waits.start > waits.retry):
+            station.log("Measurement retry time expired. Aborting scan.");
+            return False;
+        pt.sleep("wait", waits.poll if count < minCount else minCount*waits.poll);
+
+#
+# Checks the reading of 'point' against the vertical scales it was measured at
+# (see checkRange()). Returns the scales to measure it again at, or None if
+# every output channel was in range. A fine sweep's fine scales are corrected.
+#
+def correctScales(station, st, point):
+    newScales = {};
+    for c in station.outputChannels():
+        state, newScales[c] = checkRange(station.reading[c], point.scales[c], st["numDivVert"], st["fineVertScaleFactor"], courseCeil);
+        if (state != "ok"):
+            station.log("\tCH" + str(c) + " " + state + "range at " + str(point.scales[c]) + " V/div. Rescaling to " + str(newScales[c]) + " V/div.");
+    if (newScales == point.scales):
+        return None;
+    if (point.sweep == "fine"): #Correct the fine scale itself
+        fineScales = {2: station.fineScaleCh2, 3: station.fineScaleCh3, 4: station.fineScaleCh4};
+        for c in newScales:
+            fineScales[c][point.idx] = newScales[c];
+    return newScales;
+
+#
+# Measure a transfer function (using 1+ data points) at the station's sample
+# points with the settings 'st', appending the results to its buffers. If
+# 'scales' is given ({channel: [V/div per point]}) the output channels start at
+# those scales, and points which are over/underrange are rescaled and measured
+# again. Returns False if the scan failed.
+#
+def meas(station, crudeSweep, st, scales=None):
+
+    freqs, ampls = station.freqs, station.ampls;
+
+    station.scaleCacheMiss = False;
+    station.pointScaleLog = {};
+
+    if (scales is not None): #Label the points' timing with the sweep
+        sweep = "adaptive";
+    elif (st["autoDualSweep"] and not st["predictiveAutoscale"]):
+        sweep = "crude" if crudeSweep else "fine";
+    else:
+        sweep = "single";
+    if (sweep == "fine" and len(station.fineScaleCh2) < 1):
+        station.log("Fine scale list is unpopulated!");
+        return False;
+    strategy = settlingStrategy(st);
+
+    #Turn on generator
+    station.awg.setting("C2:OUTP ", "ON");
+
+    results = {}; #Index -> (f, ch1, ch2, ch3, ch4, status)
+    points = range(len(freqs));
+    if (sweep == "crude" and st["crudeDecimation"] > 1 and not station.grid): #The crude sweep only needs a rough amplitude along the TF (a 2-D grid isn't one TF)
+        points = decimatedIndices(len(freqs), st["crudeDecimation"]);
+        station.log("Crude sweep of " + str(len(points)) + " of " + str(len(freqs)) + " points.");
+    queue = [(idx, False) for idx in points]; #(Index, deferred). Failed points are appended and retried at the end
+    autoScales = {}; #Index -> {channel: V/div} chosen after a point was over/underrange
+    if (st["predictiveAutoscale"] and station.cachedScales is not None): #Start from the scales of the last scan of this DUT type
+        autoScales = {i: {c: station.cachedScales[c][i] for c in station.outputChannels()} for i in range(len(freqs))};
+    rescales = {}; #Index -> no. times the point was re-measured at a new scale
+    qi = 0;
+    while (qi < len(queue)):
+        idx, deferred = queue[qi];
+        qi += 1;
+        resetRoundTrips(); #Count VISA transactions for this point
+        correcting = st["predictiveAutoscale"] or sweep == "adaptive" or (sweep == "fine" and station.interpolatedScales and idx not in station.crudeIndices);
+        point = MeasPoint(idx, sweep, PointTiming(idx, freqs[idx], ampls[idx], sweep, deferred), deferred, {}, rescales, correcting);
+
+        start = configurePoint(station, st, point, scales, autoScales, results); #Get total time req'd for data point from here
+        failed = not awaitSettled(station, st, strategy, point, start);
+
+        #Fall back to finding the scales again if a point overranged with the cached fine scales
+        if (station.cachedScales is not None and sweep == "fine" and not failed):
+            for c in station.outputChannels():
+                if (checkRange(station.reading[c], point.scales[c], st["numDivVert"], st["fineVertScaleFactor"], courseCeil)[0] == "over"):
+                    station.log("\tCH" + str(c) + " overrange at its cached scale (" + str(point.scales[c]) + " V/div).");
+                    station.scaleCacheMiss = True;
+                    return False;
+
+        #Measure the point again if it didn't fit its vertical scales (predicted, or interpolated from a decimated crude sweep)
+        if (point.correcting and not failed and rescales.get(idx, 0) < st["maxRescales"]):
+            newScales = correctScales(station, st, point);
+            if (newScales is not None):
+                autoScales[idx] = newScales;
+                rescales[idx] = rescales.get(idx, 0) + 1;
+                queue.insert(qi, (idx, deferred)); #Measure it again next
+                station.timing.add(point.timing.finish("rescaled"));
+                continue;
+
+        station.timing.add(point.timing.finish("failed" if failed else ("rescanned" if deferred else "ok")));
+
+        if (failed): #Give up on the scan, or come back to the point at the end of the sweep
+            if (not st["deferFailedPoints"]):
+                return False;
+            if (not deferred):
+                station.log("Deferring point No. " + str(idx) + " (" + str(freqs[idx]) + " Hz, " + str(ampls[idx]) + " V) to the end of the sweep.");
+                queue.append((idx, True));
+            else:
+                station.log("Point No. " + str(idx) + " failed again. Recording it as missing.");
+                results[idx] = (float(freqs[idx]), np.nan, np.nan, np.nan, np.nan, "missing");
+            continue;
+
+        #Once past the data integrity+equilibrium check, keep the result
+        results[idx] = tuple(station.reading) + ("rescanned" if deferred else "ok",);
+        if (st["predictiveAutoscale"]):
+            station.pointScaleLog[idx] = point.scales;
+
+    #Append the results in sweep order
+    station.pointStatus = [];
+    station.crudeIndices = sorted(results);
+    for idx in sorted(results):
+        station.fmeas.append(results[idx][0]);
+        station.imeas.append(results[idx][1]);
+        station.omeas.append(results[idx][2]);
+        station.meas3.append(results[idx][3]);
+        station.meas4.append(results[idx][4]);
+        station.pointStatus.append(results[idx][5]);
+    if (station.pointStatus.count("ok") < len(station.pointStatus)):
+        station.log("Re-measured points: " + str(station.pointStatus.count("rescanned")) + "\tMissing points: " + str(station.pointStatus.count("missing")));
+
+    if (st["turnOffAfterScan"]):
+        station.awg.write("C2:OUTP OFF");
+
+    return True;
@@ -0,0 +1,7 @@
+# Puts the repository's top directory, where the modules under test live, on
+# the import path.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))));
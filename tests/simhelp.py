@@ -0,0 +1,30 @@
+# Helpers for the tests which scan on the simulated bench (see simbench.py),
+# with its delays shortened so a sweep takes a few seconds.
+
+import contextlib
+import io
+
+from simbench import SimResourceManager, SimBench
+from stations import discoverStations
+from stepscan import defaultScanSettings
+
+#Scan settings which suit the fast simulated bench of simStation()
+fastSettings = dict(defaultScanSettings, setMeasDelay=100, timeWithConstReading=.1, maxRetryTime=3, dutTimeConstant=.01, settlePollInterval=.02);
+
+#
+# Returns a Station on a simulated bench (the keyword arguments are passed to
+# SimBench())
+#
+def simStation(**bench):
+    args = dict(tau=.01, latency=0, rearm=.01, timebaseLatency=0, seed=1);
+    args.update(bench);
+    with contextlib.redirect_stdout(io.StringIO()):
+        return discoverStations(SimResourceManager(SimBench(**args)), timeout=30)[0];
+
+#
+# Runs station.scan() with the settings 'fastSettings' updated by 'settings'
+# without printing its log. Returns its result.
+#
+def simScan(station, freqs, ampls, **settings):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return station.scan(freqs, ampls, dict(fastSettings, **settings));
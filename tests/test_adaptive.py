@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from adaptive import intervalErrors, adaptiveInsertions
+
+decades = [1, 10, 100, 1e3];
+
+def test_intervalErrors_of_a_line_is_zero():
+    assert intervalErrors(decades, [0, -2, -4, -6]) == pytest.approx([0, 0, 0]);
+
+def test_intervalErrors_of_a_parabola():
+    #y = log10(x)^2/2 has a second derivative of 1, so each decade is off by 1/8
+    assert intervalErrors(decades, [0, .5, 2, 4.5]) == pytest.approx([.125, .125, .125]);
+
+def test_intervalErrors_of_a_steep_interval():
+    err = intervalErrors(decades, [0, 0, -20, -20]);
+    assert err[1] >= 20;
+    assert intervalErrors(decades, [0, 0, -20, -20], maxStep=30)[1] < 20;
+
+def test_intervalErrors_of_too_few_points():
+    assert intervalErrors([1, 10], [0, 1]) == [np.inf];
+    assert intervalErrors([1], [0]) == [];
+
+def test_adaptiveInsertions_splits_the_worst_intervals_first():
+    new = adaptiveInsertions(decades, [0, 0, -20, -20], .1, 1);
+    assert new == pytest.approx([np.sqrt(1e3)]);
+    assert len(adaptiveInsertions(decades, [0, .5, 2, 4.5], .1, 10)) == 3;
+
+def test_adaptiveInsertions_within_tolerance_or_budget():
+    assert adaptiveInsertions(decades, [0, -2, -4, -6], .1, 10) == [];
+    assert adaptiveInsertions(decades, [0, .5, 2, 4.5], .5, 10) == [];
+    assert adaptiveInsertions(decades, [0, .5, 2, 4.5], .1, 0) == [];
+
+def test_adaptiveInsertions_ignores_missing_points():
+    new = adaptiveInsertions([1, 10, 100], [0, np.nan, 0], .1, 10);
+    assert new == pytest.approx([10]); #Two points left: each interval's error is infinite
+
+def test_adaptiveInsertions_stops_at_minRatio():
+    assert adaptiveInsertions([100, 100.5, 101], [0, 10, 0], .1, 10) == [];
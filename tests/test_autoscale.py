@@ -0,0 +1,18 @@
+
+from autoscale import checkScreen
+from stepscan import courseCeil, courseStep
+
+def test_checkScreen_steps_up_a_clipped_trace():
+    assert checkScreen(True, 7, 1, 8, 1.2, courseCeil, courseStep) == ("over", 2);
+
+def test_checkScreen_steps_up_a_trace_wider_than_the_screen():
+    assert checkScreen(False, 9.04, 1, 8, 1.2, courseCeil, courseStep) == ("over", 2);
+
+def test_checkScreen_keeps_the_largest_scale():
+    assert checkScreen(True, 90, 10, 8, 1.2, courseCeil, courseStep) == ("ok", 10);
+
+def test_checkScreen_fits_a_tiny_trace():
+    assert checkScreen(False, .5, 1, 8, 1.2, courseCeil, courseStep) == ("under", .1);
+
+def test_checkScreen_ignores_small_traces_without_minDivs():
+    assert checkScreen(False, .5, 1, 8, 1.2, courseCeil, courseStep, 0) == ("ok", 1);
@@ -0,0 +1,26 @@
+import numpy as np
+
+from grid2d import serpentineOrder, flattenGrid, denseGrid
+
+def test_serpentineOrder_reverses_every_other_frequency():
+    assert serpentineOrder(3, 2) == [(0, 0), (0, 1), (1, 1), (1, 0), (2, 0), (2, 1)];
+
+def test_serpentineOrder_visits_every_point_once():
+    order = serpentineOrder(4, 5);
+    assert sorted(order) == [(fi, ai) for fi in range(4) for ai in range(5)];
+    assert all(abs(a[1]-b[1]) <= 1 for a, b in zip(order, order[1:])); #The amplitude only steps to a neighbour
+
+def test_flattenGrid():
+    freqs, ampls = flattenGrid([100, 1e3], [.5, 1], serpentineOrder(2, 2));
+    assert freqs == [100, 100, 1e3, 1e3];
+    assert ampls == [.5, 1, 1, .5];
+
+def test_denseGrid_fills_the_points_not_measured():
+    grid = denseGrid([1, 2, 3], serpentineOrder(2, 2), 2, 2);
+    assert grid.shape == (2, 2);
+    assert grid[1].tolist() == [2, 3];
+    assert grid[0][0] == 1 and np.isnan(grid[0][1]);
+
+def test_denseGrid_of_strings():
+    grid = denseGrid(["ok", "missing"], serpentineOrder(1, 2), 1, 2, fill="");
+    assert grid[:, 0].tolist() == ["ok", "missing"];
@@ -0,0 +1,17 @@
+from jsonstore import loadDict, saveDict
+
+def test_saveDict_round_trips(tmp_path):
+    fn = str(tmp_path / "cache.json");
+    saveDict({"DS1Z": "USB0::1::INSTR"}, fn, "test cache");
+    assert loadDict(fn) == {"DS1Z": "USB0::1::INSTR"};
+
+def test_loadDict_reads_missing_or_bad_files_as_empty(tmp_path):
+    assert loadDict(str(tmp_path / "missing.json")) == {};
+    (tmp_path / "bad.json").write_text("{not json");
+    assert loadDict(str(tmp_path / "bad.json")) == {};
+    (tmp_path / "list.json").write_text("[1, 2]");
+    assert loadDict(str(tmp_path / "list.json")) == {};
+
+def test_saveDict_reports_but_doesnt_raise(tmp_path, capsys):
+    saveDict({}, str(tmp_path / "missing" / "cache.json"), "test cache");
+    assert "Failed to save test cache" in capsys.readouterr().out;
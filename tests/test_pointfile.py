@@ -0,0 +1,85 @@
+import pytest
+
+from kvar import write_kvar
+from pointfile import PointFile, RepeatedValue, checkFrequencies, checkLimits
+
+#
+# Writes 'text' to the file 'name' in the directory 'tmp_path', returns its path
+#
+def writeFile(tmp_path, name, text):
+    fn = tmp_path / name;
+    fn.write_text(text);
+    return str(fn);
+
+def test_kv1_plan(tmp_path):
+    fn = str(tmp_path / "plan.kv1");
+    write_kvar(fn, "plan", freqs=[100.0, 1e3, 10e3], ampls=[.5, 1.0, 2.0]);
+    pf = PointFile(fn);
+    freqs, ampls = pf.plan(True);
+    assert list(freqs) == [100, 1e3, 10e3];
+    assert list(ampls) == [.5, 1, 2];
+    assert ampls[-1] == 2 and len(ampls) == 3;
+    assert list(pf.column("ampls")) == [.5, 1, 2];
+    with pytest.raises(ValueError):
+        pf.column("vpp");
+    pf.close();
+
+def test_kv1_amplitudes_only(tmp_path):
+    fn = str(tmp_path / "ampls.kv1");
+    write_kvar(fn, "plan", ampls=[.5, 1.0]);
+    pf = PointFile(fn);
+    freqs, ampls = pf.plan(True);
+    assert freqs is None and list(ampls) == [.5, 1];
+    pf.close();
+
+def test_kv1_without_points(tmp_path):
+    fn = str(tmp_path / "empty.kv1");
+    write_kvar(fn, "plan", vpp=[1.0]);
+    with pytest.raises(ValueError):
+        PointFile(fn);
+
+def test_csv_plan_skips_headers_and_comments(tmp_path):
+    pf = PointFile(writeFile(tmp_path, "plan.csv", "freq,ampl\n100,0.5 # first\n\n1e3,1\n"));
+    freqs, ampls = pf.plan(True);
+    assert list(freqs) == [100, 1e3] and list(ampls) == [.5, 1];
+    assert pf.value(1, 1) == 1 and pf.value(-2, 0) == 100;
+    with pytest.raises(IndexError):
+        pf.value(2, 0);
+    pf.close();
+
+def test_text_single_column_is_the_independent_variable(tmp_path):
+    pf = PointFile(writeFile(tmp_path, "freqs.txt", "# Frequencies\n100\n200\n300\n"));
+    freqs, ampls = pf.plan(True);
+    assert list(freqs) == [100, 200, 300] and ampls is None;
+    assert pf.plan(False)[0] is None;
+    pf.close();
+
+def test_text_separators(tmp_path):
+    pf = PointFile(writeFile(tmp_path, "plan.txt", "100 200;300\t400\n"));
+    assert pf.width == 4 and len(pf) == 1;
+    assert list(pf.column(3)) == [400];
+    pf.close();
+
+def test_text_rows_of_different_widths(tmp_path):
+    with pytest.raises(ValueError, match="Line 2"):
+        PointFile(writeFile(tmp_path, "plan.txt", "100 1\n200\n"));
+
+def test_text_bad_value(tmp_path):
+    with pytest.raises(ValueError, match="line 3"):
+        PointFile(writeFile(tmp_path, "plan.txt", "100\n200\nabc\n"));
+
+def test_checkLimits():
+    assert checkLimits([100, 1e3], RepeatedValue(1, 2), (1e-6, 40e6), (.002, 20)) == [];
+    errors = checkLimits([100, 50e6, 1e3], [1, 1, 30], (1e-6, 40e6), (.002, 20));
+    assert len(errors) == 2;
+    assert errors[0].startswith("Point 1:") and errors[1].startswith("Point 2:");
+    assert len(checkLimits([100], [1, 1], (1e-6, 40e6), (.002, 20))) == 1;
+
+def test_checkLimits_stops_after_maxErrors():
+    errors = checkLimits([0]*20, [1]*20, (1e-6, 40e6), (.002, 20), maxErrors=3);
+    assert len(errors) == 4 and errors[-1] == "...";
+
+def test_checkFrequencies():
+    assert checkFrequencies([100, 1e3], [100.01, 1e3]) == [];
+    assert len(checkFrequencies([100, 1e3], [100, 1.1e3])) == 1;
+    assert len(checkFrequencies([100, 1e3], [100])) == 1;
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from simhelp import simStation, simScan
+from simbench import peakingFilter
+from stepscan import settlingStrategy, defaultScanSettings, courseCeil, courseStep, mpc
+
+#A 12 dB peak at 1 kHz (simbench's default DUT)
+freqs = np.logspace(2, 4, 5).tolist();
+ampls = [1]*len(freqs);
+
+#A 24 dB peak at 1 kHz: predicted scales underrange the output near the peak
+peakFreqs = np.logspace(2, np.log10(20e3), 15).tolist();
+
+#
+# Checks the station's last scan measured every point at 'freqs' with the gain
+# of the transfer function 'tf'
+#
+def checkGains(station, freqs, tf=peakingFilter(1e3, 12, 1.4)):
+    assert station.pointStatus == ["ok"]*len(freqs);
+    assert np.allclose(station.fmeas, freqs, rtol=.01);
+    gains = np.array(station.omeas)/np.array(station.imeas);
+    assert np.allclose(gains, np.abs(tf(np.array(freqs))), rtol=.05);
+
+def test_courseCeil_rounds_up_the_scale_ladder():
+    assert courseCeil(.3) == .5;
+    assert courseCeil(2) == 2;
+    assert courseCeil(11) is None;
+
+def test_courseStep_stops_at_the_ends():
+    assert courseStep(1, 1) == 2;
+    assert courseStep(1e-3, -1) == 1e-3;
+    assert courseStep(10, 1) == 10;
+
+def test_mpc():
+    assert mpc(1, 1.1) == pytest.approx(10);
+    assert mpc(0, 0) == 0;
+    assert mpc(0, 1) == 1000;
+
+@pytest.mark.parametrize("settings, strategy", [
+    ({}, "pair"),
+    ({"adaptiveSettling": True}, "window"),
+    ({"statVerification": True, "adaptiveSettling": True}, "stats"),
+    ({"waveformAcquisition": True, "statVerification": True}, "capture"),
+])
+def test_settlingStrategy(settings, strategy):
+    assert settlingStrategy(dict(defaultScanSettings, **settings)) == strategy;
+
+#Each settling strategy, with and without the options it's usually run with
+@pytest.mark.parametrize("settings", [
+    {},
+    {"batchedReads": True, "coalescedWrites": True},
+    {"adaptiveSettling": True, "batchedReads": True},
+    {"adaptiveSettling": True, "frequencyAwareSettling": True, "coalescedWrites": True, "concurrentConfig": True},
+    {"statVerification": True},
+    {"waveformAcquisition": True},
+], ids=["pair", "pair-coalesced", "window", "window-budgeted", "stats", "capture"])
+def test_meas_settles_with_each_strategy(settings):
+    station = simStation();
+    assert simScan(station, freqs, ampls, **settings);
+    checkGains(station, freqs);
+
+#Each way of choosing the output channels' vertical scales
+@pytest.mark.parametrize("settings", [
+    {"autoDualSweep": False, "clipDetection": True},
+    {},
+    {"crudeDecimation": 2},
+    {"clipDetection": True},
+    {"predictiveAutoscale": True},
+    {"predictiveAutoscale": True, "clipDetection": True, "adaptiveSettling": True},
+], ids=["guess-clip", "dual", "decimated", "clip", "predictive", "predictive-clip"])
+def test_meas_with_each_autoscale_mode(settings):
+    station = simStation();
+    assert simScan(station, freqs, ampls, **settings);
+    checkGains(station, freqs);
+
+#Without clip detection, a single sweep at the input's scale only reads a DUT without gain
+def test_single_sweep_at_the_input_scale():
+    tf = peakingFilter(1e3, -6, 1);
+    station = simStation(tf=tf);
+    assert simScan(station, freqs, ampls, autoDualSweep=False);
+    checkGains(station, freqs, tf);
+
+def test_decimated_crude_sweep_measures_fewer_points():
+    station = simStation();
+    assert simScan(station, peakFreqs, [1]*len(peakFreqs), crudeDecimation=4, adaptiveSettling=True);
+    crude = [p for p in station.timing.points if p.sweep == "crude"];
+    assert len(set(p.index for p in crude)) < len(peakFreqs);
+    checkGains(station, peakFreqs);
+
+def test_predictive_autoscale_recovers_from_overrange():
+    station = simStation(tf=peakingFilter(1e3, 24, 3));
+    assert simScan(station, peakFreqs, [1]*len(peakFreqs), predictiveAutoscale=True);
+    checkGains(station, peakFreqs, peakingFilter(1e3, 24, 3));
+
+def test_predictive_autoscale_without_rescales_fails_on_overrange():
+    station = simStation(tf=peakingFilter(1e3, 24, 3));
+    assert not simScan(station, peakFreqs, [1]*len(peakFreqs), predictiveAutoscale=True, maxRescales=0);
+
+def test_deferred_points_are_recorded_as_missing():
+    station = simStation(pCorrupt=1); #Every reading corrupt
+    assert simScan(station, freqs[:2], ampls[:2], deferFailedPoints=True, autoDualSweep=False, maxRetryTime=.2);
+    assert station.pointStatus == ["missing"]*2;
+    assert all(np.isnan(station.omeas));
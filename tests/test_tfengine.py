@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from tfengine import snapToGrid, binExactStep, multisine, toneAmplitudes
+
+def test_snapToGrid_picks_the_coarsest_step():
+    df, harm = snapToGrid([100, 1e3, 10e3]);
+    assert df == 10 and harm.tolist() == [10, 100, 1000];
+    df, harm = snapToGrid([10, 12]);
+    assert df == 2 and harm.tolist() == [5, 6];
+    assert snapToGrid([3])[0] == 5; #Every tone at least the first harmonic
+
+def test_snapToGrid_of_frequencies_too_close():
+    with pytest.raises(ValueError):
+        snapToGrid([1, 1.01]);
+
+@pytest.mark.parametrize("df", [1e3, 3e3, 7.7, 1e7])
+def test_binExactStep_is_a_whole_number_of_samples(df):
+    xinc = 1e-6;
+    step = binExactStep(df, xinc);
+    n = 1/(step*xinc);
+    assert n == pytest.approx(round(n)) and round(n) >= 1;
+    if (df*xinc < 1):
+        assert step == pytest.approx(df, rel=1/(2*n) + 1e-9);
+
+def test_multisine_tones():
+    harm = np.arange(3, 23);
+    wave, cf = multisine(harm, 1000);
+    assert np.max(np.abs(wave)) == pytest.approx(1);
+    spec = np.abs(np.fft.rfft(wave));
+    assert spec[harm] == pytest.approx(spec[harm[0]]*np.ones(len(harm)), rel=.2); #Roughly flat (the clipping leaves ripple)
+    assert spec[np.setdiff1d(np.arange(len(spec)), harm)].max() < 1e-6*spec.max();
+    assert cf <= multisine(harm, 1000, 0)[1] < np.sqrt(2*len(harm)); #No worse than Schroeder's phases
+
+def test_toneAmplitudes():
+    xinc = 1e-5;
+    df = binExactStep(10, xinc);
+    harm = np.array([2, 5]);
+    t = np.arange(25000)*xinc;
+    traces = np.array([np.sin(2*np.pi*2*df*t) + .25*np.cos(2*np.pi*5*df*t)]);
+    assert toneAmplitudes(traces, xinc, df, harm, 2)[0] == pytest.approx([2, .5]);
+
+def test_toneAmplitudes_rejects_records_which_would_leak():
+    traces = np.zeros((1, 25000));
+    with pytest.raises(ValueError):
+        toneAmplitudes(traces, 1e-5, 250.15, np.array([1]), 2); #800 samples are 2.0012 periods
+    with pytest.raises(ValueError):
+        toneAmplitudes(traces, 1e-5, 10, np.array([1]), 20);
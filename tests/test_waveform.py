@@ -0,0 +1,57 @@
+import time
+
+import numpy as np
+import pytest
+
+from simbench import SimResourceManager, SimBench
+from waveform import decodeBlock, measureWaveforms, offScreen, screenTraces, setupWaveformRead
+
+#Channel 1: 1 kHz sine of 2 Vpp, channel 2: 3 kHz sine of 1 Vpp (1 MSa/s)
+xinc = 1e-6;
+t = np.arange(20000)*xinc;
+volts = np.array([np.sin(2*np.pi*1e3*t), .5*np.sin(2*np.pi*3e3*t)]);
+
+def test_decodeBlock():
+    data = bytes(range(12));
+    assert decodeBlock(b'#212' + data + b'\n').tolist() == list(range(12));
+    assert decodeBlock(b'#15' + data).tolist() == list(range(5));
+
+def test_decodeBlock_rejects_a_bad_header():
+    with pytest.raises(ValueError):
+        decodeBlock(b'12' + bytes(10));
+
+def test_measureWaveforms():
+    wm = measureWaveforms(volts, xinc);
+    assert wm.freq == pytest.approx(1e3, rel=1e-4);
+    assert wm.vpp == pytest.approx([2, 1], rel=1e-3);
+    assert wm.rms == pytest.approx([1/np.sqrt(2), .5/np.sqrt(2)], rel=1e-3);
+    assert wm.avg == pytest.approx([0, 0], abs=1e-3);
+    assert wm.clipped.tolist() == [False, False];
+
+def test_measureWaveforms_hysteresis_ignores_noise_at_the_crossings():
+    noisy = volts + np.random.default_rng(1).normal(0, .02, volts.shape);
+    assert measureWaveforms(noisy, xinc).freq == pytest.approx(1e3, rel=1e-3);
+    assert measureWaveforms(noisy, xinc, hysteresis=0).freq > 1.5e3;
+
+def test_measureWaveforms_without_two_cycles():
+    assert measureWaveforms(volts[:, 250:1500], xinc).freq == 0;
+
+def test_measureWaveforms_flags_clipped_traces():
+    raw = np.array([[27, 227], [60, 190]], dtype=np.uint8);
+    assert measureWaveforms(volts, xinc, raw).clipped.tolist() == [True, False];
+
+def test_offScreen_judges_the_screen_edges_not_the_adc_rails():
+    raw = np.array([[27, 127, 227], [15, 127, 239], [28, 127, 226]], dtype=np.uint8);
+    assert offScreen(raw, 127).tolist() == [True, True, False];
+
+def test_screenTraces_finds_a_trace_off_the_screen():
+    rm = SimResourceManager(SimBench(tf=lambda f: 9, pCorrupt=0, seed=1));
+    scope = rm.open_resource(rm.list_resources()[0]);
+    awg = rm.open_resource(rm.list_resources()[1]);
+    awg.write("C2:BSWV FRQ,1000;C2:BSWV AMP,1;C2:OUTP ON");
+    scope.write("CHAN2:SCAL 1");
+    time.sleep(.5);
+    setupWaveformRead(scope);
+    clipped, span = screenTraces(scope, [2]);
+    assert clipped == [True];
+    assert abs(span[0] - 9) < .5;
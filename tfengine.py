@@ -0,0 +1,331 @@
+# This file defines the swept-sine (chirp) transfer function engine. Rather than
+# stepping the generator through each sample frequency and waiting for the DUT
+# to settle at every point, the generator's built-in log sweep excites every
+# frequency in one pass. The input and output are captured in one long-memory
+# scope acquisition and the transfer function is calculated at all requested
+# frequencies by FFT deconvolution.
+#
+# The multisine mode instead uploads a periodic sum of sines (one tone per
+# sample frequency) to the generator as an arbitrary waveform and measures
+# every tone's amplitude with a bin-exact FFT of a whole number of periods. The
+# repetition rate is fitted to the scope's sample interval so a whole number of
+# periods is also a whole number of samples.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from tfengine import *'.
+#
+
+from collections import namedtuple
+from time import sleep
+import time
+
+import numpy as np
+
+from scpi import CommandQueue, instLock, countRoundTrip
+from waveform import readRawWaveform
+
+#
+# Result of a chirp scan. 'freqs' are the requested frequencies (Hz), 'inVpp'
+# is the Vpp of the input (CH1) and 'gain', 'phase' (degrees) and 'vpp' are
+# dicts keyed by channel number (2-4) giving the gain (V/V) and phase at each
+# frequency relative to CH1, and the largest Vpp seen on the channel.
+#
+ChirpResult = namedtuple('ChirpResult', ['freqs', 'inVpp', 'gain', 'phase', 'vpp']);
+
+#
+# Returns the largest memory depth which is valid for any number of enabled
+# channels up to 'nchans' on a DS1000Z.
+#
+def chirpMemDepth(nchans):
+    if (nchans <= 2):
+        return 6000000;
+    return 3000000;
+
+#
+# Estimates the transfer function from 'x' to each row of 'y' (1D or 2D numpy
+# arrays sampled every 'xinc' seconds) at each frequency in 'freqs'. The
+# cross-spectrum is averaged over a band 1/'bandsPerOctave' octaves wide around
+# each frequency. Returns a complex numpy array (one row per row of 'y').
+#
+def estimateTF(x, y, xinc, freqs, bandsPerOctave=24):
+    freqs = np.asarray(freqs, dtype=float);
+    y = np.atleast_2d(y);
+
+    X = np.fft.rfft(x - np.mean(x));
+    Y = np.fft.rfft(y - np.mean(y, axis=1)[:, None], axis=1);
+    fb = np.fft.rfftfreq(len(x), xinc);
+
+    #Sum each band with cumulative sums so every frequency is evaluated at once
+    half = 2**(1/(2*bandsPerOctave));
+    lo = np.searchsorted(fb, freqs/half);
+    hi = np.maximum(np.searchsorted(fb, freqs*half, side='right'), lo+1);
+    hi = np.minimum(hi, len(fb));
+
+    cxy = np.concatenate((np.zeros((y.shape[0], 1)), np.cumsum(Y*np.conj(X), axis=1)), axis=1);
+    cxx = np.concatenate(([0], np.cumsum(np.abs(X)**2)));
+
+    return (cxy[:, hi] - cxy[:, lo]) / (cxx[hi] - cxx[lo]);
+
+#
+# Sets the generator up for a log sweep from 'f0' to 'f1' Hz over 'sweepTime'
+# seconds at 'ampl' Vpp, started by a manual trigger. The output is left off:
+# while waiting for the trigger the generator puts out the 'f0' carrier, which
+# would trigger the scope before the sweep starts.
+#
+def setupChirp(awg, f0, f1, ampl, sweepTime):
+    q = CommandQueue();
+    q.write(awg, "C2:OUTP OFF");
+    q.write(awg, "C2:BSWV WVTP,SINE");
+    q.write(awg, "C2:BSWV AMP," + str(ampl));
+    q.write(awg, "C2:SWWV STATE,ON,TIME," + str(sweepTime) + ",START," + str(f0) + ",STOP," + str(f1) + ",SWMD,LOG,DIR,UP,TRSR,MAN");
+    q.flush();
+
+#
+# Runs one chirp capture and returns the ChirpResult. 'chans' are the scope
+# channels to read (CH1 must be the input), 'vertScales' is a dict of the V/div
+# to use for each channel, 'numDivHoriz' is the no. horizontal divisions on the
+# scope screen and 'margin' is the factor by which the record is made longer
+# than the sweep (so the whole sweep is captured). The scope triggers on CH1
+# rising through a quarter of 'ampl' when the generator's output is turned on
+# together with the start of the sweep, so the record starts with the sweep.
+# Raises RuntimeError if the scope doesn't complete the capture.
+#
+def chirpScan(scope, awg, freqs, ampl, chans, vertScales, sweepTime=2, numDivHoriz=12, margin=1.25):
+    f0 = min(freqs)/1.25; #Sweep a little past the requested frequencies to keep the band edges clean
+    f1 = max(freqs)*1.25;
+    recordTime = sweepTime*margin;
+    timePerDiv = recordTime/numDivHoriz;
+
+    setupChirp(awg, f0, f1, ampl, sweepTime);
+
+    q = CommandQueue();
+    for c in chans:
+        q.write(scope, "CHAN" + str(c) + ":SCAL " + str(vertScales[c]));
+    q.write(scope, "RUN"); #Memory depth can only be changed while running
+    q.write(scope, "ACQ:MDEP " + str(chirpMemDepth(len(chans))));
+    q.write(scope, "TIM:MAIN:SCAL " + str(timePerDiv));
+    q.write(scope, "TIM:MAIN:OFFS " + str(recordTime/2)); #Trigger at the left edge of the screen
+    q.write(scope, "TRIG:EDG:SOUR CHAN1");
+    q.write(scope, "TRIG:EDG:SLOP POS");
+    q.write(scope, "TRIG:EDG:LEV " + str(ampl/4)); #Above the noise of the idle (output off) input
+    q.flush();
+
+    try:
+        with instLock(scope):
+            #Arm the scope, then start the sweep
+            scope.write(":SING");
+            start = time.time();
+            while (scope.query(":TRIG:STAT?").strip() == "STOP"):
+                countRoundTrip();
+                if (time.time() - start > 2):
+                    raise RuntimeError("Scope did not arm for chirp capture");
+                sleep(.01);
+            start_sweep = CommandQueue(); #Start the sweep and turn the output on in one message
+            start_sweep.write(awg, "C2:SWWV MTRIG");
+            start_sweep.write(awg, "C2:OUTP ON");
+            start_sweep.flush();
+
+            #Wait for the record to fill
+            sleep(recordTime);
+            while (scope.query(":TRIG:STAT?").strip() != "STOP"):
+                countRoundTrip();
+                if (time.time() - start > recordTime*2 + 5):
+                    raise RuntimeError("Chirp capture did not complete");
+                sleep(.05);
+
+            npts = int(float(scope.query(":ACQ:MDEP?")));
+            countRoundTrip();
+
+            traces = [];
+            for c in chans:
+                v, xinc = readRawWaveform(scope, c, npts);
+                traces.append(v);
+    finally:
+        #Return the instruments to stepped-sine operation
+        awg.write("C2:SWWV STATE,OFF");
+        awg.write("C2:OUTP ON");
+        q = CommandQueue();
+        q.write(scope, "TIM:MAIN:OFFS 0");
+        q.write(scope, "ACQ:MDEP AUTO");
+        q.write(scope, "TRIG:EDG:LEV 0");
+        q.write(scope, "RUN");
+        q.flush();
+
+    traces = np.vstack(traces);
+    H = estimateTF(traces[0], traces[1:], xinc, freqs);
+
+    gain = {};
+    phase = {};
+    vpp = {};
+    for i in range(1, len(chans)):
+        gain[chans[i]] = np.abs(H[i-1]);
+        phase[chans[i]] = np.degrees(np.angle(H[i-1]));
+        vpp[chans[i]] = float(np.ptp(traces[i]));
+
+    return ChirpResult(list(freqs), float(np.ptp(traces[0])), gain, phase, vpp);
+
+#
+# Result of a multisine scan. 'freqs' are the tone frequencies (Hz) after
+# snapping to the record's bins, 'tones' is a dict keyed by channel number
+# (1-4) giving the Vpp of each tone on that channel and 'vpp' is a dict of the
+# largest Vpp seen on each channel.
+#
+MultisineResult = namedtuple('MultisineResult', ['freqs', 'tones', 'vpp']);
+
+#
+# Snaps each frequency in 'freqs' to a multiple of a common frequency step
+# 'df' (the repetition rate of the multisine), picking the largest step from
+# 'steps' which keeps every tone on its own bin. Returns (df, harmonic no. of
+# each frequency).
+#
+def snapToGrid(freqs, steps=[10, 5, 2, 1, .5, .2, .1]):
+    freqs = np.asarray(freqs, dtype=float);
+    for df in steps:
+        harm = np.round(freqs/df).astype(int);
+        if (harm.min() >= 1 and len(np.unique(harm)) == len(harm)):
+            return df, harm;
+    raise ValueError("Sample frequencies are too closely spaced for a multisine");
+
+#
+# Builds one period ('npts' samples) of a multisine with equal amplitude tones
+# at the harmonics 'harm'. The phases start from Schroeder's formula and are
+# improved by 'iterations' rounds of clipping the peaks and re-projecting onto
+# the tone bins, keeping the lowest crest factor found. Returns (waveform
+# normalized to a peak of 1, crest factor).
+#
+def multisine(harm, npts, iterations=50):
+    K = len(harm);
+    idx = np.arange(1, K+1);
+    phases = -np.pi*idx*(idx-1)/K;
+
+    best = None;
+    bestCF = np.inf;
+    for it in range(iterations+1):
+        spec = np.zeros(npts//2+1, dtype=complex);
+        spec[harm] = np.exp(1j*phases);
+        x = np.fft.irfft(spec, npts);
+
+        cf = np.max(np.abs(x))/np.sqrt(np.mean(x**2));
+        if (cf < bestCF):
+            best = x;
+            bestCF = cf;
+
+        #Clip the peaks and keep the phases of the result
+        lim = .9*np.max(np.abs(x));
+        phases = np.angle(np.fft.rfft(np.clip(x, -lim, lim))[harm]);
+
+    return best/np.max(np.abs(best)), bestCF;
+
+#
+# Uploads the normalized waveform 'wave' to the generator as an arbitrary
+# waveform repeating at 'df' Hz with 'ampl' Vpp, and selects it on CH2.
+#
+def uploadMultisine(awg, wave, df, ampl, name="ripms"):
+    data = np.round(wave*32767).astype('<i2').tobytes();
+    header = "C2:WVDT WVNM," + name + ",LENGTH," + str(len(data)) + ",FREQ," + str(df) + ",AMPL," + str(ampl) + ",OFST,0,PHASE,0,WAVEDATA,";
+    with instLock(awg):
+        awg.write_raw(header.encode('ascii') + data);
+    countRoundTrip();
+
+    q = CommandQueue();
+    q.write(awg, "C2:ARWV NAME," + name);
+    q.write(awg, "C2:BSWV WVTP,ARB");
+    q.write(awg, "C2:SRATE MODE,TARB,VALUE," + str(len(wave)*df)); #Play every point exactly once per period
+    q.write(awg, "C2:BSWV FRQ," + str(df));
+    q.write(awg, "C2:BSWV AMP," + str(ampl));
+    q.write(awg, "C2:OUTP ON");
+    q.flush();
+
+#
+# Returns the repetition rate closest to 'df' (Hz) whose period is a whole
+# number of scope samples 'xinc' (sec) apart, so a record of whole periods
+# holds a whole number of samples and every tone falls exactly on a bin.
+#
+def binExactStep(df, xinc):
+    n = max(1, int(round(1/(df*xinc)))); #Samples per multisine period
+    return 1/(n*xinc);
+
+#
+# Measures the Vpp of the tones at harmonics 'harm' of 'df' in each row of
+# 'traces' (sampled every 'xinc' seconds). The last whole 'periods' periods of
+# each trace are analysed so every tone falls exactly on an FFT bin. 'df' must
+# make each period a whole number of samples (see binExactStep()); a record
+# which isn't within 'maxPeriodError' periods of whole periods would leak, so
+# it raises ValueError. Returns a 2D numpy array (one row per trace).
+#
+def toneAmplitudes(traces, xinc, df, harm, periods, maxPeriodError=1e-3):
+    ns = int(round(periods/(df*xinc)));
+    if (ns > traces.shape[1]):
+        raise ValueError("Record is shorter than " + str(periods) + " multisine periods");
+    if (abs(ns*xinc*df - periods) > maxPeriodError):
+        raise ValueError("Record of " + str(ns) + " samples is " + str(ns*xinc*df) + " multisine periods, not " + str(periods) + " (tones would leak)");
+    X = np.fft.rfft(traces[:, -ns:], axis=1);
+    return 4*np.abs(X[:, harm*periods])/ns; #Vpp = 2 * (2|X|/N)
+
+#
+# Measures every frequency in 'freqs' at once with a multisine excitation and
+# returns a MultisineResult. 'chans' are the scope channels to read (CH1 must
+# be the input), 'vertScales' is a dict of the V/div for each channel, 'periods'
+# is the no. multisine periods analysed, and 'settlePeriods' the no. periods the
+# DUT is given to reach steady state before the capture.
+#
+def multisineScan(scope, awg, freqs, ampl, chans, vertScales, periods=2, settlePeriods=2, numDivHoriz=12):
+    df, harm = snapToGrid(freqs);
+
+    #Set the record up first: the repetition rate is fitted to its sample interval
+    recordTime = periods/df*1.1;
+    q = CommandQueue();
+    for c in chans:
+        q.write(scope, "CHAN" + str(c) + ":SCAL " + str(vertScales[c]));
+    q.write(scope, "RUN"); #Memory depth can only be changed while running
+    q.write(scope, "ACQ:MDEP " + str(chirpMemDepth(len(chans))));
+    q.write(scope, "TIM:MAIN:SCAL " + str(recordTime/numDivHoriz));
+    q.flush();
+    with instLock(scope):
+        xinc = 1/float(scope.query(":ACQ:SRAT?"));
+    countRoundTrip();
+    df = binExactStep(df, xinc);
+
+    npts = 2**int(np.ceil(np.log2(4*harm.max()))); #At least 4 points per period of the highest tone
+    wave, cf = multisine(harm, npts);
+    print("Multisine: " + str(len(harm)) + " tones, " + "{:.6g}".format(df) + " Hz grid, crest factor " + "{:.2f}".format(cf));
+
+    uploadMultisine(awg, wave, df, ampl);
+
+    try:
+        sleep(settlePeriods/df); #Let the DUT reach steady state
+        with instLock(scope):
+            scope.write(":SING");
+            start = time.time();
+            sleep(recordTime);
+            while (scope.query(":TRIG:STAT?").strip() != "STOP"):
+                countRoundTrip();
+                if (time.time() - start > recordTime*2 + 5):
+                    raise RuntimeError("Multisine capture did not complete");
+                sleep(.05);
+
+            npts = int(float(scope.query(":ACQ:MDEP?")));
+            countRoundTrip();
+
+            traces = [];
+            for c in chans:
+                v, xinc = readRawWaveform(scope, c, npts);
+                traces.append(v);
+    finally:
+        #Return the instruments to stepped-sine operation
+        q = CommandQueue();
+        q.write(awg, "C2:BSWV WVTP,SINE");
+        q.write(scope, "ACQ:MDEP AUTO");
+        q.write(scope, "RUN");
+        q.flush();
+
+    traces = np.vstack(traces);
+    amps = toneAmplitudes(traces, xinc, df, harm, periods);
+
+    tones = {};
+    vpp = {};
+    for i in range(len(chans)):
+        tones[chans[i]] = amps[i];
+        vpp[chans[i]] = float(np.ptp(traces[i]));
+
+    return MultisineResult((harm*df).tolist(), tones, vpp);
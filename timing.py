@@ -0,0 +1,164 @@
+# This file defines the per-point timing breakdown of a scan. Every sample point
+# measured by meas() gets a PointTiming which accumulates the time spent
+# configuring the generator and the scope, waiting for the point to settle,
+# reading the scope (each collect() round trip is kept) and waiting between
+# readings, along with the cause of every retry (including re-reads after a
+# channel was rescaled). A TimingLog collects the points of a scan, prints a
+# summary of where the time went and exports the points to a CSV file (one row
+# per point) or as columns to save with the scan's data, for comparing the
+# scan-speed settings.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from timing import *'.
+#
+# Example Usage:
+#	log = TimingLog();
+#	pt = PointTiming(0, 1e3, 1);
+#	pt.add("awg", 0.01);
+#	ok = pt.read(collect);
+#	if (not ok):
+#		pt.retry("corrupt");
+#	pt.sleep("wait", .1);
+#	log.add(pt.finish("ok"));
+#	print(log.summary());
+#	log.export("timing.csv");
+#
+
+import csv
+import os
+from time import sleep
+import time
+
+#Phases the time of a point is divided into
+timingPhases = ("awg", "scope", "settle", "read", "wait");
+
+#Reasons a reading is retried
+retryCauses = ("corrupt", "frequency", "unsettled", "rescale");
+
+#
+# Timing of one attempt at measuring a sample point
+#
+class PointTiming:
+
+    def __init__(self, index, freq, ampl, sweep="", deferred=False):
+        self.index = index;
+        self.freq = freq;
+        self.ampl = ampl;
+        self.sweep = sweep; #ie. 'crude' or 'fine'
+        self.deferred = deferred;
+        self.start = time.time();
+        self.phases = dict.fromkeys(timingPhases, 0.0); #Phase -> seconds
+        self.reads = []; #Duration of each collect() round trip
+        self.retries = []; #(Time since start, cause) of each retry
+        self.total = None;
+        self.status = None;
+
+    #
+    # Adds 'dt' seconds to 'phase'
+    #
+    def add(self, phase, dt):
+        self.phases[phase] += dt;
+
+    #
+    # Sleeps 'dt' seconds and adds the time to 'phase'
+    #
+    def sleep(self, phase, dt):
+        t = time.time();
+        sleep(dt);
+        self.add(phase, time.time() - t);
+
+    #
+    # Calls 'func' (ie. collect()) and records its duration as a read. Returns
+    # what 'func' returns.
+    #
+    def read(self, func):
+        t = time.time();
+        ret = func();
+        dt = time.time() - t;
+        self.reads.append(dt);
+        self.add("read", dt);
+        return ret;
+
+    #
+    # Records a retry because of 'cause' (see retryCauses)
+    #
+    def retry(self, cause):
+        self.retries.append((time.time() - self.start, cause));
+
+    #
+    # Ends the point with 'status' ('ok', 'rescanned' or 'failed'). Returns self.
+    #
+    def finish(self, status):
+        self.total = time.time() - self.start;
+        self.status = status;
+        return self;
+
+    #
+    # Returns the point as a flat dict (one CSV row)
+    #
+    def record(self):
+        rec = {"sweep": self.sweep, "index": self.index, "freq": self.freq, "ampl": self.ampl, "deferred": self.deferred, "status": self.status, "total": self.total};
+        for p in timingPhases:
+            rec[p] = self.phases[p];
+        rec["other"] = self.total - sum(self.phases.values()); #ie. printing and checks
+        rec["reads"] = len(self.reads);
+        for c in retryCauses:
+            rec["retry_"+c] = sum(1 for r in self.retries if r[1] == c);
+        return rec;
+
+#
+# Per-point timings of a scan
+#
+class TimingLog:
+
+    def __init__(self):
+        self.points = [];
+
+    def add(self, pt):
+        self.points.append(pt);
+
+    #
+    # Returns a printable summary: the total time of each phase (and its share
+    # of the scan), the read statistics and the no. retries of each cause
+    #
+    def summary(self):
+        if (len(self.points) == 0):
+            return "No points timed.";
+        recs = [pt.record() for pt in self.points];
+        total = sum(r["total"] for r in recs);
+        lines = ["Timing of " + str(len(recs)) + " points (" + "{:.3f}".format(total) + " sec):"];
+        for p in timingPhases + ("other",):
+            t = sum(r[p] for r in recs);
+            lines.append("\t" + p.ljust(8) + "{:9.3f}".format(t) + " sec\t" + "{:5.1f}".format(100*t/total if total > 0 else 0) + " %");
+        reads = [dt for pt in self.points for dt in pt.reads];
+        if (len(reads) > 0):
+            lines.append("\tReads: " + str(len(reads)) + " (" + "{:.1f}".format(len(reads)/len(recs)) + " per point, " + "{:.2f}".format(1e3*sum(reads)/len(reads)) + " ms each)");
+        lines.append("\tRetries: " + ", ".join(c + " " + str(sum(r["retry_"+c] for r in recs)) for c in retryCauses));
+        slowest = max(self.points, key=lambda pt: pt.total);
+        lines.append("\tSlowest point: No. " + str(slowest.index) + " (" + str(slowest.freq) + " Hz) " + "{:.3f}".format(slowest.total) + " sec");
+        return "\n".join(lines);
+
+    #
+    # Returns the points as columns: a dict of the fields of record() -> list
+    # with one value per point, in the order measured (numbers as floats)
+    #
+    def columns(self):
+        recs = [pt.record() for pt in self.points];
+        if (len(recs) == 0):
+            return {};
+        return {k: [(r[k] if type(r[k]) in (str, bool) else float(r[k])) for r in recs] for k in recs[0]};
+
+    #
+    # Appends the points to the CSV file 'fn' (writing the column names first
+    # if the file is new)
+    #
+    def export(self, fn):
+        if (len(self.points) == 0):
+            return;
+        recs = [pt.record() for pt in self.points];
+        new = not os.path.exists(fn);
+        with open(fn, 'a', newline='') as fout:
+            w = csv.DictWriter(fout, fieldnames=list(recs[0].keys()));
+            if (new):
+                w.writeheader();
+            w.writerows(recs);
@@ -0,0 +1,221 @@
+# This file defines a recorder which captures every write/query made to the test
+# instruments (with timestamps, durations and replies) in a compact append-only
+# log, and a replay backend which feeds a recorded session back through the
+# same code without any hardware - either at full speed or with the recorded
+# instrument latencies. This lets real production runs be profiled offline,
+# intermittent measurement errors be reproduced, and scan-speed changes be
+# regression tested.
+#
+# Each line of a transcript is a JSON array:
+#	[t, dt, resource, op, data, reply]
+# where 't' is the time (sec) since recording began, 'dt' the time the operation
+# took, 'op' is 'w' (write), 'q' (query), 'R' (read), 'r' (read_raw) or 'W'
+# (write_raw) and binary data/replies are base64 encoded. Each recording session
+# starts with a line holding a JSON object describing it. Recording to an
+# existing file appends a new session, and replay picks one session (the last
+# by default).
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from transcript import *'.
+#
+# Example Usage:
+#	rm = RecordingResourceManager(visa.ResourceManager(), TranscriptLog("run.scpi"));
+#	... (use rm exactly as visa.ResourceManager())
+#	rm = ReplayResourceManager("run.scpi", timed=True); #Later, without the bench
+#	rm = ReplayResourceManager("run.scpi", session=0); #The first session recorded to the file
+#
+
+import base64
+import json
+import threading
+from time import sleep
+import time
+
+#
+# Append-only transcript file. Safe to use from several threads.
+#
+class TranscriptLog:
+
+    def __init__(self, filename):
+        self.filename = filename;
+        self.start = time.time();
+        self.lock = threading.Lock();
+        self.fout = open(filename, 'a');
+        self.fout.write(json.dumps({"transcript": 1, "start": self.start}) + "\n");
+        self.fout.flush();
+
+    #
+    # Appends one operation to the log. 'data' and 'reply' may be str or bytes.
+    #
+    def append(self, t, dt, resource, op, data, reply):
+        if (type(data) == bytes):
+            data = base64.b64encode(data).decode('ascii');
+        if (type(reply) == bytes):
+            reply = base64.b64encode(reply).decode('ascii');
+        line = json.dumps([round(t - self.start, 6), round(dt, 6), resource, op, data, reply], separators=(',', ':'));
+        with self.lock:
+            self.fout.write(line + "\n");
+            self.fout.flush();
+
+    def close(self):
+        with self.lock:
+            self.fout.close();
+
+#
+# Wraps a pyvisa resource and records every operation on it to 'log'
+#
+class RecordingInstrument:
+
+    def __init__(self, inst, log):
+        self.inst = inst;
+        self.log = log;
+
+    def __getattr__(self, attr):
+        return getattr(self.inst, attr);
+
+    def __setattr__(self, attr, value):
+        if (attr in ("inst", "log")):
+            object.__setattr__(self, attr, value);
+        else:
+            setattr(self.inst, attr, value); #ie. timeout
+
+    #
+    # Runs 'func(*args)' and records it as operation 'op' with 'data'
+    #
+    def _record(self, op, data, func, *args):
+        start = time.time();
+        reply = func(*args);
+        self.log.append(start, time.time()-start, self.inst.resource_name, op, data, reply if op in ('q', 'R', 'r') else None);
+        return reply;
+
+    def write(self, cmd):
+        return self._record('w', cmd, self.inst.write, cmd);
+
+    def query(self, cmd):
+        return self._record('q', cmd, self.inst.query, cmd);
+
+    def read(self):
+        return self._record('R', None, self.inst.read);
+
+    def read_raw(self):
+        return self._record('r', None, self.inst.read_raw);
+
+    def write_raw(self, data):
+        return self._record('W', data, self.inst.write_raw, data);
+
+#
+# Wraps a resource manager (ie. visa.ResourceManager()) so every resource it
+# opens is recorded to 'log'
+#
+class RecordingResourceManager:
+
+    def __init__(self, rm, log):
+        self.rm = rm;
+        self.log = log;
+
+    def list_resources(self):
+        return self.rm.list_resources();
+
+    def open_resource(self, addr, **kwargs):
+        return RecordingInstrument(self.rm.open_resource(addr, **kwargs), self.log);
+
+#
+# Raised when the program asks a replayed instrument for something which
+# doesn't match the transcript
+#
+class ReplayError(IOError):
+    pass;
+
+#
+# Replays the operations recorded for one resource
+#
+class ReplayInstrument:
+
+    def __init__(self, resource_name, ops, timed, lookahead, timeout=2000, **kwargs):
+        self.resource_name = resource_name;
+        self.ops = ops; #Recorded operations for this resource (oldest first)
+        self.pos = 0;
+        self.timed = timed;
+        self.lookahead = lookahead;
+        self.timeout = timeout;
+
+    #
+    # Returns the next recorded operation matching 'op' and 'data'. Up to
+    # 'lookahead' unmatched operations are skipped (ie. an '*IDN?' the replaying
+    # program doesn't send). Raises ReplayError if no match is found.
+    #
+    def _next(self, op, data):
+        for i in range(self.pos, min(self.pos + self.lookahead + 1, len(self.ops))):
+            rec = self.ops[i];
+            if (rec[3] == op and (data is None or rec[4] == data)):
+                if (i > self.pos):
+                    print("Replay<" + self.resource_name + "> skipped " + str(i - self.pos) + " recorded operation(s)");
+                self.pos = i+1;
+                if (self.timed):
+                    sleep(rec[1]);
+                return rec;
+        nxt = self.ops[self.pos][3:5] if self.pos < len(self.ops) else "end of transcript";
+        raise ReplayError("Replay<" + self.resource_name + "> expected " + str(nxt) + ", received " + str([op, data]));
+
+    def write(self, cmd):
+        self._next('w', cmd);
+
+    def query(self, cmd):
+        return self._next('q', cmd)[5];
+
+    def read(self):
+        return self._next('R', None)[5];
+
+    def read_raw(self):
+        return base64.b64decode(self._next('r', None)[5]);
+
+    def write_raw(self, data):
+        self._next('W', base64.b64encode(data).decode('ascii'));
+
+    def close(self):
+        pass;
+
+#
+# Stands in for visa.ResourceManager() and serves the resources recorded in
+# session 'session' (an index into the sessions of the file, ie. -1 for the
+# last) of the transcript 'filename'. If 'timed' is True each operation takes
+# as long as it did when recorded, otherwise the session is replayed at full
+# speed. Raises ReplayError if the file doesn't have that session.
+#
+class ReplayResourceManager:
+
+    def __init__(self, filename, timed=False, lookahead=8, session=-1):
+        self.timed = timed;
+        self.lookahead = lookahead;
+        sessions = []; #Per session: resource -> list of operations
+        with open(filename, 'r') as fin:
+            for line in fin:
+                rec = json.loads(line);
+                if (type(rec) == dict): #Header: a new recording session
+                    sessions.append({});
+                elif (type(rec) == list):
+                    if (len(sessions) == 0):
+                        sessions.append({});
+                    sessions[-1].setdefault(rec[2], []).append(rec);
+        self.sessions = len(sessions);
+        try:
+            self.ops = sessions[session]; #Resource -> list of operations
+        except IndexError:
+            raise ReplayError("Transcript '" + filename + "' has " + str(len(sessions)) + " session(s), not session " + str(session));
+
+    def list_resources(self):
+        return tuple(self.ops.keys());
+
+    #
+    # Returns the recorded resource string containing 'key' (ie. 'DS1Z')
+    #
+    def find(self, key):
+        addr = [x for x in self.ops if key in x];
+        if (len(addr) != 1):
+            raise ReplayError("Transcript doesn't contain exactly one '" + key + "' resource");
+        return addr[0];
+
+    def open_resource(self, addr, **kwargs):
+        if (addr not in self.ops):
+            raise ReplayError("Resource '" + addr + "' was not recorded");
+        return ReplayInstrument(addr, self.ops[addr], self.timed, self.lookahead, **kwargs);
@@ -0,0 +1,218 @@
+# This file defines functions to pull raw waveforms from the oscilloscope in
+# binary form and measure them locally with numpy. A single triggered capture
+# gives the frequency, Vpp, Vrms and average of every channel at once, without
+# waiting for the scope's measurement statistics to settle.
+#
+# To import functions from this file, put this file in the same directory as
+# the program you wish to call this from, then put 'from waveform import *'.
+#
+
+from collections import namedtuple
+from time import sleep
+import time
+
+import numpy as np
+
+from scpi import instLock, countRoundTrip, MeasRecord, auxItem
+
+#
+# Measurements of one capture. 'freq' is the frequency of the first channel
+# read (Hz), 'vpp', 'rms' and 'avg' are numpy arrays with one value per channel
+# read (V) and 'clipped' is a numpy array of bools which are True where a
+# channel's trace reached the top or bottom of the screen.
+#
+WaveMeasurement = namedtuple('WaveMeasurement', ['freq', 'vpp', 'rms', 'avg', 'clipped']);
+
+#ADC counts from the centre of the screen (the preamble's YREF) to its top or bottom edge (4 div x 25 counts)
+screenCounts = 100;
+
+#
+# Configures the scope to return screen waveforms as unsigned bytes. Must be
+# called once before readWaveform()/captureChannels().
+#
+def setupWaveformRead(scope):
+    with instLock(scope):
+        scope.write(":WAV:MODE NORM;:WAV:FORM BYTE");
+
+#
+# Decodes a IEEE 488.2 definite length block ('#<n><length><data>') without
+# copying it. Returns a numpy array of uint8 viewing the data in 'raw'.
+#
+def decodeBlock(raw):
+    if (raw[0:1] != b'#'):
+        raise ValueError("Invalid binary block header: " + str(raw[0:12]));
+    nd = int(raw[1:2]);
+    length = int(raw[2:2+nd]);
+    return np.frombuffer(raw, dtype=np.uint8, count=length, offset=2+nd);
+
+#
+# Reads the waveform of channel 'chan' (1-4) currently on the scope's screen.
+# Returns (samples, volts/LSB, offset, time step, screen centre) where the trace
+# in volts is (samples - offset) * volts/LSB and the screen spans the samples
+# within 'screenCounts' of its centre.
+#
+def readWaveform(scope, chan):
+    with instLock(scope):
+        pre = scope.query(":WAV:SOUR CHAN" + str(chan) + ";:WAV:PRE?").strip().split(",");
+        scope.write(":WAV:DATA?");
+        raw = scope.read_raw();
+    countRoundTrip(2);
+
+    #Preamble: format, type, points, count, xinc, xorig, xref, yinc, yorig, yref
+    xinc = float(pre[4]);
+    yinc = float(pre[7]);
+    yoff = float(pre[8]) + float(pre[9]);
+
+    return decodeBlock(raw), yinc, yoff, xinc, float(pre[9]);
+
+#
+# Returns True for each row of the ADC samples 'raw' (one row per channel)
+# which reaches the top or bottom edge of the screen centred on 'centre' (one
+# value per row, or one for all). A trace past the edge is off the screen even
+# if it's still inside the ADC range.
+#
+def offScreen(raw, centre=127):
+    centre = np.reshape(centre, (-1,));
+    return np.logical_or(raw.min(axis=1) <= centre - screenCounts, raw.max(axis=1) >= centre + screenCounts);
+
+#
+# Measures the traces in the 2D array 'volts' (one row per channel) sampled
+# every 'xinc' seconds. 'raw' are the undecoded ADC samples (same shape) used
+# to detect traces which don't fit on the screen centred on 'centre' (see
+# offScreen()). The frequency is measured from the rising crossings of
+# the first row through a band of 'hysteresis' x its Vpp about its mean, so
+# noise on a slow edge isn't counted as extra crossings. Returns a
+# WaveMeasurement.
+#
+def measureWaveforms(volts, xinc, raw=None, hysteresis=.05, centre=127):
+    vmax = volts.max(axis=1);
+    vmin = volts.min(axis=1);
+    avg = volts.mean(axis=1);
+    rms = np.sqrt(np.mean(np.square(volts), axis=1));
+
+    if (raw is not None):
+        clipped = offScreen(raw, centre);
+    else:
+        clipped = np.zeros(volts.shape[0], dtype=bool);
+
+    #Find rising crossings: the trace goes above the band after being below it.
+    #Each is timed where it crosses the top of the band, interpolated between samples.
+    x = volts[0] - avg[0];
+    h = hysteresis*(vmax[0]-vmin[0])/2;
+    state = np.full(len(x), -1); #1 above the band, 0 below it, -1 not yet known
+    state[x > h] = 1;
+    state[x < -h] = 0;
+    state = state[np.maximum.accumulate(np.where(state >= 0, np.arange(len(x)), 0))]; #Inside the band keeps the last state
+    idx = np.nonzero((state[:-1] == 0) & (state[1:] == 1))[0];
+    if (len(idx) < 2):
+        freq = 0.0;
+    else:
+        t = idx + (h - x[idx]) / (x[idx+1] - x[idx]);
+        freq = (len(idx)-1) / ((t[-1] - t[0]) * xinc);
+
+    return WaveMeasurement(freq, vmax-vmin, rms, avg, clipped);
+
+#
+# Reads the screen traces of channels 'chans' (without stopping the scope) and
+# returns, for each channel, whether it reached the top or bottom of the screen
+# (clipped, see offScreen()) and its peak-to-peak span in volts, as two lists.
+#
+def screenTraces(scope, chans):
+    clipped = [];
+    span = [];
+    for c in chans:
+        data, yinc, yoff, xinc, centre = readWaveform(scope, c);
+        clipped.append(bool(offScreen(data[None, :], centre)[0]));
+        span.append((int(data.max()) - int(data.min())) * yinc);
+    return clipped, span;
+
+#
+# Triggers a single capture, waits (up to 'timeout' seconds) for it to complete,
+# and reads and measures channels 'chans' (ie. [1, 2, 3]). The first channel in
+# 'chans' is used to measure the frequency. The scope is returned to RUN mode
+# afterwards. Returns a WaveMeasurement, or raises RuntimeError if the scope
+# doesn't trigger in time.
+#
+def captureChannels(scope, chans, timeout=5):
+    with instLock(scope):
+        scope.write(":SING");
+        countRoundTrip();
+        start = time.time();
+        while (scope.query(":TRIG:STAT?").strip() != "STOP"):
+            countRoundTrip();
+            if (time.time() - start > timeout):
+                scope.write(":RUN");
+                raise RuntimeError("Scope did not trigger within " + str(timeout) + " sec");
+            sleep(.01);
+
+        raw = [];
+        yinc = [];
+        yoff = [];
+        centre = [];
+        for c in chans:
+            data, yi, yo, xinc, yc = readWaveform(scope, c);
+            raw.append(data);
+            yinc.append(yi);
+            yoff.append(yo);
+            centre.append(yc);
+
+        scope.write(":RUN");
+
+    #All channels share the same record length, so measure them together
+    raw = np.vstack(raw);
+    volts = (raw - np.array(yoff)[:, None]) * np.array(yinc)[:, None];
+
+    return measureWaveforms(volts, xinc, raw, centre=np.array(centre));
+
+#
+# Returns the measurement 'name' ('VPP', 'VAVG' or 'VRMS') of row 'k' of the
+# WaveMeasurement 'wm'
+#
+def waveItem(wm, k, name):
+    if (name == "VAVG"):
+        return float(wm.avg[k]);
+    if (name == "VRMS"):
+        return float(wm.rms[k]);
+    return float(wm.vpp[k]);
+
+#
+# Captures CH1, CH2 (and CH3/CH4 if 'ch3'/'ch4' are set) and returns their
+# frequency and Vpp (or the aux. measurement named by 'ch3'/'ch4', see
+# scpi.readMeasurements()) as a MeasRecord.
+#
+def readWaveformMeasurements(scope, ch3=False, ch4=False):
+    chans = [1, 2];
+    if (auxItem(ch3) is not None):
+        chans.append(3);
+    if (auxItem(ch4) is not None):
+        chans.append(4);
+
+    wm = captureChannels(scope, chans);
+
+    c3 = waveItem(wm, 2, auxItem(ch3)) if auxItem(ch3) is not None else 0;
+    c4 = waveItem(wm, len(chans)-1, auxItem(ch4)) if auxItem(ch4) is not None else 0;
+
+    return MeasRecord(float(wm.freq), float(wm.vpp[0]), float(wm.vpp[1]), c3, c4);
+
+#
+# Reads 'npts' points of channel 'chan' from the scope's acquisition memory
+# (the scope must be stopped) in chunks of at most 'chunk' points. Returns the
+# trace in volts and the time step (sec) as (numpy array, xinc).
+#
+def readRawWaveform(scope, chan, npts, chunk=250000):
+    parts = [];
+    with instLock(scope):
+        pre = scope.query(":WAV:SOUR CHAN" + str(chan) + ";:WAV:MODE RAW;:WAV:FORM BYTE;:WAV:PRE?").strip().split(",");
+        countRoundTrip();
+        for first in range(1, npts+1, chunk):
+            last = min(first+chunk-1, npts);
+            scope.write(":WAV:STAR " + str(first) + ";:WAV:STOP " + str(last) + ";:WAV:DATA?");
+            parts.append(decodeBlock(scope.read_raw()));
+            countRoundTrip();
+        scope.write(":WAV:MODE NORM");
+
+    xinc = float(pre[4]);
+    yinc = float(pre[7]);
+    yoff = float(pre[8]) + float(pre[9]);
+
+    return (np.concatenate(parts) - yoff) * yinc, xinc;